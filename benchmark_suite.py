@@ -0,0 +1,193 @@
+'''
+Benchmarks for SMARS Library
+
+Runs the hot paths of the library against the simulated PCA9685 and reports
+the results as JSON, so they can be compared between releases:
+
+    python benchmark_suite.py --output bench.json
+'''
+
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import contextlib
+
+from smars_library.smars_library import Leg, SmarsRobot, set_servo_pulse
+from smars_library.simulator import use_simulator, use_hardware
+
+
+def timed(function, repeat):
+    '''
+    runs function repeat times, returning the best time per call in seconds
+    '''
+    best = None
+    for _ in range(0, 3):
+        start = time.perf_counter()
+        for _ in range(0, repeat):
+            function()
+        elapsed = (time.perf_counter() - start) / repeat
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_import(runs=5):
+    '''
+    time taken to import smars_library.smars_library in a fresh interpreter
+    '''
+    code = ("import time; start = time.perf_counter(); "
+            "import smars_library.smars_library; print(time.perf_counter() - start)")
+    times = []
+    for _ in range(0, runs):
+        output = subprocess.run([sys.executable, "-c", code], check=True,
+                                capture_output=True, text=True).stdout
+        times.append(float(output.split()[-1]))
+    return {'import_seconds': statistics.median(times)}
+
+
+def bench_leg_angle(repeat=20000):
+    '''
+    throughput of the Leg.angle setter
+    '''
+    leg = Leg(channel=0, leg_minangle=0, leg_maxangle=180, invert=False, name="bench")
+    angles = [angle / 2 for angle in range(0, 361)]
+    position = [0]
+
+    def move():
+        leg.angle = angles[position[0] % 361]
+        position[0] += 1
+    return {'leg_angle_per_second': 1 / timed(move, repeat)}
+
+
+def bench_set_servo_pulse(repeat=20000):
+    '''
+    throughput of set_servo_pulse, with every call changing its channel's pulse
+    '''
+    pulses = list(range(4))
+    position = [0]
+
+    def pulse():
+        # each round of the 16 channels sends a different pulse, so no write is skipped
+        set_servo_pulse(position[0] % 16, pulses[(position[0] // 16) % 4])
+        position[0] += 1
+    return {'set_servo_pulse_per_second': 1 / timed(pulse, repeat)}
+
+
+def bench_set_servo_pulse_unchanged(repeat=20000):
+    '''
+    throughput of set_servo_pulse when the pulse hasn't changed, so the
+    write is coalesced away and nothing reaches the bus
+    '''
+    set_servo_pulse(0, 1)
+
+    def pulse():
+        set_servo_pulse(0, 1)
+    return {'set_servo_pulse_unchanged_per_second': 1 / timed(pulse, repeat)}
+
+
+def bench_frames(bus, repeat=5000):
+    '''
+    whole body poses written per second, and bus transactions per pose
+    '''
+    robot = SmarsRobot()
+    robot.default()
+    poses = [{limb['name']: limb['min_angle'] for limb in robot.config},
+             {limb['name']: limb['max_angle'] for limb in robot.config}]
+    position = [0]
+
+    def pose():
+        robot.apply_pose(poses[position[0] % 2])
+        position[0] += 1
+    bus.clear()
+    seconds = timed(pose, repeat)
+    return {'frames_per_second': 1 / seconds,
+            'transactions_per_frame': bus.transactions / (3 * repeat)}
+
+
+def play_without_pauses(robot, action, *args):
+    '''
+    plays an action frame by frame as the robot would, but without sleeping
+    '''
+    steps = robot.steps(action, *args)
+    while True:
+        with robot.frame():
+            try:
+                next(steps)
+            except StopIteration:
+                return
+
+
+def bench_walk(bus, steps=100):
+    '''
+    bus transactions and modelled bus time per walkforward step
+    '''
+    robot = SmarsRobot()
+    play_without_pauses(robot, 'walkforward', 1)
+    bus.clear()
+    saved = robot.writes_saved
+    start = time.perf_counter()
+    play_without_pauses(robot, 'walkforward', steps)
+    elapsed = time.perf_counter() - start
+    return {'walk_transactions_per_step': bus.transactions / steps,
+            'walk_writes_saved_per_step': (robot.writes_saved - saved) / steps,
+            'walk_bus_seconds_per_step': bus.bus_time / steps,
+            'walk_cpu_seconds_per_step': elapsed / steps}
+
+
+def bench_tap_message(message="et"):
+    '''
+    wall time taken to tap out a message in Morse code
+    '''
+    robot = SmarsRobot()
+    start = time.perf_counter()
+    robot.tap_message(message)
+    return {'tap_message': message,
+            'tap_message_seconds': time.perf_counter() - start}
+
+
+def run(quick=False):
+    '''
+    runs all of the benchmarks, returning the results as a dictionary
+    '''
+    scale = 10 if quick else 1
+    results = {'python': platform.python_version(),
+               'platform': platform.platform(),
+               'time': time.time()}
+    results.update(bench_import(runs=1 if quick else 5))
+    bus = use_simulator()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results.update(bench_leg_angle(20000 // scale))
+            results.update(bench_set_servo_pulse(20000 // scale))
+            results.update(bench_set_servo_pulse_unchanged(20000 // scale))
+            results.update(bench_frames(bus, 5000 // scale))
+            results.update(bench_walk(bus, 100 // scale))
+            results.update(bench_tap_message())
+    finally:
+        use_hardware()
+    return results
+
+
+def main(argv=None):
+    '''
+    runs the benchmarks from the command line
+    '''
+    parser = argparse.ArgumentParser(description="SMARS Library benchmarks")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--quick", action="store_true", help="run fewer iterations")
+    args = parser.parse_args(argv)
+
+    results = run(quick=args.quick)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write(text + "\n")
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
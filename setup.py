@@ -31,4 +31,6 @@ setup(
     packages=["smars_library"],
     include_package_data=False,
     install_requires=["adafruit-pca9685","pathlib"],
+    extras_require={"numpy": ["numpy"], "server": ["flask"]},
+    entry_points={"console_scripts": ["smars-server=smars_library.server:main"]},
     )
@@ -2,6 +2,24 @@ name = "smars_library"
 
 __all__ = [
         'smars_library',
-        'channel'
+        'channel',
+        'driver',
+        'pulse',
+        'async_robot',
+        'scheduler',
+        'gait',
+        'trajectory',
+        'simulator',
+        'metrics',
+        'tracing',
+        'journal',
+        'telemetry',
+        'shared_state',
+        'server',
+        'fleet',
+        'tuning',
+        'kinematics',
+        'choreography',
+        'config'
         ]
 
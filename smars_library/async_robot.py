@@ -0,0 +1,159 @@
+""" asyncio interface for the SMARS robot
+
+AsyncSmarsRobot wraps a SmarsRobot and gives awaitable versions of its
+actions. The pauses between moves are awaited rather than slept, so a control
+program can keep servicing sensors and network requests while the robot
+walks, several robots can share one event loop, and an action can be
+cancelled part way through a gait.
+
+    robot = AsyncSmarsRobot()
+    await robot.forward(3)
+    await robot.tap_message("sos")
+"""
+import asyncio
+
+from . import tracing
+from .morse import DEFAULT_WPM
+from .smars_library import SmarsRobot
+
+LOCK_WAIT = 0.01    # seconds between looking to see if another action has finished
+
+
+class AsyncSmarsRobot():
+    """
+    Awaitable versions of the SmarsRobot actions.
+
+    The moves made between each pause are sent to the servo boards as a
+    single frame. Actions started together are played one after the other.
+    Cancelling the task running an action stops the robot after the moves
+    already made; the limbs are left where they are.
+    """
+
+    def __init__(self, robot:SmarsRobot=None):
+        if robot is None:
+            robot = SmarsRobot()
+        self.__robot = robot
+        self.__lock = None      # held while an action plays, so actions take turns
+        self.__lock_loop = None # the event loop the lock was made for
+
+    @property
+    def robot(self)->SmarsRobot:
+        """ Returns the SmarsRobot being controlled """
+        return self.__robot
+
+    async def play(self, action:str, *args, **kwargs):
+        """
+        Performs the action named, awaiting the pauses between its moves.
+
+        Parameters:
+        -----------
+
+        action : str
+            The name of the action, e.g. 'forward', 'clap' or 'tap_message'
+        args
+            The parameters for the action, e.g. the number of steps
+
+        Returns
+        -------
+
+        The result of the action.
+        """
+        async with self._action_lock():
+            # wait for any action played on another thread, such as the robot
+            # tapping its name, to finish before moving the limbs
+            motion_lock = self.__robot._motion_lock  # pylint: disable=protected-access
+            while not motion_lock.acquire(blocking=False):
+                await asyncio.sleep(LOCK_WAIT)
+            try:
+                steps = self.__robot.steps(action, *args, **kwargs)
+                try:
+                    while True:
+                        with self.__robot.frame():
+                            try:
+                                duration = next(steps)
+                            except StopIteration as done:
+                                return done.value
+                        with tracing.span("sleep", 'sleep', seconds=duration):
+                            await asyncio.sleep(duration)
+                finally:
+                    steps.close()
+            finally:
+                motion_lock.release()
+
+    def _action_lock(self)->asyncio.Lock:
+        """
+        Returns the lock actions on this event loop take turns with.
+
+        The motion lock can't do this, as it is held by a thread and all of
+        the coroutines on an event loop run on the same thread.
+        """
+        loop = asyncio.get_running_loop()
+        if self.__lock_loop is not loop:
+            self.__lock = asyncio.Lock()
+            self.__lock_loop = loop
+        return self.__lock
+
+    async def forward(self, steps:int=None):
+        """ Walks forward by the number of steps provided (default 1) """
+        return await self.play('walkforward', steps)
+
+    async def backward(self, steps:int=None):
+        """ Walks backward by the number of steps provided (default 1) """
+        return await self.play('walkbackward', steps)
+
+    async def turnleft(self):
+        """ Turns the robot to the left """
+        return await self.play('turnleft')
+
+    async def turnright(self):
+        """ Turns the robot to the right """
+        return await self.play('turnright')
+
+    async def swing(self):
+        """ Moves all the legs to the swing position """
+        return await self.play('swing')
+
+    async def body(self):
+        """ Moves all the legs to the body position """
+        return await self.play('body')
+
+    async def stretch(self):
+        """ Moves all the legs to the stretch position """
+        return await self.play('stretch')
+
+    async def clap(self, clap_count:int=None):
+        """ Claps the front two legs the number of times provided (default 1) """
+        return await self.play('clap', clap_count)
+
+    async def wiggle(self, wiggle_count:int=None):
+        """ Wiggles the number of times provided (default 1) """
+        return await self.play('wiggle', wiggle_count)
+
+    async def tap_message(self, message:str, wpm:float=DEFAULT_WPM)->bool:
+        """ Taps out the message in Morse code; returns False if it isn't valid Morse """
+        return await self.play('tap_message', message, wpm)
+
+    async def sit(self):
+        """ Sits the robot down """
+        return await self.play('sit')
+
+    async def stand(self):
+        """ Stands the robot up """
+        return await self.play('stand')
+
+    async def default(self):
+        """ Sets all the limbs to the default position """
+        return await self.play('default')
+
+    async def middle(self):
+        """ Moves all the legs to the middle position """
+        return await self.play('middle')
+
+    async def apply_pose(self, pose:dict)->bool:
+        """ Moves a set of limbs to new angles in a single frame """
+        return await self.play('apply_pose', pose)
+
+    async def move_to(self, pose:dict, duration:float=0.5, profile:str='minjerk',
+                      rate:float=50)->bool:
+        """ Moves a set of limbs smoothly to a new pose """
+        return await self.play('move_to', pose, duration, profile, rate)
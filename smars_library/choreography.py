@@ -0,0 +1,211 @@
+""" Choreography validation for the SMARS robot
+
+A compiled choreography - a walking gait, a Morse code schedule or a smooth
+trajectory - is turned into one array of frames, with a column for each limb,
+and checked in a single vectorised pass before anything is sent to the
+servos:
+
+* every angle is inside the limits of its limb
+* no two limbs share a channel on the same board
+* no limb is asked to turn faster than max_slew degrees per second, given
+  the time until it is next moved
+
+so a bad sequence is turned down before the first bus write, rather than
+stopping with the robot half way through a move.
+
+    violations = check(choreography_of(gait, limbs))
+    validate(choreography_of(trajectory))       # raises ChoreographyError
+
+This needs NumPy, which is installed separately (pip install numpy).
+"""
+import collections
+
+import numpy as np
+
+from .gait import Gait
+from .morse import MorseSchedule
+from .trajectory import Trajectory
+from .kinematics import SERVO_SPEED
+
+# the fastest a limb may be asked to turn, in degrees per second. The robot's
+# own moves already ask for more than an unloaded SG90 can do (a foot is
+# lifted 100 degrees with only a 0.05s pause), so this only turns down moves
+# which are far beyond the servo.
+MAX_SLEW = SERVO_SPEED * 4
+
+Violation = collections.namedtuple('Violation', ['frame', 'limb', 'problem'])
+Violation.__doc__ = """
+A problem found in a choreography: the frame it is in (None if it is a
+problem with the limbs themselves), the name of the limb and what is wrong.
+"""
+
+
+class ChoreographyError(ValueError):
+    """ Raised when a choreography fails validation """
+
+    def __init__(self, violations:list):
+        self.violations = violations
+        problems = ["%s: %s" % (violation.limb, violation.problem) for violation in violations[:3]]
+        if len(violations) > 3:
+            problems.append("and %d more" % (len(violations) - 3))
+        super().__init__("the choreography is invalid - " + "; ".join(problems))
+
+
+class Choreography():
+    """
+    A sequence of frames for a set of limbs.
+
+    angles has a row for each frame and a column for each limb, holding the
+    angle the limb is sent in that frame, or NaN if it isn't sent one; delays
+    holds the pause after each frame, and starts the angle each limb starts
+    at (NaN if it isn't known).
+    """
+    __slots__ = ('limbs', 'angles', 'delays', 'starts')
+
+    def __init__(self, limbs:list, angles, delays, starts=None):
+        self.limbs = limbs
+        self.angles = np.asarray(angles, dtype=float)
+        self.delays = np.asarray(delays, dtype=float)
+        if starts is None:
+            starts = np.full(len(limbs), np.nan)
+        self.starts = np.asarray(starts, dtype=float)
+
+    @property
+    def frames(self)->int:
+        """ Returns the number of frames """
+        return len(self.angles)
+
+    @property
+    def duration(self)->float:
+        """ Returns how long the choreography takes, in seconds """
+        return float(self.delays.sum())
+
+
+def choreography_of(compiled, limbs=None, starts=None, steps:int=None)->Choreography:
+    """
+    Returns the frames of a compiled Gait, MorseSchedule or Trajectory as a
+    Choreography.
+
+    A gait needs the limbs it is played on (feet then legs), and is checked
+    for the steps given - by default enough to go round its cycle twice. A
+    Morse schedule needs the limb which taps it. The limbs start at their
+    current angles, unless starts is given.
+    """
+    if isinstance(compiled, Gait):
+        choreography = _from_gait(compiled, limbs, steps)
+    elif isinstance(compiled, MorseSchedule):
+        choreography = _from_schedule(compiled, limbs)
+    elif isinstance(compiled, Trajectory):
+        choreography = Choreography(compiled.limbs, compiled.angles,
+                                    np.full(compiled.samples, compiled.interval))
+    else:
+        raise TypeError("can't validate a " + type(compiled).__name__)
+    if starts is None:
+        # a limb which hasn't been moved within its limits yet is somewhere unknown
+        starts = [limb.angle if limb.leg_minangle <= limb.angle <= limb.leg_maxangle
+                  else np.nan for limb in choreography.limbs]
+    choreography.starts = np.asarray(starts, dtype=float)
+    return choreography
+
+
+def _from_gait(gait:Gait, limbs:list, steps:int=None)->Choreography:
+    """ Returns the frames of a gait played on the limbs provided """
+    if steps is None:
+        steps = gait.cycle_start - 1 + 2 * gait.cycle_length
+    keyframes = np.array([keyframe for segment in gait.segments(steps)
+                          for keyframe in gait.keyframe_range(segment)], dtype=np.intp)
+    write_starts = np.frombuffer(gait.write_starts, dtype=np.uintc).astype(np.intp)
+    counts = write_starts[keyframes + 1] - write_starts[keyframes]
+    frames = np.repeat(np.arange(len(keyframes)), counts)
+    writes = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+              + np.repeat(write_starts[keyframes], counts))
+    angles = np.full((len(keyframes), len(limbs)), np.nan)
+    angles[frames, np.frombuffer(gait.limbs, dtype=np.uint8)[writes]] = \
+        np.frombuffer(gait.angles)[writes]
+    return Choreography(limbs, angles, np.frombuffer(gait.delays)[keyframes])
+
+
+def _from_schedule(schedule:MorseSchedule, limb)->Choreography:
+    """ Returns the frames of a Morse schedule tapped by the limb provided """
+    # a key down lifts the foot up, and a gap puts it down again
+    positions = {True: limb.target('up'), False: limb.target('down')}
+    angles = [[positions[key_down]] for key_down, _ in schedule.events]
+    delays = [duration for _, duration in schedule.events]
+    return Choreography([limb], np.reshape(angles, (-1, 1)), delays)
+
+
+def check(choreography:Choreography, max_slew:float=MAX_SLEW)->list:
+    """
+    Checks every frame of a choreography, returning the Violations found
+    (an empty list if it is fine to play).
+    """
+    limbs = choreography.limbs
+    names = [limb.name for limb in limbs]
+    violations = []
+
+    # no two limbs can be driven by the same channel
+    seen = {}
+    for limb in limbs:
+        key = (limb.busnum, limb.board, limb.channel)
+        if key in seen:
+            violations.append(Violation(None, limb.name, "shares channel %d of board 0x%02x with %s"
+                                        % (limb.channel, limb.board, seen[key])))
+        seen[key] = limb.name
+
+    angles = choreography.angles
+    written = ~np.isnan(angles)
+    with np.errstate(invalid='ignore'):
+        outside = written & ((angles < [limb.leg_minangle for limb in limbs])
+                             | (angles > [limb.leg_maxangle for limb in limbs]))
+    for frame, column in zip(*np.nonzero(outside)):
+        violations.append(Violation(int(frame), names[column], "angle %g is outside %g - %g" % (
+            angles[frame, column], limbs[column].leg_minangle, limbs[column].leg_maxangle)))
+
+    for frame, column, speed in zip(*_too_fast(choreography, written, max_slew)):
+        violations.append(Violation(int(frame), names[column],
+                                    "turns at %.0f degrees/s, faster than %g" % (speed, max_slew)))
+    violations.sort(key=lambda violation: -1 if violation.frame is None else violation.frame)
+    return violations
+
+
+def _too_fast(choreography:Choreography, written, max_slew:float)->tuple:
+    """
+    Returns the frames, limb columns and speeds of the moves which are too
+    fast for the servos.
+
+    A limb has until it is next sent an angle (or the choreography ends) to
+    finish its move; an angle replaced by another in the same instant is
+    never moved to, so it isn't counted.
+    """
+    angles = choreography.angles
+    count = len(angles)
+    times = np.concatenate(([0.0], np.cumsum(choreography.delays)[:-1]))
+    # the time each limb is next sent an angle, after each frame
+    sent = np.where(written, times[:, np.newaxis], np.inf)
+    following = np.minimum.accumulate(sent[::-1], axis=0)[::-1]
+    # a limb moved last has until the end of the choreography, if it pauses at the end
+    end = times[-1] + choreography.delays[-1] if count else 0.0
+    end = end if count and end > times[-1] else np.inf
+    following = np.vstack((following[1:], np.full((1, angles.shape[1]), end)))
+    moves = written & (following > times[:, np.newaxis])
+
+    # the angle each limb is moving from: the last one it moved to
+    frames = np.arange(count)[:, np.newaxis]
+    last = np.maximum.accumulate(np.where(moves, frames, -1), axis=0)
+    last = np.vstack((np.full((1, angles.shape[1]), -1), last[:-1]))
+    columns = np.arange(angles.shape[1])
+    previous = np.where(last >= 0, angles[np.maximum(last, 0), columns], choreography.starts)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        speed = np.abs(angles - previous) / (following - times[:, np.newaxis])
+    too_fast = moves & (speed > max_slew * (1 + 1e-9))
+    frame, column = np.nonzero(too_fast)
+    return frame, column, speed[frame, column]
+
+
+def validate(choreography:Choreography, max_slew:float=MAX_SLEW)->Choreography:
+    """ Returns the choreography if it passes check(), or raises ChoreographyError """
+    violations = check(choreography, max_slew)
+    if violations:
+        raise ChoreographyError(violations)
+    return choreography
@@ -0,0 +1,189 @@
+""" Saving and loading the SMARS robot's configuration
+
+The limb settings - channel, board, bus, invert, angle limits and servo
+calibration - and the gait profile are saved as JSON, so channel remaps,
+inverted feet and calibrations survive a restart:
+
+    robot.save_config("robot.json", compiled=True)
+
+    robot = SmarsRobot.from_config("robot.json")
+
+With compiled=True the tick tables and walking gaits worked out for that
+configuration are saved alongside it, in robot.json.compiled. Loading the
+config reads them straight back in, so the first walk after a cold start
+goes straight to its first frame without compiling anything. The compiled
+file is only used while it matches the config it was saved with; if the
+config is changed it is ignored (and everything is worked out again).
+
+The compiled file is a short JSON header followed by the raw arrays:
+
+    magic (8 bytes) | header length (uint32) | header | arrays
+"""
+import json
+import struct
+import hashlib
+import logging
+from array import array
+
+from .gait import Gait, compile_gait, gait_key, preload_gait, GaitProfile, FORWARD, BACKWARD
+from .pulse import build_tick_table, preload_tick_table, check_calibration, PULSE_MIN, PULSE_MAX
+
+CONFIG_VERSION = 1
+COMPILED_MAGIC = b"SMARSCC1"
+COMPILED_SUFFIX = ".compiled"
+_LENGTH = struct.Struct("<I")
+# the arrays of a Gait which are saved
+_GAIT_ARRAYS = ('delays', 'write_starts', 'limbs', 'pulses', 'angles', 'states', 'segment_starts')
+
+
+def limb_settings(limb)->dict:
+    """ Returns the settings of a limb that are saved """
+    pulse_min, pulse_max, curve = limb.calibration
+    return {'name': limb.name, 'channel': limb.channel, 'board': limb.board,
+            'busnum': limb.busnum, 'invert': limb.invert,
+            'min_angle': limb.leg_minangle, 'max_angle': limb.leg_maxangle,
+            'pulse_min': pulse_min, 'pulse_max': pulse_max,
+            'curve': None if curve is None else [list(point) for point in curve]}
+
+
+def apply_limb_settings(limb, settings:dict):
+    """ Sets a limb up with settings returned by limb_settings() """
+    limb.channel = settings['channel']
+    limb.board = settings['board']
+    limb.busnum = settings['busnum']
+    limb.invert = settings['invert']
+    limb.leg_minangle = settings['min_angle']
+    limb.leg_maxangle = settings['max_angle']
+    # configs saved before limbs were calibrated use the default pulses
+    limb.calibrate(settings.get('pulse_min', PULSE_MIN), settings.get('pulse_max', PULSE_MAX),
+                   settings.get('curve'))
+
+
+def make_config(limbs:list, profile:GaitProfile)->dict:
+    """ Returns the configuration of the limbs provided and the gait profile """
+    return {'version': CONFIG_VERSION,
+            'limbs': [limb_settings(limb) for limb in limbs],
+            'gait_profile': profile.to_dict()}
+
+
+def fingerprint(config:dict)->str:
+    """ Returns a hash of a configuration, which changes if any setting does """
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def save_config(filename:str, config:dict):
+    """ Writes a configuration made by make_config() to a JSON file """
+    with open(filename, "w", encoding="utf-8") as config_file:
+        json.dump(config, config_file, indent=2)
+
+
+def load_config(filename:str)->dict:
+    """ Reads a configuration written by save_config() """
+    with open(filename, encoding="utf-8") as config_file:
+        config = json.load(config_file)
+    if config.get('version') != CONFIG_VERSION:
+        raise ValueError(filename + " isn't a version %d SMARS config" % CONFIG_VERSION)
+    return config
+
+
+def save_compiled(filename:str, config:dict, feet:list, legs:list):
+    """
+    Writes the tick tables and walking gaits for the limbs provided (set up
+    as in the config) to a compiled file.
+    """
+    profile = GaitProfile.from_dict(config['gait_profile'])
+    arrays = []
+    tables = []
+    for limb in feet + legs:
+        calibration = list(limb.calibration)
+        if calibration not in [table[:3] for table in tables]:
+            tables.append(calibration + [len(arrays)])
+            arrays.append(build_tick_table(*calibration))
+    gaits = []
+    for direction in (FORWARD, BACKWARD):
+        gait = compile_gait(direction, feet, legs, profile=profile)
+        fields = {}
+        for field in _GAIT_ARRAYS:
+            fields[field] = len(arrays)
+            arrays.append(getattr(gait, field))
+        gaits.append({'direction': direction, 'pause': gait.pause,
+                      'limb_count': gait.limb_count, 'cycle_start': gait.cycle_start,
+                      'cycle_length': gait.cycle_length, 'arrays': fields})
+
+    offset = 0
+    layout = []
+    for values in arrays:
+        layout.append([values.typecode, offset, len(values)])
+        offset += len(values) * values.itemsize
+    header = json.dumps({'fingerprint': fingerprint(config), 'arrays': layout,
+                         'tables': tables, 'gaits': gaits}).encode('utf-8')
+    with open(filename, "wb") as compiled_file:
+        compiled_file.write(COMPILED_MAGIC + _LENGTH.pack(len(header)) + header)
+        for values in arrays:
+            compiled_file.write(values.tobytes())
+
+
+def read_compiled(filename:str, config:dict)->dict:
+    """
+    Reads a compiled file and adds the tick tables in it, so limbs calibrated
+    afterwards take their tables from it rather than working them out. Call
+    this before the limbs are set up from the config, then preload_gaits().
+
+    Returns what was read, or None (having loaded nothing) if the file is
+    missing or was saved with a different config.
+    """
+    try:
+        with open(filename, "rb") as compiled_file:
+            data = compiled_file.read()
+    except FileNotFoundError:
+        return None
+    start = len(COMPILED_MAGIC) + _LENGTH.size
+    if data[:len(COMPILED_MAGIC)] != COMPILED_MAGIC:
+        raise ValueError(filename + " isn't a compiled SMARS config")
+    length, = _LENGTH.unpack_from(data, len(COMPILED_MAGIC))
+    header = json.loads(data[start:start + length].decode('utf-8'))
+    if header['fingerprint'] != fingerprint(config):
+        logging.info("%s was compiled for a different config, ignoring it", filename)
+        return None
+
+    body = memoryview(data)[start + length:]
+    arrays = []
+    for typecode, offset, count in header['arrays']:
+        values = array(typecode)
+        values.frombytes(body[offset:offset + count * values.itemsize])
+        arrays.append(values)
+    for pulse_min, pulse_max, curve, index in header['tables']:
+        preload_tick_table(arrays[index], pulse_min, pulse_max,
+                           check_calibration(pulse_min, pulse_max, curve))
+    header['arrays'] = arrays
+    return header
+
+
+def preload_gaits(compiled:dict, config:dict, feet:list, legs:list):
+    """
+    Adds the walking gaits read by read_compiled(), for the limbs provided
+    once they are set up as in the config.
+    """
+    arrays = compiled['arrays']
+    profile = GaitProfile.from_dict(config['gait_profile'])
+    for saved in compiled['gaits']:
+        gait = Gait(saved['direction'], saved['pause'], saved['limb_count'])
+        for field in _GAIT_ARRAYS:
+            setattr(gait, field, arrays[saved['arrays'][field]])
+        gait.cycle_start = saved['cycle_start']
+        gait.cycle_length = saved['cycle_length']
+        preload_gait(gait_key(saved['direction'], feet, legs, profile), gait)
+
+
+def load_compiled(filename:str, config:dict, feet:list, legs:list)->bool:
+    """
+    Reads a compiled file back in for limbs already set up as in the config,
+    so the tick tables and gaits in it are used rather than worked out again.
+    Returns False (and loads nothing) if the file is missing or was saved
+    with a different config.
+    """
+    compiled = read_compiled(filename, config)
+    if compiled is None:
+        return False
+    preload_gaits(compiled, config, feet, legs)
+    return True
@@ -0,0 +1,438 @@
+""" PCA9685 servo driver for the SMARS library
+
+There is only ever one ServoDriver per board; use get_driver() with the bus
+number and board address to get the shared handle for a board, so several
+boards (0x40, 0x41, ...) can be used without opening extra connections.
+
+The servo driver is created lazily - nothing touches the I2C bus until the
+first PWM write is made, so importing the library does no I/O at all.
+
+When the first write happens the board is woken up, the PWM frequency is set
+while the oscillator is still asleep, and a single read of the MODE1 register
+confirms the board is ready. This replaces the fixed one second sleeps that
+used to happen when the library was imported.
+
+The board runs with register auto-increment switched on, so a whole pose can
+be written as a frame: all of the channels that change are sent in a single
+block write to the LEDn_ON/OFF registers, and every servo starts moving at
+the same moment.
+
+The driver remembers the last value written to each channel, so writes that
+wouldn't change anything are skipped, and a channel written several times in
+one frame is only sent once. writes_saved counts the writes avoided.
+"""
+import time
+import logging
+import threading
+import contextlib
+
+from . import tracing
+from .metrics import BusMetrics
+
+# PCA9685 registers
+MODE1 = 0x00
+MODE2 = 0x01
+LED0_ON_L = 0x06
+ALL_LED_ON_L = 0xFA
+PRESCALE = 0xFE
+
+# MODE1 / MODE2 bits
+RESTART = 0x80
+SLEEP = 0x10
+AI = 0x20
+ALLCALL = 0x01
+OUTDRV = 0x04
+
+PCA9685_ADDRESS = 0x40    # the default address of the PCA9685 board
+PCA9685_ADDRESS_MAX = 0x7F  # the highest address a PCA9685 can be set to
+DEFAULT_BUSNUM = 1        # the I2C bus used by the Raspberry Pi
+SERVO_FREQ = 60           # 60hz, good for servos
+OSCILLATOR_SETTLE = 0.0005  # the oscillator takes up to 500us to start
+CHANNELS = 16             # the number of PWM channels on each board
+BLOCK_CHANNELS = 8        # SMBus block writes are limited to 32 bytes (8 channels)
+
+
+def prescale_for(freq_hz:int)->int:
+    """ Returns the PRESCALE register value for the PWM frequency provided """
+    return int((25000000.0 / 4096.0 / float(freq_hz)) - 1.0 + 0.5)
+
+
+class ServoDriver():
+    """
+    A lazily initialised PCA9685 servo driver.
+
+    Creating a ServoDriver does not touch the I2C bus; the board is only set
+    up when the first PWM value is written to it. If the board can't be found
+    the failure is logged once and all further writes are skipped.
+    """
+
+    def __init__(self, busnum:int=DEFAULT_BUSNUM, address:int=PCA9685_ADDRESS,
+                 freq:int=SERVO_FREQ, i2c=None):
+        self.__busnum = busnum
+        self.__address = address
+        self.__freq = freq
+        self.__i2c = i2c
+        self.__device = None
+        self.__failed = False
+        self.__ready_time = None
+        self.__lock = threading.RLock()
+        self.__frame_depth = 0
+        self.__pending = {}
+        self.__shadow = [None] * CHANNELS
+        self.__transactions = 0
+        self.__writes_saved = 0
+        self.metrics = None     # a BusMetrics while metrics are enabled
+
+    @property
+    def busnum(self)->int:
+        """ Returns the I2C bus number the board is on """
+        return self.__busnum
+
+    @property
+    def address(self)->int:
+        """ Returns the I2C address of the board """
+        return self.__address
+
+    @property
+    def freq(self)->int:
+        """ Returns the PWM frequency the board is set to """
+        return self.__freq
+
+    @property
+    def connected(self)->bool:
+        """ Returns True if the board has been initialised """
+        return self.__device is not None
+
+    @property
+    def available(self)->bool:
+        """ Returns False if the board failed to initialise """
+        return not self.__failed
+
+    @property
+    def ready_time(self):
+        """ Returns how long (in seconds) the board took to become ready """
+        return self.__ready_time
+
+    @property
+    def transactions(self)->int:
+        """ Returns the number of PWM write transactions sent to the board """
+        return self.__transactions
+
+    @property
+    def writes_saved(self)->int:
+        """ Returns the number of channel writes skipped because nothing changed """
+        return self.__writes_saved
+
+    def enable_metrics(self, enabled:bool=True):
+        """ Starts (or stops) recording BusMetrics for the board """
+        if not enabled:
+            self.metrics = None
+        elif self.metrics is None:
+            self.metrics = BusMetrics(CHANNELS)
+
+    def invalidate(self):
+        """
+        Forgets the values last written to the channels, so the next write to
+        each channel is sent even if it hasn't changed.
+        """
+        with self.__lock:
+            self.__shadow = [None] * CHANNELS
+
+    def connect(self)->bool:
+        """
+        Initialises the board, if it hasn't been already.
+
+        Returns True if the board is ready to use, False if it could not be
+        initialised.
+        """
+        if self.__device is not None:
+            return True
+        if self.__failed:
+            return False
+
+        try:
+            i2c = self.__i2c
+            if i2c is None:
+                import Adafruit_GPIO.I2C as i2c
+            device = i2c.get_i2c_device(self.__address, busnum=self.__busnum)
+            self.__ready_time = self._wake(device)
+        except (OSError, RuntimeError, ImportError) as error:
+            logging.error("failed to initialise the servo driver (PCA9685 %#x on bus %s): %s",
+                          self.__address, self.__busnum, error)
+            if self.metrics is not None:
+                self.metrics.errors += 1
+            self.__failed = True
+            return False
+
+        logging.info("PCA9685 %#x ready in %.6f s", self.__address, self.__ready_time)
+        self.__device = device
+        return True
+
+    def _wake(self, device)->float:
+        """
+        Sets up the board and wakes it up; returns the time it took.
+
+        The prescaler can only be written while the oscillator is asleep, so
+        the frequency is set before waking rather than afterwards.
+        """
+        start = time.perf_counter()
+        device.write8(MODE1, SLEEP | AI | ALLCALL)
+        device.writeList(ALL_LED_ON_L, [0, 0, 0, 0])
+        device.write8(MODE2, OUTDRV)
+        device.write8(PRESCALE, prescale_for(self.__freq))
+        woke = time.perf_counter()
+        device.write8(MODE1, AI | ALLCALL)
+
+        # wait out whatever is left of the oscillator start up time, then
+        # check once that the board really is awake
+        remaining = OSCILLATOR_SETTLE - (time.perf_counter() - woke)
+        if remaining > 0:
+            time.sleep(remaining)
+        if device.readU8(MODE1) & SLEEP:
+            raise RuntimeError("PCA9685 did not wake up")
+        return time.perf_counter() - start
+
+    def set_pwm_freq(self, freq_hz:int):
+        """ Sets the PWM frequency; applied when the board is next initialised """
+        if self.__device is None:
+            self.__freq = freq_hz
+            return
+        self.__freq = freq_hz
+        mode1 = self.__device.readU8(MODE1)
+        self.__device.write8(MODE1, (mode1 & ~RESTART) | SLEEP)
+        self.__device.write8(PRESCALE, prescale_for(freq_hz))
+        self.__device.write8(MODE1, mode1 & ~SLEEP)
+
+    def set_pwm(self, channel:int, on:int, off:int)->bool:
+        """
+        Sets a single PWM channel, initialising the board first if needed.
+
+        If a frame is open the value is held back and sent with the rest of
+        the frame. Returns False if the board is not available.
+        """
+        with self.__lock:
+            if self.__frame_depth:
+                if channel in self.__pending:
+                    self.__writes_saved += 1
+                self.__pending[channel] = (on, off)
+                return self.available
+            return self.write_frame({channel: (on, off)})
+
+    def begin_frame(self):
+        """
+        Starts holding back PWM writes until end_frame() is called.
+
+        Frames can be nested; the writes are sent when the outermost frame
+        ends. Other threads can't write to the board while a frame is open.
+        """
+        self.__lock.acquire()
+        self.__frame_depth += 1
+
+    def end_frame(self):
+        """ Ends a frame started with begin_frame(), sending the held back writes """
+        try:
+            self.__frame_depth -= 1
+            if not self.__frame_depth:
+                self.flush()
+        finally:
+            self.__lock.release()
+
+    @contextlib.contextmanager
+    def frame(self):
+        """ Context manager which sends all of the writes made inside it as one frame """
+        self.begin_frame()
+        try:
+            yield self
+        finally:
+            self.end_frame()
+
+    @contextlib.contextmanager
+    def suspend_frame(self):
+        """
+        Context manager which sends the writes held back by the calling
+        thread's open frame, and lets other threads use the board until it
+        ends, when the frame is opened again. Used to pause between moves.
+        """
+        with self.__lock:
+            depth = self.__frame_depth
+            if depth:
+                self.flush()
+                self.__frame_depth = 0
+        # the frame's hold on the lock is let go of while suspended
+        for _ in range(depth):
+            self.__lock.release()
+        try:
+            yield self
+        finally:
+            for _ in range(depth):
+                self.__lock.acquire()
+            self.__frame_depth = depth
+
+    def flush(self)->bool:
+        """ Sends the writes held back by the open frame now, without ending the frame """
+        with self.__lock:
+            if not self.__pending:
+                return self.available
+            pending = self.__pending
+            self.__pending = {}
+            try:
+                return self.write_frame(pending)
+            except (RuntimeError, OSError) as error:
+                logging.warning("Failed to send the frame to the PCA9685 %#x - \
+                did the servo driver initialize correctly? %s", self.__address, error)
+                return False
+
+    def write_frame(self, values:dict)->bool:
+        """
+        Writes a frame of {channel: (on, off)} values to the board.
+
+        Channels already set to the value are skipped. Runs of nearby
+        channels are sent as one auto-increment block write; small gaps are
+        bridged with the values last written to the channels in between.
+        Returns False if the board is not available.
+        """
+        with self.__lock:
+            metrics = self.metrics
+            tracer = tracing.active()
+            if self.__device is None and not self.connect():
+                if metrics is not None:
+                    metrics.dropped += len(values)
+                return False
+            shadow = self.__shadow
+            changed = {channel: value for channel, value in values.items()
+                       if shadow[channel] != value}
+            self.__writes_saved += len(values) - len(changed)
+            values = changed
+            for start, end in self._runs(values):
+                data = []
+                for channel in range(start, end + 1):
+                    on, off = values[channel] if channel in values else shadow[channel]
+                    data += (on & 0xFF, on >> 8, off & 0xFF, off >> 8)
+                if metrics is None and tracer is None:
+                    self.__device.writeList(LED0_ON_L + 4 * start, data)
+                else:
+                    self._timed_write(metrics, tracer, LED0_ON_L + 4 * start, data)
+                self.__transactions += 1
+            for channel, value in values.items():
+                shadow[channel] = value
+                if metrics is not None:
+                    metrics.channel_writes[channel] += 1
+            if values:
+                for listener in _FRAME_LISTENERS:
+                    listener(self.__busnum, self.__address, values)
+            return True
+
+    def _timed_write(self, metrics:BusMetrics, tracer, register:int, data:list):
+        """
+        Sends a block write, recording how long it took and whether it failed
+        in the metrics and the trace (either may be None).
+        """
+        start = time.perf_counter()
+        try:
+            self.__device.writeList(register, data)
+        except (OSError, RuntimeError):
+            if metrics is not None:
+                metrics.errors += 1
+            raise
+        finally:
+            end = time.perf_counter()
+            if tracer is not None:
+                tracer.add("write %#x" % self.__address, 'bus', start, end,
+                           {'channel': (register - LED0_ON_L) // 4, 'bytes': len(data)})
+        if metrics is not None:
+            metrics.latency.add(end - start)
+
+    def _runs(self, values:dict):
+        """ Groups the channels of a frame into (start, end) runs of block writes """
+        runs = []
+        start = end = None
+        for channel in sorted(values):
+            if start is not None and channel - start < BLOCK_CHANNELS and \
+                    all(self.__shadow[gap] is not None for gap in range(end + 1, channel)):
+                end = channel
+                continue
+            if start is not None:
+                runs.append((start, end))
+            start = end = channel
+        if start is not None:
+            runs.append((start, end))
+        return runs
+
+
+# one shared driver per (bus, address)
+_DRIVERS = {}
+_DRIVERS_LOCK = threading.Lock()
+
+# the I2C interface new shared drivers use, None for Adafruit_GPIO.I2C
+_I2C = None
+
+# called with (busnum, address, values) for every frame sent to a board
+_FRAME_LISTENERS = ()
+
+
+def get_driver(busnum:int=DEFAULT_BUSNUM, address:int=PCA9685_ADDRESS)->ServoDriver:
+    """
+    Returns the shared driver for the board at the address on the bus provided.
+
+    The driver is created the first time a board is asked for; every later
+    call for the same (bus, address) gets the same driver back.
+    """
+    driver = _DRIVERS.get((busnum, address))
+    if driver is None:
+        with _DRIVERS_LOCK:
+            driver = _DRIVERS.get((busnum, address))
+            if driver is None:
+                driver = ServoDriver(busnum=busnum, address=address, i2c=_I2C)
+                _DRIVERS[(busnum, address)] = driver
+    return driver
+
+
+def register_driver(driver:ServoDriver)->ServoDriver:
+    """
+    Makes the driver provided the shared driver for its (bus, address).
+
+    Useful for supplying a driver with a custom I2C interface.
+    """
+    with _DRIVERS_LOCK:
+        _DRIVERS[(driver.busnum, driver.address)] = driver
+    return driver
+
+
+def set_i2c(i2c):
+    """
+    Sets the I2C interface used by the shared drivers created from now on.
+
+    The interface needs a get_i2c_device(address, busnum=...) function, like
+    the Adafruit_GPIO.I2C module; None goes back to using Adafruit_GPIO.I2C.
+    """
+    global _I2C  # pylint: disable=global-statement
+    _I2C = i2c
+
+
+def add_frame_listener(listener):
+    """
+    Calls listener(busnum, address, values) with the {channel: (on, off)}
+    values of every frame sent to any board, after it has been sent.
+
+    Listeners are called with the driver's lock held, so they should be quick.
+    """
+    global _FRAME_LISTENERS  # pylint: disable=global-statement
+    _FRAME_LISTENERS = _FRAME_LISTENERS + (listener,)
+
+
+def remove_frame_listener(listener):
+    """ Stops calling a listener added with add_frame_listener() """
+    global _FRAME_LISTENERS  # pylint: disable=global-statement
+    _FRAME_LISTENERS = tuple(item for item in _FRAME_LISTENERS if item != listener)
+
+
+def drivers()->list:
+    """ Returns all of the drivers that have been created so far """
+    with _DRIVERS_LOCK:
+        return list(_DRIVERS.values())
+
+
+def reset_drivers():
+    """ Forgets all of the shared drivers """
+    with _DRIVERS_LOCK:
+        _DRIVERS.clear()
@@ -0,0 +1,116 @@
+""" Fleet controller for several SMARS robots
+
+A Fleet drives a group of robots, each on its own servo board, from one
+process. Group actions are run on every robot at once from a thread pool;
+the robots wait for each other at a barrier before starting, so they move
+together, and the time each robot took is reported and kept in per-robot
+latency histograms.
+
+    fleet = Fleet(addresses=[0x40, 0x41, 0x42])
+    results = fleet.run('walkforward', 3)
+    print(fleet.stats())
+"""
+import time
+import threading
+import collections
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .driver import DEFAULT_BUSNUM, PCA9685_ADDRESS
+from .metrics import Histogram
+from .smars_library import SmarsRobot
+
+FleetResult = collections.namedtuple('FleetResult', ['robot', 'result', 'seconds', 'error'])
+FleetResult.__doc__ = """
+The outcome of a group action on one robot: the robot's number in the fleet,
+the result of the action (or None), how many seconds it took from the
+synchronised start, and the exception it raised (or None).
+"""
+
+
+class Fleet():
+    """
+    Runs actions on a group of robots in parallel.
+
+    Either pass the robots to control, or the board addresses (and bus) to
+    create a SmarsRobot for each.
+    """
+
+    def __init__(self, robots:list=None, addresses:list=None, busnum:int=DEFAULT_BUSNUM):
+        if robots is None:
+            addresses = [PCA9685_ADDRESS] if addresses is None else addresses
+            robots = [SmarsRobot(busnum=busnum, address=address) for address in addresses]
+        if not robots:
+            raise ValueError("a fleet needs at least one robot")
+        self.__robots = list(robots)
+        self.__latency = [Histogram() for _ in self.__robots]
+        self.__lock = threading.Lock()
+        self.__pool = ThreadPoolExecutor(max_workers=len(self.__robots),
+                                         thread_name_prefix="smars-fleet")
+
+    @property
+    def robots(self)->list:
+        """ Returns the robots in the fleet """
+        return list(self.__robots)
+
+    def __len__(self):
+        return len(self.__robots)
+
+    def __getitem__(self, index:int)->SmarsRobot:
+        return self.__robots[index]
+
+    def run(self, action:str, *args, **kwargs)->list:
+        """
+        Runs an action on every robot at the same time, waiting for them all
+        to finish.
+
+        Returns a FleetResult for each robot, in fleet order. A robot whose
+        action fails doesn't stop the others; its exception is in the result.
+        """
+        return [future.result() for future in self.submit(action, *args, **kwargs)]
+
+    def submit(self, action:str, *args, **kwargs)->list:
+        """
+        Starts an action on every robot at the same time, returning a Future
+        for each robot's FleetResult straight away.
+        """
+        methods = [getattr(robot, action) for robot in self.__robots]
+        barrier = threading.Barrier(len(methods))
+        return [self.__pool.submit(self._run_one, number, barrier, method, args, kwargs)
+                for number, method in enumerate(methods)]
+
+    def _run_one(self, number:int, barrier:threading.Barrier, method,
+                 args:tuple, kwargs:dict)->FleetResult:
+        """ Runs the action on one robot, once all of the robots are ready """
+        barrier.wait()
+        start = time.perf_counter()
+        result = error = None
+        try:
+            result = method(*args, **kwargs)
+            if isinstance(result, Future):
+                # the robot has a motion scheduler running
+                result = result.result()
+        except Exception as exception:  # pylint: disable=broad-except
+            error = exception
+        seconds = time.perf_counter() - start
+        with self.__lock:
+            self.__latency[number].add(seconds)
+        return FleetResult(number, result, seconds, error)
+
+    def stats(self)->list:
+        """
+        Returns the latency of each robot's actions: the count, mean and max
+        seconds, and a histogram in microseconds (see metrics.Histogram).
+        """
+        with self.__lock:
+            return [dict(histogram.snapshot(), address=robot.config[0]['board'])
+                    for robot, histogram in zip(self.__robots, self.__latency)]
+
+    def close(self):
+        """ Waits for running actions to finish and shuts down the thread pool """
+        self.__pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
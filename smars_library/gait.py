@@ -0,0 +1,320 @@
+""" Gait compiler for the SMARS robot
+
+Walking forward or backward follows the same pattern every time for a given
+limb configuration, so rather than working the gait out on every step it is
+compiled once into a keyframe table: for each keyframe, the limbs to move,
+the pulses to send them, and the time to pause afterwards.
+
+The walk is simulated on copies of the limbs until their positions repeat;
+after that the steps just cycle round, so a walk of any length can be played
+from the same table. Tables are cached per (direction, configuration), so a
+long walk costs only array indexing and bus writes.
+
+The timing of a walk - how far the legs turn on each tick, the pauses
+between the phases of moving a leg, and the order the legs move in - is set
+by a GaitProfile, which can be saved to and loaded from a JSON file (see
+tuning.py for finding a good one).
+"""
+import json
+import functools
+import collections
+from array import array
+
+from . import tracing
+from .channel import Channel
+
+FORWARD = 'forward'
+BACKWARD = 'backward'
+
+# the number of values kept for each limb's state: (angle, current angle)
+STATE_SIZE = 2
+
+TICK_INCREMENT = 2          # degrees a leg turns on each tick
+LEG_ORDER = (0, 1, 2, 3)    # the order the legs take their turn in a step
+
+_PRELOADED = {}     # gaits compiled earlier, by gait_key()
+
+
+class GaitProfile(collections.namedtuple('GaitProfile', ['increment', 'down_pause',
+                                                         'swing_pause', 'up_pause',
+                                                         'tick_pause', 'order'])):
+    """
+    The settings for a walking gait.
+
+    * increment - degrees each leg turns on a tick
+    * down_pause - seconds to wait after lifting a foot off the ground
+    * swing_pause - seconds to wait after swinging the leg back
+    * up_pause - seconds to wait after putting the foot back down
+    * tick_pause - seconds to wait after each step's ticks (0 for none)
+    * order - the order the four legs take their turn, by Channel number
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_pause(cls, pause:float, increment:int=TICK_INCREMENT):
+        """ Returns the profile which pauses for the same time between every phase """
+        return cls(increment, pause, pause, pause, 0.0, LEG_ORDER)
+
+    def to_dict(self)->dict:
+        """ Returns the profile as a dictionary """
+        return dict(self._asdict(), order=list(self.order))
+
+    @classmethod
+    def from_dict(cls, values:dict):
+        """ Returns the profile from a dictionary made by to_dict() """
+        profile = cls(**values)
+        if sorted(profile.order) != list(LEG_ORDER):
+            raise ValueError("order must have each leg (0 - 3) once")
+        if profile.increment <= 0:
+            raise ValueError("increment must be greater than 0")
+        return profile._replace(order=tuple(profile.order))
+
+    def save(self, filename:str):
+        """ Writes the profile to a JSON file """
+        with open(filename, "w", encoding="utf-8") as profile_file:
+            json.dump(self.to_dict(), profile_file, indent=2)
+
+    @classmethod
+    def load(cls, filename:str):
+        """ Reads a profile written by save() """
+        with open(filename, encoding="utf-8") as profile_file:
+            return cls.from_dict(json.load(profile_file))
+
+
+class Gait():
+    """
+    A compiled gait - a table of keyframes for the limbs of a robot.
+
+    The limbs are numbered in the order of the robot's config: the four feet
+    followed by the four legs. Segment 0 sets the limbs up ready to walk, and
+    each segment after that is one step.
+    """
+    __slots__ = ('direction', 'pause', 'limb_count', 'delays', 'write_starts',
+                 'limbs', 'pulses', 'angles', 'states', 'segment_starts',
+                 'cycle_start', 'cycle_length')
+
+    def __init__(self, direction:str, pause:float, limb_count:int):
+        self.direction = direction
+        self.pause = pause
+        self.limb_count = limb_count
+        self.delays = array('d')          # pause after each keyframe
+        self.write_starts = array('I', [0])  # first write of each keyframe
+        self.limbs = array('B')           # limb number for each write
+        self.pulses = array('H')          # pulse for each write
+        self.angles = array('d')          # angle for each write
+        self.states = array('d')          # limb states after each keyframe
+        self.segment_starts = array('I', [0])  # first keyframe of each segment
+        self.cycle_start = 1
+        self.cycle_length = 0
+
+    @property
+    def keyframes(self)->int:
+        """ Returns the number of keyframes in the table """
+        return len(self.delays)
+
+    def segments(self, steps:int):
+        """ Yields the segments to play for a walk of the number of steps provided """
+        yield 0
+        for step in range(steps):
+            segment = step + 1
+            if segment >= self.cycle_start:
+                segment = self.cycle_start + (segment - self.cycle_start) % self.cycle_length
+            yield segment
+
+    def keyframe_range(self, segment:int)->range:
+        """ Returns the keyframes that make up a segment """
+        return range(self.segment_starts[segment], self.segment_starts[segment + 1])
+
+    def play(self, limbs:list, steps:int):
+        """
+        Plays the gait on the limbs provided, yielding the pauses between moves.
+
+        When the generator finishes (or is closed part way through) the limbs
+        are left in the same state as if they had walked step by step.
+        """
+        sends = [limb.send for limb in limbs]
+        last = None
+        try:
+            for step, segment in enumerate(self.segments(steps)):
+                with tracing.span("step %d" % step, 'step', segment=segment):
+                    for keyframe in self.keyframe_range(segment):
+                        for write in range(self.write_starts[keyframe],
+                                           self.write_starts[keyframe + 1]):
+                            sends[self.limbs[write]](self.pulses[write], self.angles[write])
+                        last = keyframe
+                        delay = self.delays[keyframe]
+                        if delay:
+                            yield delay
+        finally:
+            if last is not None:
+                offset = last * self.limb_count * STATE_SIZE
+                for index, limb in enumerate(limbs):
+                    start = offset + index * STATE_SIZE
+                    limb.restore(*self.states[start:start + STATE_SIZE])
+
+
+class _Recorder():
+    """ Records the writes made to the limbs during a simulated walk """
+
+    def __init__(self, gait:Gait, limbs:list):
+        self.__gait = gait
+        self.__limbs = limbs
+        for index, limb in enumerate(limbs):
+            limb.send = functools.partial(self.write, index)
+
+    def write(self, index:int, pulse:int):
+        """ Records a write to the limb numbered """
+        gait = self.__gait
+        gait.limbs.append(index)
+        gait.pulses.append(pulse)
+        gait.angles.append(self.__limbs[index].angle)
+
+    def pause(self, delay:float):
+        """ Ends the current keyframe, with the pause provided """
+        gait = self.__gait
+        gait.delays.append(delay)
+        gait.write_starts.append(len(gait.pulses))
+        for limb in self.__limbs:
+            gait.states.extend(limb.state())
+
+    def end_segment(self):
+        """ Ends the current segment """
+        gait = self.__gait
+        if len(gait.pulses) > gait.write_starts[-1]:
+            self.pause(0.0)
+        gait.segment_starts.append(len(gait.delays))
+
+
+def limb_key(limb)->tuple:
+    """ Returns the settings of a limb that a compiled gait depends on """
+    return (limb.name, limb.channel, limb.leg_minangle, limb.leg_maxangle,
+            limb.invert, limb.board, limb.busnum, limb.calibration)
+
+
+def compile_gait(direction:str, feet:list, legs:list, pause:float=None,
+                 profile:GaitProfile=None)->Gait:
+    """
+    Returns the compiled gait for walking in the direction provided, with
+    the timing from the profile, or the same pause between every phase if
+    no profile is given.
+
+    Gaits are cached, so compiling the same direction and configuration again
+    costs nothing.
+    """
+    if direction not in (FORWARD, BACKWARD):
+        raise ValueError("Unknown direction: " + str(direction))
+    if profile is None:
+        profile = GaitProfile.from_pause(pause)
+    key = gait_key(direction, feet, legs, profile)
+    gait = _PRELOADED.get(key)
+    return _compile(*key) if gait is None else gait
+
+
+def gait_key(direction:str, feet:list, legs:list, profile:GaitProfile)->tuple:
+    """ Returns the settings a compiled gait depends on """
+    return (direction, tuple(limb_key(limb) for limb in feet),
+            tuple(limb_key(limb) for limb in legs), profile)
+
+
+def preload_gait(key:tuple, gait:Gait):
+    """
+    Adds a gait compiled earlier (for example, read from a compiled config)
+    for the settings returned by gait_key(), so compile_gait() returns it
+    rather than compiling it again.
+    """
+    _PRELOADED[key] = gait
+
+
+@functools.lru_cache(maxsize=32)
+def _compile(direction:str, feet:tuple, legs:tuple, profile:GaitProfile)->Gait:
+    """ Compiles a gait by simulating the walk on new limbs """
+    from .smars_library import Leg
+    feet = [Leg(*key) for key in feet]
+    legs = [Leg(*key) for key in legs]
+    gait = Gait(direction, profile.down_pause, len(feet) + len(legs))
+    recorder = _Recorder(gait, feet + legs)
+
+    # set the legs to the correct position for walking.
+    for limb in feet:
+        limb.down()
+    legs[Channel.LEFT_LEG_FRONT].body()
+    legs[Channel.LEFT_LEG_BACK].body()
+    legs[Channel.RIGHT_LEG_FRONT].swing()
+    legs[Channel.RIGHT_LEG_BACK].swing()
+    for limb in feet:
+        limb.up()
+    recorder.end_segment()
+
+    # walk until the legs get back to a position they have been in before
+    seen = {}
+    step = _forward_step if direction == FORWARD else _backward_step
+    while True:
+        state = tuple(limb.state() for limb in legs)
+        if state in seen:
+            break
+        seen[state] = len(gait.segment_starts) - 1
+        step(feet, legs, recorder, profile.down_pause, profile)
+        recorder.end_segment()
+    gait.cycle_start = seen[state]
+    gait.cycle_length = len(gait.segment_starts) - 1 - gait.cycle_start
+    return gait
+
+
+def _forward_step(feet:list, legs:list, recorder:_Recorder, pause:float,
+                  profile:GaitProfile=None):
+    """ One step of the forward walking cycle """
+    if profile is None:
+        profile = GaitProfile.from_pause(pause)
+    for tick_count in profile.order:
+        leg = legs[tick_count]
+        if not leg.tick(profile.increment):
+            leg.tick(profile.increment)
+        else:
+            feet[tick_count].down()
+            recorder.pause(profile.down_pause)
+
+            if not leg.invert:
+                if leg.name == "RIGHT_LEG_FRONT":
+                    leg.stretch()
+                else:
+                    leg.body()
+            else:
+                if leg.name == "RIGHT_LEG_BACK":
+                    leg.body()
+                else:
+                    leg.stretch()
+            recorder.pause(profile.swing_pause)
+            feet[tick_count].up()
+            recorder.pause(profile.up_pause)
+    if profile.tick_pause:
+        recorder.pause(profile.tick_pause)
+
+
+def _backward_step(feet:list, legs:list, recorder:_Recorder, pause:float,
+                   profile:GaitProfile=None):
+    """ One step of the backward walking cycle """
+    if profile is None:
+        profile = GaitProfile.from_pause(pause)
+    for tick_count in profile.order:
+        leg = legs[tick_count]
+        if not leg.untick(profile.increment):
+            leg.untick(profile.increment)
+        else:
+            feet[tick_count].down()
+            recorder.pause(profile.down_pause)
+
+            if not leg.invert:
+                if leg.name == "LEFT_LEG_BACK":
+                    leg.stretch()
+                else:
+                    leg.body()
+            else:
+                if leg.name == "LEFT_LEG_FRONT":
+                    leg.body()
+                else:
+                    leg.stretch()
+            recorder.pause(profile.swing_pause)
+            feet[tick_count].up()
+            recorder.pause(profile.up_pause)
+    if profile.tick_pause:
+        recorder.pause(profile.tick_pause)
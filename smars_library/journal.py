@@ -0,0 +1,198 @@
+""" Motion journal for the SMARS library
+
+A journal records everything the robot does to an append-only binary file:
+every frame sent to a servo board, and every command (action) the robot
+performs. It can be read back later to find out what the robot was doing
+before a fault, or replayed onto a robot (or the simulator) to reproduce it.
+
+    with Journal("robot.journal"):
+        robot.walkforward(20)
+
+    replay("robot.journal")                 # at the original speed
+    replay("robot.journal", realtime=False) # as fast as possible
+
+The file is a short header followed by fixed size records, so it can be
+read through a memory map without parsing, and a record cut short by a
+crash is simply ignored.
+"""
+import os
+import mmap
+import time
+import struct
+import threading
+import collections
+
+from .driver import get_driver, add_frame_listener, remove_frame_listener, CHANNELS
+
+MAGIC = b"SMARSJ01"
+HEADER = struct.Struct("<8sH")          # magic, record size
+# time, kind, busnum, address, pad, channel mask, payload
+RECORD = struct.Struct("<dBBBxH64s")
+PULSES = struct.Struct("<%dH" % (2 * CHANNELS))   # (on, off) for each channel
+
+FRAME = 1
+COMMAND = 2
+
+_JOURNAL = None     # the Journal being recorded to, if any
+
+Record = collections.namedtuple('Record', ['time', 'kind', 'busnum', 'address', 'values',
+                                           'command'])
+Record.__doc__ = """
+A journal record. Frames have the busnum and address of the board and values,
+a {channel: (on, off)} dictionary; commands have the command text.
+"""
+
+
+class Journal():
+    """
+    Records frames and commands to an append-only journal file.
+
+    Records are written straight through to the operating system (flush=True)
+    so they survive the program crashing; they are appended to the file if it
+    already exists.
+    """
+
+    def __init__(self, filename:str, flush:bool=True):
+        self.__filename = filename
+        self.__flush = flush
+        self.__file = None
+        self.__lock = threading.Lock()
+        self.__previous = None
+
+    @property
+    def filename(self)->str:
+        """ Returns the name of the journal file """
+        return self.__filename
+
+    @property
+    def recording(self)->bool:
+        """ Returns True if the journal is being recorded to """
+        return self.__file is not None
+
+    def start(self):
+        """ Opens the journal file and starts recording everything the robot does """
+        global _JOURNAL  # pylint: disable=global-statement
+        with self.__lock:
+            if self.__file is not None:
+                return
+            journal_file = open(self.__filename, "ab")  # pylint: disable=consider-using-with
+            if journal_file.tell() == 0:
+                journal_file.write(HEADER.pack(MAGIC, RECORD.size))
+            self.__file = journal_file
+        self.__previous, _JOURNAL = _JOURNAL, self
+        add_frame_listener(self.frame)
+
+    def stop(self):
+        """ Stops recording and closes the journal file """
+        global _JOURNAL  # pylint: disable=global-statement
+        remove_frame_listener(self.frame)
+        if _JOURNAL is self:
+            _JOURNAL = self.__previous
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def frame(self, busnum:int, address:int, values:dict):
+        """ Records a frame of {channel: (on, off)} values sent to a board """
+        mask = 0
+        pulses = [0] * (2 * CHANNELS)
+        for channel, (on, off) in values.items():
+            mask |= 1 << channel
+            pulses[2 * channel] = on
+            pulses[2 * channel + 1] = off
+        self._write(FRAME, busnum, address, mask, PULSES.pack(*pulses))
+
+    def command(self, command:str, args:tuple=()):
+        """ Records a command; the text is cut short if it doesn't fit a record """
+        text = command + (" " + repr(args) if args else "")
+        self._write(COMMAND, 0, 0, 0, text.encode("utf-8")[:64])
+
+    def _write(self, kind:int, busnum:int, address:int, mask:int, payload:bytes):
+        record = RECORD.pack(time.time(), kind, busnum, address, mask, payload)
+        with self.__lock:
+            if self.__file is None:
+                return
+            self.__file.write(record)
+            if self.__flush:
+                self.__file.flush()
+
+
+def active()->Journal:
+    """ Returns the Journal being recorded to, or None if there isn't one """
+    return _JOURNAL
+
+
+def read(filename:str):
+    """ Yields the records in a journal file, oldest first """
+    with open(filename, "rb") as journal_file:
+        if os.fstat(journal_file.fileno()).st_size < HEADER.size:
+            return
+        with mmap.mmap(journal_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, size = HEADER.unpack_from(data, 0)
+            if magic != MAGIC or size != RECORD.size:
+                raise ValueError(filename + " is not a SMARS journal")
+            for offset in range(HEADER.size, len(data) - size + 1, size):
+                yield _unpack(data, offset)
+
+
+def _unpack(data, offset:int)->Record:
+    """ Unpacks the record at offset """
+    when, kind, busnum, address, mask, payload = RECORD.unpack_from(data, offset)
+    if kind == FRAME:
+        pulses = PULSES.unpack(payload)
+        values = {channel: (pulses[2 * channel], pulses[2 * channel + 1])
+                  for channel in range(CHANNELS) if mask & (1 << channel)}
+        return Record(when, kind, busnum, address, values, None)
+    command = payload.rstrip(b"\0").decode("utf-8", errors="replace")
+    return Record(when, kind, busnum, address, None, command)
+
+
+def replay(filename:str, realtime:bool=True, speed:float=1.0, on_command=None)->int:
+    """
+    Replays the frames in a journal onto the servo boards.
+
+    The frames are sent to the boards through get_driver(), so use
+    simulator.use_simulator() first to replay onto the simulated PCA9685.
+
+    Parameters:
+    -----------
+
+    filename : str
+        The journal file
+    realtime : bool
+        True to replay with the original timing, False to go as fast as possible
+    speed : float
+        How much faster than the original to replay, when realtime is True
+    on_command : callable
+        Called with each command Record as it is reached, if given
+
+    Returns
+    -------
+
+    int
+        The number of frames replayed.
+    """
+    frames = 0
+    first = None
+    start = time.perf_counter()
+    for record in read(filename):
+        if realtime:
+            if first is None:
+                first = record.time
+            delay = (record.time - first) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        if record.kind == FRAME:
+            get_driver(record.busnum, record.address).write_frame(record.values)
+            frames += 1
+        elif on_command is not None:
+            on_command(record)
+    return frames
@@ -0,0 +1,157 @@
+""" Forward kinematics for the SMARS robot
+
+Maps the angles of the limbs to where the feet are, in body coordinates: x
+forward, y to the left and z up, in mm from the centre of the body at ground
+level. Each corner of the robot has a leg servo, which turns the leg about
+its hip in the horizontal plane, and a foot servo, which lifts the foot up
+and out from under the leg.
+
+Everything works on NumPy arrays of angles, with a column for each limb (in
+the order the limbs were given, normally the robot's config order) and any
+number of leading dimensions, so a whole trajectory - or thousands of
+candidate poses - is worked out in one call:
+
+    kinematics = robot.kinematics
+    angles = kinematics.angles_of(robot.pose)
+    feet = kinematics.feet(angles)              # (4, 3): x, y, z of each foot
+    margin = kinematics.support_margin(angles)  # > 0 while the robot is stable
+
+This needs NumPy, which is installed separately (pip install numpy).
+"""
+import collections
+
+import numpy as np
+
+# the four corners of the robot, in the order of Channel's legs
+CORNERS = (('LEFT', 'FRONT'), ('LEFT', 'BACK'), ('RIGHT', 'FRONT'), ('RIGHT', 'BACK'))
+
+Geometry = collections.namedtuple('Geometry', ['body_length', 'body_width',
+                                               'leg_length', 'foot_length'])
+Geometry.__doc__ = """
+The size of the robot in mm: the distance between the front and back hips,
+between the left and right hips, from a hip to the top of its foot, and the
+length of a foot.
+"""
+DEFAULT_GEOMETRY = Geometry(60.0, 40.0, 30.0, 25.0)
+SERVO_SPEED = 600.0     # degrees per second (an SG90 turns 60 degrees in 0.1s)
+
+# the ordered pairs of corners which could be an edge of the outline of the
+# feet, and the other two corners for each
+_EDGES = tuple(np.array(column) for column in zip(*[
+    (start, end, [other for other in range(4) if other not in (start, end)])
+    for start in range(4) for end in range(4) if start != end]))
+
+
+class Kinematics():
+    """
+    The forward kinematics of a robot with the limbs provided: four feet and
+    four legs, one of each at every corner, as Leg objects.
+    """
+
+    def __init__(self, limbs:list, geometry:Geometry=DEFAULT_GEOMETRY):
+        self.__geometry = geometry
+        self.__names = [limb.name for limb in limbs]
+        legs = []
+        feet = []
+        for side, end in CORNERS:
+            legs.append(self.__column(limbs, side + '_LEG_' + end))
+            feet.append(self.__column(limbs, side + '_FOOT_' + end))
+        self.__legs = np.array(legs)
+        self.__feet = np.array(feet)
+        self.__up = np.array([limbs[foot].target('up') for foot in feet], dtype=float)
+        self.__down = np.array([limbs[foot].target('down') for foot in feet], dtype=float)
+        self.__left = np.array([side == 'LEFT' for side, _ in CORNERS])
+        self.__hips = np.array([[geometry.body_length / 2 * (1 if end == 'FRONT' else -1),
+                                 geometry.body_width / 2 * (1 if side == 'LEFT' else -1)]
+                                for side, end in CORNERS])
+
+    @staticmethod
+    def __column(limbs:list, name:str)->int:
+        """ Returns the column of the limb named """
+        for column, limb in enumerate(limbs):
+            if limb.name == name:
+                return column
+        raise ValueError("there is no " + name + " limb")
+
+    @property
+    def geometry(self)->Geometry:
+        """ Returns the size of the robot """
+        return self.__geometry
+
+    def angles_of(self, pose:dict):
+        """ Returns a pose ({limb name: angle}) as an array of angles """
+        return np.array([pose[name] for name in self.__names], dtype=float)
+
+    def lift(self, angles):
+        """
+        Returns how far each foot is turned from standing on the ground, in
+        radians, as an array of shape (..., 4).
+        """
+        feet = np.asarray(angles, dtype=float)[..., self.__feet]
+        return np.radians(np.clip(np.abs(feet - self.__up), 0.0, 90.0))
+
+    def on_ground(self, angles):
+        """
+        Returns whether each foot is on the ground - nearer its up angle than
+        its down one - as a boolean array of shape (..., 4).
+        """
+        feet = np.asarray(angles, dtype=float)[..., self.__feet]
+        return np.abs(feet - self.__up) < np.abs(feet - self.__down)
+
+    def feet(self, angles):
+        """
+        Returns where the feet are for the angles provided, an array of shape
+        (..., 4, 3) holding the x, y and z of the foot at each corner.
+        """
+        angles = np.asarray(angles, dtype=float)
+        geometry = self.__geometry
+        legs = angles[..., self.__legs]
+        heading = np.radians(np.where(self.__left, 90.0 - legs, legs - 90.0))
+        lift = self.lift(angles)
+        reach = geometry.leg_length + geometry.foot_length * np.sin(lift)
+        feet = np.empty(legs.shape + (3,))
+        feet[..., 0] = self.__hips[:, 0] + reach * np.sin(heading)
+        feet[..., 1] = self.__hips[:, 1] + np.where(self.__left, reach, -reach) * np.cos(heading)
+        feet[..., 2] = geometry.foot_length * (1.0 - np.cos(lift))
+        return feet
+
+    def support_margin(self, angles, centre=(0.0, 0.0)):
+        """
+        Returns how far inside the outline of the feet on the ground the
+        centre of the robot is, in mm, as an array of shape (...). It is
+        negative if the centre is outside (the robot is tipping over), and
+        -inf when fewer than three feet are on the ground.
+        """
+        points = self.feet(angles)[..., :2] - np.asarray(centre, dtype=float)
+        grounded = self.on_ground(angles)
+        # every edge (i, j) between two feet, and where the other two feet are from it
+        start, end, others = _EDGES
+        edges = points[..., end, :] - points[..., start, :]
+        offsets = points[..., others, :] - points[..., start, np.newaxis, :]
+        sides = (edges[..., np.newaxis, 0] * offsets[..., 1]
+                 - edges[..., np.newaxis, 1] * offsets[..., 0])
+        # an edge is on the outline if every other foot on the ground is to its left
+        outline = np.all((sides >= -1e-9) | ~grounded[..., others], axis=-1)
+        outline &= grounded[..., start] & grounded[..., end]
+        # the distance of the centre to the left of each edge
+        length = np.hypot(edges[..., 0], edges[..., 1])
+        distance = (edges[..., 1] * points[..., start, 0]
+                    - edges[..., 0] * points[..., start, 1]) / np.where(length > 0, length, np.inf)
+        margin = np.min(np.where(outline, distance, np.inf), axis=-1)
+        return np.where(grounded.sum(axis=-1) >= 3, margin, -np.inf)
+
+    def body_motion(self, angles):
+        """
+        Returns how far the body moves forward (mm) between each pose of a
+        trajectory of shape (n, ..., limbs), an array of shape (n - 1, ...).
+
+        The feet on the ground stay where they are, so when their legs turn
+        the body moves the opposite way, by the average distance they moved.
+        """
+        angles = np.asarray(angles, dtype=float)
+        along = self.feet(angles)[..., 0]
+        grounded = self.on_ground(angles)
+        standing = grounded[1:] & grounded[:-1]
+        moved = np.where(standing, along[1:] - along[:-1], 0.0).sum(axis=-1)
+        count = standing.sum(axis=-1)
+        return np.where(count > 0, -moved / np.maximum(count, 1), 0.0)
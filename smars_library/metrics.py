@@ -0,0 +1,85 @@
+""" Performance metrics for the SMARS library
+
+Metrics are switched off by default and cost next to nothing until they are
+enabled with SmarsRobot.enable_stats(). Once enabled they record:
+
+* how long each robot action took (ActionMetrics)
+* for each servo board, how many writes went to each channel, how long each
+  bus transaction took, and how many writes failed (BusMetrics)
+
+Timings are kept in histograms with power of two buckets (1us, 2us, 4us...)
+so recording them is cheap and the memory used doesn't grow.
+"""
+import threading
+
+BUCKETS = 32     # bucket n holds times up to 2**n microseconds
+
+
+class Histogram():
+    """ A histogram of durations, with power of two microsecond buckets """
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds:float):
+        """ Adds a duration (in seconds) to the histogram """
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        bucket = int(seconds * 1000000).bit_length()
+        self.buckets[min(bucket, BUCKETS - 1)] += 1
+
+    def snapshot(self)->dict:
+        """
+        Returns the histogram as a dictionary; buckets maps the upper limit of
+        each bucket (in microseconds) to the number of durations in it.
+        """
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else 0.0,
+                'max': self.max,
+                'buckets': {2 ** bucket: count for bucket, count in enumerate(self.buckets)
+                            if count}}
+
+
+class BusMetrics():
+    """ Metrics for the writes made to one servo board """
+
+    def __init__(self, channels:int=16):
+        self.channel_writes = [0] * channels
+        self.latency = Histogram()
+        self.errors = 0
+        self.dropped = 0
+
+    def snapshot(self)->dict:
+        """ Returns the metrics as a dictionary """
+        return {'channel_writes': list(self.channel_writes),
+                'latency': self.latency.snapshot(),
+                'errors': self.errors,
+                'dropped': self.dropped}
+
+
+class ActionMetrics():
+    """ Metrics for the actions performed by a robot """
+
+    def __init__(self):
+        self.actions = {}
+        self.__lock = threading.Lock()
+
+    def add(self, action:str, seconds:float):
+        """ Records how long an action took """
+        with self.__lock:
+            histogram = self.actions.get(action)
+            if histogram is None:
+                histogram = self.actions[action] = Histogram()
+            histogram.add(seconds)
+
+    def snapshot(self)->dict:
+        """ Returns the metrics for each action as a dictionary """
+        with self.__lock:
+            return {action: histogram.snapshot() for action, histogram in self.actions.items()}
@@ -2,6 +2,8 @@
 # Morse Code - foot tapper
 # June 2021
 
+import functools
+
 class Morse():
     alphabet = {
     "a": ".-",
@@ -40,4 +42,86 @@ class Morse():
     "8": "---..",
     "9": "----.",
     "0": "-----",
+    ".": ".-.-.-",
+    ",": "--..--",
+    "?": "..--..",
+    "'": ".----.",
+    "!": "-.-.--",
+    "/": "-..-.",
+    "(": "-.--.",
+    ")": "-.--.-",
+    "&": ".-...",
+    ":": "---...",
+    ";": "-.-.-.",
+    "=": "-...-",
+    "+": ".-.-.",
+    "-": "-....-",
+    "_": "..--.-",
+    "\"": ".-..-.",
+    "$": "...-..-",
+    "@": ".--.-.",
 }
+
+
+DEFAULT_WPM = 7     # words per minute; a dot is 1.2 / wpm seconds
+
+# ITU timings, in dots
+DOT = 1
+DASH = 3
+SYMBOL_GAP = 1      # between the dots and dashes of a character
+CHARACTER_GAP = 3   # between characters
+WORD_GAP = 7        # between words
+
+
+class MorseSchedule():
+    """
+    A message compiled into Morse code: a list of (key down, duration) events.
+
+    Each event says whether the key is down (a dot or dash is being sent) or
+    up (a gap), and for how many seconds.
+    """
+    __slots__ = ('message', 'code', 'wpm', 'events', 'duration')
+
+    def __init__(self, message:str, code:str, wpm:float, events:tuple):
+        self.message = message
+        self.code = code
+        self.wpm = wpm
+        self.events = events
+        self.duration = sum(duration for _, duration in events)
+
+
+@functools.lru_cache(maxsize=128)
+def compile_message(message:str, wpm:float=DEFAULT_WPM)->MorseSchedule:
+    """
+    Compiles a message into a MorseSchedule, using the ITU timings for the
+    speed given in words per minute.
+
+    Messages are cached, so sending the same message again costs nothing to
+    encode. Raises ValueError if the message has a character which isn't
+    part of Morse code.
+    """
+    if wpm <= 0:
+        raise ValueError("wpm must be greater than 0")
+    unit = 1.2 / wpm
+    words = message.lower().split()
+    for character in "".join(words):
+        if character not in Morse.alphabet:
+            raise ValueError("the character " + character + " isn't part of Morse Code")
+
+    events = []
+    for word_number, word in enumerate(words):
+        if word_number:
+            events.append((False, WORD_GAP * unit))
+        for character_number, character in enumerate(word):
+            if character_number:
+                events.append((False, CHARACTER_GAP * unit))
+            for symbol_number, symbol in enumerate(Morse.alphabet[character]):
+                if symbol_number:
+                    events.append((False, SYMBOL_GAP * unit))
+                events.append((True, (DOT if symbol == "." else DASH) * unit))
+    if events:
+        # let the key come back up before finishing
+        events.append((False, SYMBOL_GAP * unit))
+    code = " / ".join(" ".join(Morse.alphabet[character] for character in word)
+                      for word in words)
+    return MorseSchedule(message, code, wpm, tuple(events))
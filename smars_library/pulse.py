@@ -0,0 +1,144 @@
+""" Angle to pulse conversion for the SMARS library
+
+Each limb maps an angle (0 - 180 degrees) onto a PCA9685 tick count between
+its minimum and maximum pulse. Rather than working this out on every move, the
+mapping is built once into a compact table with an entry every half degree,
+and moving a limb is then just a lookup.
+
+Servos differ, so each limb can be calibrated with the pulses measured for its
+own 0 and 180 degree positions, and optionally a correction curve: the pulses
+measured for angles in between, as (angle, pulse) points. The mapping follows
+straight lines between the points, and is built into the limb's table, so a
+calibrated limb costs no more to move than any other.
+
+angles_to_ticks() converts whole trajectories of angles in one go using NumPy,
+which needs to be installed separately (pip install numpy).
+"""
+from array import array
+
+from .driver import SERVO_FREQ
+
+PULSE_MIN = 150       # the default tick count for 0 degrees
+PULSE_MAX = 600       # the default tick count for 180 degrees
+PULSE_LIMIT = 4095    # the largest tick count the PCA9685 takes
+ANGLE_MAX = 180
+TABLE_STEPS = 2       # table entries per degree
+
+# 1,000,000 us per second, at 60 Hz, with 12 bits of resolution
+US_PER_BIT = 1000000 // SERVO_FREQ // 4096
+
+_TABLES = {}    # the tick tables built so far, by (pulse min, pulse max, curve)
+
+
+def angle_to_tick(angle:float, pulse_min:int=PULSE_MIN, pulse_max:int=PULSE_MAX)->int:
+    """ Works out the tick count for an angle by mapping 0 - 180 onto the pulse range """
+    mapmax = pulse_max - pulse_min
+    percentage = (float(angle) / ANGLE_MAX) * 100
+    return int(((float(mapmax) / 100) * float(percentage)) + pulse_min)
+
+
+def curve_to_tick(angle:float, points:tuple)->int:
+    """ Works out the tick count for an angle by following the (angle, pulse) points """
+    for (low_angle, low_pulse), (high_angle, high_pulse) in zip(points, points[1:]):
+        if angle <= high_angle:
+            break
+    fraction = (float(angle) - low_angle) / (high_angle - low_angle)
+    return int(low_pulse + (high_pulse - low_pulse) * fraction)
+
+
+def check_calibration(pulse_min:int, pulse_max:int, curve:tuple=None)->tuple:
+    """
+    Checks a calibration, returning the curve as a tuple of (angle, pulse)
+    points (or None); raises ValueError if it can't be used.
+    """
+    for pulse in (pulse_min, pulse_max):
+        if not isinstance(pulse, int) or not 0 <= pulse <= PULSE_LIMIT:
+            raise ValueError("pulses must be whole numbers between 0 and %d" % PULSE_LIMIT)
+    if not curve:
+        return None
+    curve = tuple((float(angle), int(pulse)) for angle, pulse in curve)
+    angles = [angle for angle, _ in curve]
+    if angles != sorted(set(angles)) or angles[0] <= 0 or angles[-1] >= ANGLE_MAX:
+        raise ValueError("curve angles must go up, between 0 and %d (not including them)"
+                         % ANGLE_MAX)
+    if any(not 0 <= pulse <= PULSE_LIMIT for _, pulse in curve):
+        raise ValueError("pulses must be whole numbers between 0 and %d" % PULSE_LIMIT)
+    return curve
+
+
+def build_tick_table(pulse_min:int=PULSE_MIN, pulse_max:int=PULSE_MAX, curve:tuple=None)->array:
+    """
+    Returns a table of tick counts, one entry every 1/TABLE_STEPS degrees,
+    for the pulse range and correction curve (see check_calibration()).
+
+    Tables are shared between limbs with the same calibration, so they must
+    not be changed.
+    """
+    key = (pulse_min, pulse_max, curve)
+    table = _TABLES.get(key)
+    if table is None:
+        angles = [index / TABLE_STEPS for index in range(ANGLE_MAX * TABLE_STEPS + 1)]
+        if curve is None:
+            table = array('H', (angle_to_tick(angle, pulse_min, pulse_max) for angle in angles))
+        else:
+            points = ((0.0, pulse_min),) + curve + ((float(ANGLE_MAX), pulse_max),)
+            table = array('H', (curve_to_tick(angle, points) for angle in angles))
+        _TABLES[key] = table
+    return table
+
+
+def preload_tick_table(table:array, pulse_min:int=PULSE_MIN, pulse_max:int=PULSE_MAX,
+                       curve:tuple=None):
+    """
+    Adds a table built earlier (for example, read from a compiled config) so
+    build_tick_table() returns it rather than working it out again.
+    """
+    if len(table) != ANGLE_MAX * TABLE_STEPS + 1:
+        raise ValueError("a tick table needs %d entries" % (ANGLE_MAX * TABLE_STEPS + 1))
+    _TABLES.setdefault((pulse_min, pulse_max, curve), table)
+
+
+def lookup_tick(table:array, angle:float)->int:
+    """
+    Returns the tick count for an angle from a table built by build_tick_table().
+
+    Angles that fall between two entries are interpolated.
+    """
+    position = angle * TABLE_STEPS
+    index = int(position)
+    if index == position:
+        return table[index]
+    low = table[index]
+    return int(low + (table[index + 1] - low) * (position - index))
+
+
+def angles_to_ticks(table:array, angles):
+    """
+    Converts an array of angles (of any shape) into an array of tick counts.
+
+    This is the vectorised version of lookup_tick(), for turning whole
+    trajectories into pulses in one call. Angles are clipped to 0 - 180.
+    """
+    import numpy as np
+    positions = np.clip(np.asarray(angles, dtype=float), 0, ANGLE_MAX) * TABLE_STEPS
+    ticks = np.frombuffer(table, dtype=np.uint16)
+    return np.interp(positions, np.arange(len(ticks)), ticks).astype(np.uint16)
+
+
+def limb_angles_to_ticks(tables:list, angles):
+    """
+    Converts a trajectory of angles for several limbs into tick counts.
+
+    angles is an array of shape (samples, limbs) and tables holds the table
+    for each limb (column) in turn; each column is converted with its own
+    table, in one vectorised pass.
+    """
+    import numpy as np
+    ticks = np.stack([np.frombuffer(table, dtype=np.uint16) for table in tables])
+    positions = np.clip(np.asarray(angles, dtype=float), 0, ANGLE_MAX) * TABLE_STEPS
+    low = np.minimum(positions.astype(np.intp), len(ticks[0]) - 2)
+    fraction = positions - low
+    columns = np.arange(len(tables))
+    start = ticks[columns, low].astype(float)
+    step = ticks[columns, low + 1] - start
+    return (start + step * fraction).astype(np.uint16)
@@ -0,0 +1,201 @@
+""" Fixed rate motion scheduler for the SMARS robot
+
+The MotionScheduler runs a control loop on its own thread, ticking at a fixed
+rate (100 times a second by default). Actions are queued onto it and played
+one after another; on each tick the moves that are due are sent to the servo
+boards as a single frame, and the loop then sleeps until the next tick's
+deadline. Because the deadlines are fixed the timing doesn't drift with I2C
+latency or Python overhead, and stats() reports how late the ticks were.
+
+    robot.start_scheduler(rate=100)
+    robot.forward(3)        # returns straight away
+    robot.clap().result()   # wait for the clap to finish
+"""
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+DEFAULT_RATE = 100        # ticks per second
+DEFAULT_QUEUE_SIZE = 32   # the number of actions which can be waiting
+
+
+class MotionScheduler():
+    """
+    Plays queued robot actions from a fixed rate control loop thread.
+    """
+
+    def __init__(self, robot, rate:float=DEFAULT_RATE, queue_size:int=DEFAULT_QUEUE_SIZE):
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        self.__robot = robot
+        self.__rate = rate
+        self.__period = 1.0 / rate
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__thread = None
+        self.__running = threading.Event()
+        self.__playing = False  # True while the loop holds the robot's motion lock
+        self.reset_stats()
+
+    @property
+    def rate(self)->float:
+        """ Returns the number of ticks per second """
+        return self.__rate
+
+    @property
+    def running(self)->bool:
+        """ Returns True if the control loop is running """
+        return self.__running.is_set()
+
+    def start(self):
+        """ Starts the control loop thread """
+        if self.running:
+            return
+        self.__running.set()
+        self.__thread = threading.Thread(target=self._loop, name="smars-scheduler", daemon=True)
+        self.__thread.start()
+
+    def stop(self, wait:bool=True):
+        """
+        Stops the control loop, once the queued actions have been played if
+        wait is True; otherwise the actions still queued are cancelled.
+        """
+        if not self.running:
+            return
+        if wait:
+            self.__queue.join()
+        self.__running.clear()
+        self.__thread.join()
+        self.__thread = None
+        while True:
+            try:
+                _, future, _ = self.__queue.get_nowait()
+            except queue.Empty:
+                break
+            future.cancel()
+            self.__queue.task_done()
+
+    def submit(self, action:str, *args, block:bool=True, **kwargs)->Future:
+        """
+        Queues an action to be played by the control loop.
+
+        Returns a Future which holds the result of the action once it has
+        been played. If the queue is full this waits for space, or raises
+        queue.Full if block is False.
+        """
+        steps = self.__robot.steps(action, *args, **kwargs)
+        future = Future()
+        self.__queue.put((steps, future, time.perf_counter()), block=block)
+        return future
+
+    @property
+    def pending(self)->int:
+        """ Returns the number of actions waiting to be played """
+        return self.__queue.qsize()
+
+    def reset_stats(self):
+        """ Resets the timing statistics """
+        self.__ticks = 0
+        self.__overruns = 0
+        self.__jitter_total = 0.0
+        self.__jitter_max = 0.0
+        self.__commands = 0
+        self.__latency_total = 0.0
+        self.__latency_max = 0.0
+
+    def stats(self)->dict:
+        """
+        Returns the timing statistics of the control loop.
+
+        * ticks - the number of ticks run
+        * overruns - the number of ticks which took longer than the period
+        * jitter_mean / jitter_max - how late (in seconds) ticks started
+        * commands - the number of actions started
+        * latency_mean / latency_max - how long (in seconds) actions waited
+          in the queue before starting
+        """
+        ticks = max(self.__ticks, 1)
+        commands = max(self.__commands, 1)
+        return {'rate': self.__rate,
+                'ticks': self.__ticks,
+                'overruns': self.__overruns,
+                'jitter_mean': self.__jitter_total / ticks,
+                'jitter_max': self.__jitter_max,
+                'commands': self.__commands,
+                'latency_mean': self.__latency_total / commands,
+                'latency_max': self.__latency_max,
+                'pending': self.pending}
+
+    def _loop(self):
+        """ The control loop """
+        current = None
+        resume_at = 0.0
+        deadline = time.perf_counter()
+        while self.__running.is_set():
+            tick = deadline
+            with self.__robot.frame():
+                while True:
+                    if current is None:
+                        try:
+                            current = self.__queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if not current[1].set_running_or_notify_cancel():
+                            self.__queue.task_done()
+                            current = None
+                            continue
+                        latency = tick - current[2]
+                        self.__commands += 1
+                        self.__latency_total += max(latency, 0.0)
+                        self.__latency_max = max(self.__latency_max, latency)
+                        resume_at = tick
+                    if resume_at > tick:
+                        break
+                    if not self.__playing:
+                        # wait for an action played outside the scheduler, such as
+                        # the robot tapping its name, before moving the limbs
+                        motion_lock = self.__robot._motion_lock  # pylint: disable=protected-access
+                        if not motion_lock.acquire(blocking=False):
+                            break
+                        self.__playing = True
+                    steps, future, _ = current
+                    try:
+                        resume_at = tick + next(steps)
+                    except StopIteration as done:
+                        future.set_result(done.value)
+                        self._finish()
+                        current = None
+                    except Exception as error:  # pylint: disable=broad-except
+                        logging.warning("action failed in the motion scheduler: %s", error)
+                        future.set_exception(error)
+                        self._finish()
+                        current = None
+
+            # sleep until the next tick's deadline
+            deadline += self.__period
+            remaining = deadline - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+            else:
+                self.__overruns += 1
+                if remaining < -self.__period:
+                    # too far behind to catch up; start counting again from now
+                    deadline = time.perf_counter()
+            lateness = max(time.perf_counter() - deadline, 0.0)
+            self.__ticks += 1
+            self.__jitter_total += lateness
+            self.__jitter_max = max(self.__jitter_max, lateness)
+
+        # stopped part way through an action
+        if current is not None:
+            current[0].close()
+            current[1].set_exception(RuntimeError("the motion scheduler was stopped"))
+            self._finish()
+
+    def _finish(self):
+        """ Marks the current action as done, letting other threads move the limbs """
+        if self.__playing:
+            self.__playing = False
+            self.__robot._motion_lock.release()  # pylint: disable=protected-access
+        self.__queue.task_done()
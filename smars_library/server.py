@@ -0,0 +1,181 @@
+""" HTTP control server for the SMARS robot
+
+The server owns a single SmarsRobot, set up once when it starts, and puts
+every request for an action onto the robot's motion scheduler. The queue is
+bounded: a request returns as soon as its action is queued (202), or straight
+away with 503 if the queue is full, so clients are played one after another
+without holding each other's HTTP requests open.
+
+    smars-server --port 5000
+    curl -X POST localhost:5000/actions/forward -d '{"steps": 3}' \\
+         -H 'Content-Type: application/json'
+
+Endpoints:
+
+* POST /actions/<action> - queue an action; the JSON body holds its
+  parameters, e.g. {"steps": 3} or {"message": "sos"}. Add ?wait=<seconds>
+  to wait for it to finish and get its result.
+* GET /pose, POST /pose - the current pose, or queue a move to a new one
+  ({"pose": {"LEFT_LEG_FRONT": 45}})
+* GET /telemetry - the angle of each limb
+* GET /status - the scheduler's queue and timing stats
+
+This needs Flask, which is installed separately (pip install flask).
+"""
+import queue
+import inspect
+import argparse
+import concurrent.futures
+
+from flask import Flask, jsonify, request
+
+from .smars_library import SmarsRobot, ACTION_ALIASES
+from .scheduler import DEFAULT_RATE, DEFAULT_QUEUE_SIZE
+from .trajectory import PROFILES
+
+# the actions which can be queued over HTTP
+SERVER_ACTIONS = ('forward', 'backward', 'turnleft', 'turnright', 'clap', 'wiggle',
+                  'tap_message', 'sit', 'stand', 'default', 'middle', 'swing', 'body',
+                  'stretch', 'apply_pose', 'move_to')
+RETRY_AFTER = 1     # seconds a client should wait when the queue is full
+
+
+def _count(value)->bool:
+    """ Returns True for a whole number of times (or None, for the default) """
+    return value is None or (isinstance(value, int) and not isinstance(value, bool)
+                             and value >= 0)
+
+
+def _number(value)->bool:
+    """ Returns True for a JSON number """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _positive(value)->bool:
+    """ Returns True for a number greater than 0 """
+    return _number(value) and value > 0
+
+
+def _pose(value)->bool:
+    """ Returns True for a {limb name: angle} object """
+    return isinstance(value, dict) and all(_number(angle) for angle in value.values())
+
+
+# what each action parameter sent over HTTP must be, and what to say if it isn't
+PARAMETERS = {'steps': (_count, "a whole number, 0 or more"),
+              'clap_count': (_count, "a whole number, 0 or more"),
+              'wiggle_count': (_count, "a whole number, 0 or more"),
+              'message': (lambda value: isinstance(value, str), "a string"),
+              'wpm': (_positive, "a number greater than 0"),
+              'pose': (_pose, "an object of limb names and angles"),
+              'duration': (_positive, "a number greater than 0"),
+              'rate': (_positive, "a number greater than 0"),
+              'profile': (lambda value: value in PROFILES, "one of " + ", ".join(PROFILES))}
+
+
+def check_parameters(method, kwargs:dict)->str:
+    """
+    Checks the parameters sent for an action before it is queued, as it is
+    only run later. Returns what is wrong with them, or None if they are fine.
+    """
+    try:
+        inspect.signature(method).bind(**kwargs)
+    except TypeError as error:
+        return str(error)
+    for name, value in kwargs.items():
+        check, expected = PARAMETERS.get(name, (lambda value: True, None))
+        if not check(value):
+            return "%s must be %s" % (name, expected)
+    return None
+
+
+def create_app(robot:SmarsRobot=None, rate:float=DEFAULT_RATE,
+               queue_size:int=DEFAULT_QUEUE_SIZE)->Flask:
+    """
+    Returns the Flask app for the server, controlling the robot provided (a
+    new SmarsRobot by default). The robot's motion scheduler is started with
+    the rate and queue size given.
+    """
+    if robot is None:
+        robot = SmarsRobot()
+    scheduler = robot.start_scheduler(rate=rate, queue_size=queue_size)
+    app = Flask(__name__)
+    app.config['ROBOT'] = robot
+
+    def submit(action:str, kwargs:dict):
+        """ Queues an action, returning the HTTP response """
+        problem = check_parameters(getattr(robot, ACTION_ALIASES.get(action, action)), kwargs)
+        if problem is not None:
+            return jsonify({'error': problem}), 400
+        try:
+            future = scheduler.submit(action, block=False, **kwargs)
+        except queue.Full:
+            response = jsonify({'error': "the robot is busy, try again later",
+                                'pending': scheduler.pending})
+            response.headers['Retry-After'] = str(RETRY_AFTER)
+            return response, 503
+
+        wait = request.args.get('wait', type=float)
+        if wait is None:
+            return jsonify({'queued': action, 'pending': scheduler.pending}), 202
+        try:
+            result = future.result(timeout=wait)
+        except concurrent.futures.TimeoutError:
+            return jsonify({'queued': action, 'pending': scheduler.pending}), 202
+        except Exception as error:  # pylint: disable=broad-except
+            return jsonify({'action': action, 'error': str(error)}), 500
+        return jsonify({'action': action, 'result': result}), 200
+
+    @app.route("/actions/<action>", methods=["POST"])
+    def action_endpoint(action):
+        if action not in SERVER_ACTIONS:
+            return jsonify({'error': "unknown action: " + action,
+                            'actions': list(SERVER_ACTIONS)}), 404
+        kwargs = request.get_json(silent=True) or {}
+        if not isinstance(kwargs, dict):
+            return jsonify({'error': "the parameters must be a JSON object"}), 400
+        return submit(action, kwargs)
+
+    @app.route("/pose", methods=["GET", "POST"])
+    def pose_endpoint():
+        if request.method == "GET":
+            return jsonify(robot.pose)
+        body = request.get_json(silent=True) or {}
+        if not isinstance(body.get('pose'), dict):
+            return jsonify({'error': 'the body must have a "pose" object'}), 400
+        return submit('apply_pose', {'pose': body['pose']})
+
+    @app.route("/telemetry")
+    def telemetry_endpoint():
+        return jsonify(dict(robot.get_telemetry()))
+
+    @app.route("/status")
+    def status_endpoint():
+        return jsonify(scheduler.stats())
+
+    return app
+
+
+def main(argv=None):
+    """ Runs the server from the command line """
+    parser = argparse.ArgumentParser(description="SMARS robot HTTP control server")
+    parser.add_argument("--host", default="0.0.0.0", help="the address to listen on")
+    parser.add_argument("--port", type=int, default=5000, help="the port to listen on")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                        help="motion scheduler ticks per second")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="the number of actions which can be waiting")
+    parser.add_argument("--simulate", action="store_true",
+                        help="drive the simulated PCA9685 instead of the real boards")
+    args = parser.parse_args(argv)
+
+    if args.simulate:
+        from .simulator import use_simulator
+        use_simulator()
+    app = create_app(rate=args.rate, queue_size=args.queue_size)
+    # threaded, so a client waiting on ?wait doesn't hold up the others
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+""" Shared memory pose and frame buffer for the SMARS robot
+
+A robot can publish its live limb state, and a ring of the most recent
+frames sent to its servo boards, into a block of shared memory. Other
+processes - a dashboard, or a Flask monitor - attach to it by name and read
+the pose as often as they like, without asking the control process for
+anything:
+
+    publisher = robot.publish("smars")          # in the control process
+
+    reader = SharedStateReader("smars")         # in any other process
+    pose = reader.pose()
+    frames = reader.frames()
+
+The control process never waits for a reader. Each part of the buffer is
+guarded by a sequence lock: the writer makes the sequence number odd while it
+writes and even again when it is done, and a reader copies the data and
+retries if the sequence number changed (or was odd) while it was copying.
+There must only be one writer, which there is as each robot moves from one
+thread at a time.
+
+This needs NumPy, which is installed separately (pip install numpy).
+"""
+import sys
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from .driver import add_frame_listener, remove_frame_listener, CHANNELS
+from .telemetry import TELEMETRY_DTYPE
+
+MAGIC = b"SMARSSM1"
+DEFAULT_SLOTS = 64      # the number of recent frames kept
+RETRIES = 1000          # how many times a reader retries a torn read
+
+HEADER_DTYPE = np.dtype([('magic', 'S8'),
+                         ('sequence', 'u8'),     # the pose sequence lock
+                         ('limbs', 'u4'),
+                         ('slots', 'u4'),
+                         ('frames', 'u8')])      # the number of frames published
+FRAME_DTYPE = np.dtype([('sequence', 'u8'),      # the slot's sequence lock
+                        ('time', 'f8'),          # when the frame was sent (time.time())
+                        ('busnum', 'u1'),
+                        ('address', 'u1'),
+                        ('mask', 'u2'),          # bit n is set if channel n was written
+                        ('values', 'u2', (CHANNELS, 2))])   # (on, off) for each channel
+
+
+def _layout(limbs:int, slots:int)->tuple:
+    """ Returns the offsets of the pose and frames, and the total size """
+    pose = HEADER_DTYPE.itemsize
+    frames = pose + limbs * TELEMETRY_DTYPE.itemsize
+    frames += -frames % 8
+    return pose, frames, frames + slots * FRAME_DTYPE.itemsize
+
+
+def _views(buffer, limbs:int, slots:int)->tuple:
+    """ Returns the header, pose and frame arrays over a shared memory buffer """
+    pose, frames, _ = _layout(limbs, slots)
+    return (np.ndarray(1, HEADER_DTYPE, buffer, 0)[0],
+            np.ndarray(limbs, TELEMETRY_DTYPE, buffer, pose),
+            np.ndarray(slots, FRAME_DTYPE, buffer, frames))
+
+
+class SharedStatePublisher():
+    """
+    Publishes a robot's telemetry and frames into shared memory.
+
+    The pose is published each time a frame is sent to a board, so readers
+    always see the limb state that was actually sent. boards, if given, is
+    called to get the (busnum, address) of the robot's boards, and frames
+    sent to other boards (another robot's) are left out.
+    """
+
+    def __init__(self, telemetry, name:str=None, slots:int=DEFAULT_SLOTS, boards=None):
+        if slots < 1:
+            raise ValueError("slots must be at least 1")
+        self.__telemetry = telemetry
+        self.__boards = boards
+        limbs = len(telemetry)
+        self.__memory = shared_memory.SharedMemory(name=name, create=True,
+                                                   size=_layout(limbs, slots)[2])
+        self.__header, self.__pose, self.__frames = _views(self.__memory.buf, limbs, slots)
+        self.__header['limbs'] = limbs
+        self.__header['slots'] = slots
+        self.__pose[:] = telemetry.snapshot()
+        self.__header['magic'] = MAGIC
+        add_frame_listener(self.publish_frame)
+
+    @property
+    def name(self)->str:
+        """ Returns the name readers attach with """
+        return self.__memory.name
+
+    def publish_frame(self, busnum:int, address:int, values:dict):
+        """ Publishes a frame sent to a board, and the pose after it """
+        if self.__boards is not None and (busnum, address) not in self.__boards():
+            return
+        header = self.__header
+        frames = self.__frames
+        slot = frames[header['frames'] % len(frames)]
+        slot['sequence'] += 1
+        slot['time'] = time.time()
+        slot['busnum'] = busnum
+        slot['address'] = address
+        mask = 0
+        pulses = slot['values']
+        for channel, value in values.items():
+            mask |= 1 << channel
+            pulses[channel] = value
+        slot['mask'] = mask
+        slot['sequence'] += 1
+        header['frames'] += 1
+        self.publish_pose()
+
+    def publish_pose(self):
+        """ Publishes the current limb state """
+        header = self.__header
+        header['sequence'] += 1
+        self.__pose[:] = self.__telemetry.snapshot()
+        header['sequence'] += 1
+
+    def close(self):
+        """ Stops publishing and frees the shared memory """
+        remove_frame_listener(self.publish_frame)
+        if self.__memory is not None:
+            del self.__header, self.__pose, self.__frames
+            self.__memory.close()
+            self.__memory.unlink()
+            self.__memory = None
+
+
+class SharedStateReader():
+    """ Reads the state published by a SharedStatePublisher, from any process """
+
+    def __init__(self, name:str):
+        self.__memory = _attach(name)
+        header = np.ndarray(1, HEADER_DTYPE, self.__memory.buf, 0)[0]
+        if header['magic'] != MAGIC:
+            self.__memory.close()
+            raise ValueError(name + " isn't a SMARS shared state buffer")
+        self.__header, self.__pose, self.__frames = _views(
+            self.__memory.buf, int(header['limbs']), int(header['slots']))
+
+    @property
+    def frame_count(self)->int:
+        """ Returns the number of frames published so far """
+        return int(self.__header['frames'])
+
+    def pose(self):
+        """
+        Returns a copy of the latest limb state, a telemetry array with a row
+        per limb; raises TimeoutError if the writer kept changing it.
+        """
+        header = self.__header
+        for _ in range(RETRIES):
+            before = int(header['sequence'])
+            if before % 2 == 0:
+                pose = self.__pose.copy()
+                if int(header['sequence']) == before:
+                    return pose
+        raise TimeoutError("the pose kept changing while it was read")
+
+    def frames(self, since:int=None)->list:
+        """
+        Returns the recent frames as (number, time, busnum, address, values)
+        tuples, oldest first, where values is a {channel: (on, off)}
+        dictionary. Only frames numbered since or later are returned, so a
+        poller can pass frame_count from its last call to get just the new
+        ones; frames that have been overwritten are skipped.
+        """
+        count = self.frame_count
+        slots = len(self.__frames)
+        first = max(count - slots, 0 if since is None else since)
+        frames = []
+        for number in range(first, count):
+            slot = self.__frames[number % slots]
+            before = int(slot['sequence'])
+            if before % 2:
+                continue
+            copy = slot.copy()
+            if int(slot['sequence']) != before or self.frame_count - number > slots:
+                continue
+            mask = int(copy['mask'])
+            values = {channel: tuple(int(value) for value in copy['values'][channel])
+                      for channel in range(CHANNELS) if mask & (1 << channel)}
+            frames.append((number, float(copy['time']), int(copy['busnum']),
+                           int(copy['address']), values))
+        return frames
+
+    def close(self):
+        """ Detaches from the shared memory (it stays until the publisher closes it) """
+        if self.__memory is not None:
+            del self.__header, self.__pose, self.__frames
+            self.__memory.close()
+            self.__memory = None
+
+
+def _attach(name:str)->shared_memory.SharedMemory:
+    """
+    Attaches to existing shared memory without this process taking
+    ownership of it, so it isn't removed when the reader exits.
+    """
+    if sys.version_info >= (3, 13):
+        # track was added in 3.13  # pylint: disable=unexpected-keyword-arg
+        return shared_memory.SharedMemory(name=name, track=False)
+    # before Python 3.13 every process attaching to shared memory registers
+    # it with the resource tracker, which removes it when the process exits
+    memory = shared_memory.SharedMemory(name=name)
+    # pylint: disable-next=protected-access
+    resource_tracker.unregister(memory._name, "shared_memory")
+    return memory
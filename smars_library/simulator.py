@@ -0,0 +1,250 @@
+""" Simulated PCA9685 for the SMARS library
+
+The simulator stands in for the I2C bus and PCA9685 boards, so the library
+can be run (and benchmarked) on a machine with no I2C bus at all. It works at
+the register level: every transaction is applied to a model of the board's
+registers, including auto-increment, the ALL_LED registers and the prescaler,
+and is recorded with a timestamp.
+
+Each transaction is also given a cost from a simple timing model (a fixed
+overhead plus a time per byte, 100kHz I2C by default), which is added up in
+bus_time. With realtime=True the simulator also sleeps for that long, so
+timings match a real bus.
+
+    from smars_library.simulator import use_simulator
+    bus = use_simulator()
+    robot = SmarsRobot()
+    robot.walkforward(2)
+    board = bus.board(0x40)
+    print(board.transactions, board.bus_time, board.history[-8:])
+"""
+import time
+import threading
+
+from .driver import MODE1, MODE2, LED0_ON_L, ALL_LED_ON_L, PRESCALE, SLEEP, AI, CHANNELS
+from .driver import PCA9685_ADDRESS, DEFAULT_BUSNUM, reset_drivers, set_i2c
+
+TRANSACTION_TIME = 0.0001   # start, address and register bytes; ~100us at 100kHz
+BYTE_TIME = 0.00009         # 9 clocks per data byte at 100kHz
+OSCILLATOR = 25000000.0     # the PCA9685's internal oscillator
+
+WRITE = 'write'
+READ = 'read'
+
+
+class Transaction():
+    """ A record of one I2C transaction with the board """
+    __slots__ = ('time', 'kind', 'register', 'data', 'cost')
+
+    def __init__(self, when:float, kind:str, register:int, data:bytes, cost:float):
+        self.time = when
+        self.kind = kind
+        self.register = register
+        self.data = data
+        self.cost = cost
+
+    def __repr__(self):
+        return "Transaction(%.6f, %s, %#04x, %s)" % (self.time, self.kind, self.register,
+                                                    list(self.data))
+
+
+class SimulatedPCA9685():
+    """
+    A register level model of a PCA9685 board, with the same methods as an
+    Adafruit_GPIO.I2C device.
+    """
+
+    def __init__(self, address:int=PCA9685_ADDRESS, busnum:int=DEFAULT_BUSNUM,
+                 transaction_time:float=TRANSACTION_TIME, byte_time:float=BYTE_TIME,
+                 realtime:bool=False):
+        self.address = address
+        self.busnum = busnum
+        self.transaction_time = transaction_time
+        self.byte_time = byte_time
+        self.realtime = realtime
+        self.registers = bytearray(256)
+        self.registers[MODE1] = SLEEP | 0x01
+        self.registers[MODE2] = 0x04
+        self.registers[PRESCALE] = 0x1E
+        self.log = []         # every Transaction, in order
+        self.history = []     # (time, channel, on, off) each time a channel changes
+        self.bus_time = 0.0   # the modelled time spent on the bus
+        self.__lock = threading.Lock()
+
+    @property
+    def transactions(self)->int:
+        """ Returns the number of transactions made with the board """
+        return len(self.log)
+
+    @property
+    def writes(self)->list:
+        """ Returns the write transactions """
+        return [transaction for transaction in self.log if transaction.kind == WRITE]
+
+    @property
+    def freq(self)->float:
+        """ Returns the PWM frequency set by the prescaler """
+        return OSCILLATOR / (4096 * (self.registers[PRESCALE] + 1))
+
+    @property
+    def sleeping(self)->bool:
+        """ Returns True if the oscillator is asleep """
+        return bool(self.registers[MODE1] & SLEEP)
+
+    def channel(self, channel:int)->tuple:
+        """ Returns the (on, off) values of a channel """
+        register = LED0_ON_L + 4 * channel
+        values = self.registers[register:register + 4]
+        return (values[0] | (values[1] & 0x0F) << 8, values[2] | (values[3] & 0x0F) << 8)
+
+    def pulse(self, channel:int)->int:
+        """ Returns the pulse length of a channel, in ticks """
+        on, off = self.channel(channel)
+        return (off - on) % 4096
+
+    def pulse_us(self, channel:int)->float:
+        """ Returns the pulse length of a channel, in microseconds """
+        return self.pulse(channel) * 1000000.0 / self.freq / 4096
+
+    def pulses(self)->list:
+        """ Returns the pulse length of every channel, in ticks """
+        return [self.pulse(channel) for channel in range(CHANNELS)]
+
+    def channel_history(self, channel:int)->list:
+        """ Returns the (time, on, off) changes of one channel """
+        return [(when, on, off) for when, changed, on, off in self.history if changed == channel]
+
+    def clear(self):
+        """ Forgets the recorded transactions, history and bus time """
+        with self.__lock:
+            self.log = []
+            self.history = []
+            self.bus_time = 0.0
+
+    # Adafruit_GPIO.I2C device methods
+
+    def write8(self, register:int, value:int):
+        """ Writes a byte to a register """
+        self._write(register, bytes([value & 0xFF]))
+
+    def writeList(self, register:int, data:list):  # pylint: disable=invalid-name
+        """ Writes bytes to a register, and the ones after it if auto-increment is on """
+        self._write(register, bytes(value & 0xFF for value in data))
+
+    def readU8(self, register:int)->int:  # pylint: disable=invalid-name
+        """ Reads a byte from a register """
+        return self.readList(register, 1)[0]
+
+    def readList(self, register:int, length:int)->bytearray:  # pylint: disable=invalid-name
+        """ Reads bytes from a register, and the ones after it if auto-increment is on """
+        with self.__lock:
+            data = bytearray()
+            start = register
+            for _ in range(length):
+                data.append(self.registers[register])
+                register = self._next(register)
+            self._record(READ, start, bytes(data))
+            return data
+
+    def _next(self, register:int)->int:
+        """ Returns the register the pointer moves on to """
+        if self.registers[MODE1] & AI:
+            return (register + 1) & 0xFF
+        return register
+
+    def _write(self, register:int, data:bytes):
+        """ Applies a write transaction to the registers """
+        with self.__lock:
+            cost = self._record(WRITE, register, data)
+            before = [self.channel(channel) for channel in range(CHANNELS)]
+            for value in data:
+                self._store(register, value)
+                register = self._next(register)
+            when = self.log[-1].time
+            for channel in range(CHANNELS):
+                after = self.channel(channel)
+                if after != before[channel]:
+                    self.history.append((when, channel) + after)
+        if self.realtime:
+            time.sleep(cost)
+
+    def _store(self, register:int, value:int):
+        """ Stores a byte in a register """
+        if ALL_LED_ON_L <= register <= ALL_LED_ON_L + 3:
+            for channel in range(CHANNELS):
+                self.registers[LED0_ON_L + 4 * channel + register - ALL_LED_ON_L] = value
+        elif register == PRESCALE and not self.sleeping:
+            return    # the prescaler can only be changed while asleep
+        self.registers[register] = value
+
+    def _record(self, kind:str, register:int, data:bytes)->float:
+        """ Records a transaction, returning its modelled cost """
+        cost = self.transaction_time + self.byte_time * len(data)
+        self.bus_time += cost
+        self.log.append(Transaction(time.perf_counter(), kind, register, data, cost))
+        return cost
+
+
+class SimulatedI2C():
+    """
+    A simulated I2C bus, with the same get_i2c_device() function as the
+    Adafruit_GPIO.I2C module. A board is created for each (bus, address) the
+    first time it is asked for.
+    """
+
+    def __init__(self, transaction_time:float=TRANSACTION_TIME, byte_time:float=BYTE_TIME,
+                 realtime:bool=False):
+        self.transaction_time = transaction_time
+        self.byte_time = byte_time
+        self.realtime = realtime
+        self.boards = {}
+
+    def get_i2c_device(self, address:int, busnum:int=None, **kwargs):
+        """ Returns the simulated board at the address on the bus provided """
+        if busnum is None:
+            busnum = DEFAULT_BUSNUM
+        board = self.boards.get((busnum, address))
+        if board is None:
+            board = SimulatedPCA9685(address, busnum, self.transaction_time,
+                                     self.byte_time, self.realtime)
+            self.boards[(busnum, address)] = board
+        return board
+
+    def board(self, address:int=PCA9685_ADDRESS, busnum:int=DEFAULT_BUSNUM)->SimulatedPCA9685:
+        """ Returns the simulated board at the address on the bus provided """
+        return self.get_i2c_device(address, busnum=busnum)
+
+    @property
+    def transactions(self)->int:
+        """ Returns the number of transactions made with all of the boards """
+        return sum(board.transactions for board in self.boards.values())
+
+    @property
+    def bus_time(self)->float:
+        """ Returns the modelled time spent on the bus by all of the boards """
+        return sum(board.bus_time for board in self.boards.values())
+
+    def clear(self):
+        """ Forgets the recorded transactions of all of the boards """
+        for board in self.boards.values():
+            board.clear()
+
+
+def use_simulator(transaction_time:float=TRANSACTION_TIME, byte_time:float=BYTE_TIME,
+                  realtime:bool=False)->SimulatedI2C:
+    """
+    Makes the library use a simulated I2C bus instead of the real one.
+
+    The shared drivers are reset, so every board used from now on is a
+    SimulatedPCA9685 on the returned bus. Call use_hardware() to go back.
+    """
+    bus = SimulatedI2C(transaction_time, byte_time, realtime)
+    reset_drivers()
+    set_i2c(bus)
+    return bus
+
+
+def use_hardware():
+    """ Makes the library use the real I2C bus again """
+    reset_drivers()
+    set_i2c(None)
@@ -26,9 +26,21 @@ to install the dependencies
 """
 import time
 import logging
-import Adafruit_PCA9685
+import functools
+import threading
+import contextlib
+from concurrent.futures import Future
 from .channel import Channel
-from .morse import Morse
+from .morse import compile_message, DEFAULT_WPM
+from .driver import get_driver, DEFAULT_BUSNUM, PCA9685_ADDRESS, PCA9685_ADDRESS_MAX
+from .pulse import build_tick_table, lookup_tick, angles_to_ticks, check_calibration
+from .pulse import US_PER_BIT, PULSE_MIN, PULSE_MAX
+from .scheduler import MotionScheduler, DEFAULT_RATE, DEFAULT_QUEUE_SIZE
+from .gait import Gait, compile_gait, limb_key, GaitProfile, FORWARD, BACKWARD, TICK_INCREMENT
+from .metrics import ActionMetrics
+from . import config as config_file
+from . import tracing
+from . import journal
 logging.basicConfig(level=logging.CRITICAL)
 logging.propagate = False
 
@@ -46,61 +58,36 @@ chans = { 'LEFT_LEG_FRONT': 0,    # channel 0
 # Set DEBUG to True using the debug property
 DEBUG = False
 
-# Initialise the PCA9685 using the default address (0x40).
-try:
-    PWM = Adafruit_PCA9685.PCA9685(busnum=1)
+# The shared PCA9685 using the default address (0x40). The driver is lazy - it
+# isn't initialised (and the frequency isn't set) until the first servo is
+# moved, so importing this module does no I/O. Other boards can be reached
+# with get_driver(busnum, address).
+PWM = get_driver(DEFAULT_BUSNUM, PCA9685_ADDRESS)
 
-    # the short delay should help the PCA9685 settle and not produce errors
-    time.sleep(1)
-
-except OSError as error:
-    LOG_STRING = "failed to initialise the servo driver (Adafruit PCA9685): "
-    logging.error(LOG_STRING)
-
-    # tell later parts of the code not to actually use the driver
-
-    DO_NOT_USE_PCA_DRIVER = True
-
-    PWM = ""
-except (RuntimeError) as ex:
-    print("There was an error loading the adafruit driver; loading without PCA9685.")
-    DO_NOT_USE_PCA_DRIVER = True # tell later parts of the code not to actually use the driver
-else:
-    LOG_STRING = "PCA9685 Driver loaded)."
-    DO_NOT_USE_PCA_DRIVER = False # tell later parts of the code to use the driver
-    logging.error(LOG_STRING)
+# Set to True to tell later parts of the code not to actually use the driver
+DO_NOT_USE_PCA_DRIVER = False
 
 SLEEP_COUNT = 0.05    # the amount of time to wait between pwm operations
+MAX_CHECKED = 32      # the gait checks each robot remembers, see SmarsRobot._rejects()
 
-# Set frequency to 60hz, good for servos.
-try:
-    if DO_NOT_USE_PCA_DRIVER is False:
-        PWM.set_pwm_freq(60)
-        time.sleep(1)
-except ValueError as error:
-    LOG_STRING = "failed to set the pwm frequency:, " + error
-    logging.error(LOG_STRING)
-
-def set_servo_pulse(channel, pulse):
+def set_servo_pulse(channel, pulse, board:int=PCA9685_ADDRESS, busnum:int=DEFAULT_BUSNUM):
     """
     Helper function to make setting a servo pulse width simpler.
+
+    The board and busnum select which PCA9685 the channel is on, by default
+    the board at 0x40 on bus 1.
     """
 
     if 0 <= channel <= 15 and \
        isinstance(channel,int)  and \
        pulse <= 4096 and \
        pulse >= 0:
-        pulse_length = 1000000    # 1,000,000 us per second
-        pulse_length //= 60       # 60 Hz
-        logging.info('%s us per period', pulse_length)
-        pulse_length //= 4096     # 12 bits of resolution
-        logging.info('%s us per bit', pulse_length)
         pulse *= 1000
-        pulse //= pulse_length
+        pulse //= US_PER_BIT
         try:
             if DO_NOT_USE_PCA_DRIVER is False:
-                PWM.set_pwm(channel, 0, pulse)
-        except (RuntimeError) as ex:
+                get_driver(busnum, board).set_pwm(channel, 0, pulse)
+        except (RuntimeError, OSError) as ex:
             logging.warning(
                 """Failed to set pwm
                     - did the driver initialize correctly? %s""", ex)
@@ -119,8 +106,6 @@ class Leg():
     """
     provides a model of a limb (for either a foot or a leg)
     """
-    __leg_min = 150
-    __leg_max = 600
     __swingangle = 0
     __bodyangle = 0
     __stretchangle = 0
@@ -135,30 +120,27 @@ class Leg():
         """ Returns the leg angle """
         return self.__leg_angle
 
-    def __init__(self, name, channel, leg_minangle, leg_maxangle, invert):
-        # Initialises the leg object
-        try:
-            if DO_NOT_USE_PCA_DRIVER is False:
-                pwm = Adafruit_PCA9685.PCA9685(busnum=1)
-        except RuntimeError as error:
-            logging.warning("The servo driver failed to initialise  \
-            - have you installed the adafruit PCA9685 driver, \
-            and is it connected?")
-            logging.warning(error)
-
-        try:
-            if DO_NOT_USE_PCA_DRIVER is False:
-                pwm.set_pwm_freq(60)
-        except (RuntimeError) as ex:
-            logging.warning(
-                """Failed to set the pwm frequency
-                 - did the servo driver initialize correctly?, %s""", ex)
-
+    def __init__(self, name, channel, leg_minangle, leg_maxangle, invert,
+                 board:int=PCA9685_ADDRESS, busnum:int=DEFAULT_BUSNUM, calibration:tuple=None):
+        # Initialises the leg object; the limb is bound to a channel on the
+        # PCA9685 board at the address provided, and calibrated with the
+        # (pulse min, pulse max, curve) provided (see calibrate())
         self.__name = name
         self.__channel = channel
+        self.__board = board
+        self.__busnum = busnum
         self.__leg_minangle = leg_minangle
         self.__leg_maxangle = leg_maxangle
         self.__invert = invert
+        self.__leg_min = PULSE_MIN
+        self.__leg_max = PULSE_MAX
+        self.__curve = None
+        self.__ticks = None
+        if calibration is None:
+            self.calibrate()
+        else:
+            self.calibrate(*calibration)
+        self.__telemetry = None     # (Telemetry, row) while telemetry is recorded
 
         if not self.__invert:
             self.__bodyangle = self.__leg_minangle
@@ -233,6 +215,49 @@ class Leg():
         return False
 
 
+    @property
+    def board(self):
+        """ Returns the address of the PCA9685 board this servo/limb is on """
+        return self.__board
+
+    @board.setter
+    def board(self, value:int) -> bool:
+        """ Set the address of the PCA9685 board for this servo/limb """
+
+        if not isinstance(value, int):
+            print("Oops Limb board setter was expected the value to be an integer, \
+                please try again but with a valid address between 0x40 and 0x7F.")
+            return False
+
+        if PCA9685_ADDRESS <= value <= PCA9685_ADDRESS_MAX:
+            self.__board = value
+            return True
+        print("Oops Limb board setter was expected the value to be an integer, \
+             between 0x40 and 0x7F.")
+        return False
+
+    @property
+    def busnum(self):
+        """ Returns the I2C bus number the board for this servo/limb is on """
+        return self.__busnum
+
+    @busnum.setter
+    def busnum(self, value:int) -> bool:
+        """ Set the I2C bus number the board for this servo/limb is on """
+
+        if not isinstance(value, int) or value < 0:
+            print("Oops Limb busnum setter was expected the value to be a whole number, \
+                please try again but with a valid I2C bus number.")
+            return False
+
+        self.__busnum = value
+        return True
+
+    @property
+    def driver(self):
+        """ Returns the shared servo driver for the board this limb is on """
+        return get_driver(self.__busnum, self.__board)
+
     @property
     def invert(self):
         """ returns the invert value """
@@ -331,7 +356,7 @@ class Leg():
         """
         used for debugging - shows the servo driver channel number and the limb name
         """
-        print(self.__channel)
+        print(hex(self.__board), self.__channel)
         print(self.name)
 
     @angle.setter
@@ -346,19 +371,10 @@ class Leg():
             self.__leg_angle = user_angle
             # Check the angle is within the boundaries for this limb
             if self.__leg_minangle <= user_angle <= self.__leg_maxangle:
-                mapmax = self.__leg_max - self.__leg_min
-                percentage = (float(user_angle) / 180) * 100
-                pulse = int(((float(mapmax) / 100) *
-                             float(percentage)) + self.__leg_min)
+                pulse = lookup_tick(self.__ticks, user_angle)
 
                 # send the servo the pulse, to set the angle
-                try:
-                    if DO_NOT_USE_PCA_DRIVER is False:
-                        PWM.set_pwm(self.__channel, self.__channel, pulse)
-                except RuntimeError as error:
-                    logging.warning("Failed to set the pwm frequency - \
-                    did the servo driver initialize correctly?")
-                    logging.warning(error)
+                self.send(pulse)
                 self.__currentangle = user_angle
                 return True
 
@@ -369,40 +385,137 @@ class Leg():
             return False
         return False
 
-    def untick(self):
-        """ Used to walk backwards """
+    def send(self, pulse:int, angle:float=None):
+        """
+        Sends the servo a pulse (PCA9685 tick count); angle is the angle the
+        pulse is for, if it isn't the limb's current angle
+        """
+        if self.__telemetry is not None:
+            telemetry, row = self.__telemetry
+            telemetry.record(row, self.__leg_angle if angle is None else angle, pulse)
+        try:
+            if DO_NOT_USE_PCA_DRIVER is False:
+                tracer = tracing.active()
+                if tracer is None:
+                    get_driver(self.__busnum, self.__board).set_pwm(self.__channel, 0, pulse)
+                else:
+                    with tracer.span(self.__name, 'limb', channel=self.__channel, pulse=pulse):
+                        get_driver(self.__busnum, self.__board).set_pwm(self.__channel, 0, pulse)
+        except (RuntimeError, OSError) as error:
+            logging.warning("Failed to set the pwm frequency - \
+            did the servo driver initialize correctly?")
+            logging.warning(error)
+
+    def state(self)->tuple:
+        """ Returns the limb's (angle, current angle), used when walking """
+        return (self.__leg_angle, self.__currentangle)
+
+    def restore(self, angle:float, current_angle:float):
+        """ Restores the state returned by state(), without moving the limb """
+        self.__leg_angle = angle
+        self.__currentangle = current_angle
+
+    def attach_telemetry(self, telemetry, row:int):
+        """ Records every pulse sent to this limb in a row of a Telemetry (None to stop) """
+        self.__telemetry = None if telemetry is None else (telemetry, row)
+
+    @property
+    def pulse_min(self)->int:
+        """ Gets the pulse (PCA9685 tick count) sent for 0 degrees """
+        return self.__leg_min
+
+    @property
+    def pulse_max(self)->int:
+        """ Gets the pulse (PCA9685 tick count) sent for 180 degrees """
+        return self.__leg_max
+
+    @property
+    def calibration(self)->tuple:
+        """ Gets the limb's calibration: (pulse min, pulse max, curve) """
+        return (self.__leg_min, self.__leg_max, self.__curve)
+
+    def calibrate(self, pulse_min:int=PULSE_MIN, pulse_max:int=PULSE_MAX, curve=None):
+        """
+        Calibrates the limb with the pulses measured for 0 and 180 degrees,
+        and optionally a correction curve of (angle, pulse) points measured
+        in between. The calibration is built into the limb's tick table, so
+        it costs nothing when the limb moves; raises ValueError if it can't
+        be used.
+        """
+        curve = check_calibration(pulse_min, pulse_max, curve)
+        self.__ticks = build_tick_table(pulse_min, pulse_max, curve)
+        self.__leg_min = pulse_min
+        self.__leg_max = pulse_max
+        self.__curve = curve
+
+    @property
+    def tick_table(self):
+        """ Returns the angle to pulse table this limb uses (don't change it) """
+        return self.__ticks
+
+    def target(self, position:str)->float:
+        """
+        Returns the angle for a named position, without moving the limb.
+
+        The position can be body, stretch, swing, up, down, middle or default.
+        """
+        low, high = self.__leg_minangle, self.__leg_maxangle
+        if self.__invert:
+            positions = {'body': high, 'stretch': low, 'swing': (high - low) / 2,
+                         'up': high, 'down': low}
+        else:
+            positions = {'body': low, 'stretch': high, 'swing': (low / 2) + low,
+                         'up': low, 'down': high}
+        positions['middle'] = positions['default'] = high - low
+        if position not in positions:
+            raise ValueError("Unknown position: " + str(position))
+        return positions[position]
+
+    def pulse(self, angle:float)->int:
+        """ Returns the pulse (PCA9685 tick count) this limb uses for an angle """
+        return lookup_tick(self.__ticks, angle)
+
+    def pulses(self, angles):
+        """
+        Converts a whole trajectory of angles into a NumPy array of pulses in
+        one call (needs NumPy to be installed).
+        """
+        return angles_to_ticks(self.__ticks, angles)
+
+    def untick(self, increment:int=TICK_INCREMENT):
+        """ Used to walk backwards, turning the leg by increment degrees """
         if self.__name == "RIGHT_LEG_BACK" or self.__name == "RIGHT_LEG_FRONT":
             if self.__currentangle <= self.__leg_maxangle:
-                self.__currentangle += 2
+                self.__currentangle += increment
                 # print self.name, "setting angle to ", self.currentAngle
                 self.angle = self.__currentangle
                 return False
             return True
         if self.__name == "LEFT_LEG_BACK" or self.__name == "LEFT_LEG_FRONT":
             if self.__currentangle >= self.__leg_minangle:
-                self.__currentangle -= 2
+                self.__currentangle -= increment
                 # print self.name, "setting angle to ", self.currentAngle
                 self.angle = self.__currentangle
                 return False
             return True
         return True
-    def tick(self):
+    def tick(self, increment:int=TICK_INCREMENT):
         """
         Used for walking forward.
-        Each tick received changes the current angle of the limb, unless an
-        limit is reached, which then returns a true value
+        Each tick received changes the current angle of the limb by increment
+        degrees, unless an limit is reached, which then returns a true value
         """
         if self.__name == "LEFT_LEG_FRONT" or self.__name == "LEFT_LEG_BACK":
             if self.__currentangle <= self.__leg_maxangle:
-                self.__currentangle += 2
-                print(self.name, "Tick - setting angle to ", self.__currentangle)
+                self.__currentangle += increment
+                logging.debug("%s Tick - setting angle to %s", self.name, self.__currentangle)
                 self.angle = self.__currentangle
                 return False
             return True
         if self.__name == "RIGHT_LEG_FRONT" or self.__name == "RIGHT_LEG_BACK":
             if self.__currentangle >= self.__leg_minangle:
-                self.__currentangle -= 2
-                print(self.name, "Tick - setting angle to ", self.__currentangle)
+                self.__currentangle -= increment
+                logging.debug("%s Tick - setting angle to %s", self.name, self.__currentangle)
                 self.angle = self.__currentangle
                 return False
             return True
@@ -418,106 +531,661 @@ class Leg():
         """ Sets the Robot name """
         self.__name = name
 
+# the actions which can be played step by step with SmarsRobot.steps()
+ACTIONS = ('walkforward', 'walkbackward', 'turnleft', 'turnright', 'swing', 'body',
+           'stretch', 'clap', 'wiggle', 'tap_message', 'sit', 'stand', 'default',
+           'middle', 'leg_reset', 'apply_pose', 'move_to')
+ACTION_ALIASES = {'forward': 'walkforward', 'backward': 'walkbackward'}
+
+
+def _action(method):
+    """
+    Wraps a SmarsRobot action so that all of the servo writes it makes between
+    pauses are sent to the boards as a single frame.
+
+    If the robot has a motion scheduler running, the action is queued onto it
+    instead and a Future for its result is returned. Actions called by other
+    actions are always run straight away.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        scheduler = self.scheduler
+        if scheduler is not None and scheduler.running and not self.in_frame:
+            return scheduler.submit(method.__name__, *args, **kwargs)
+        with self._motion_lock, self._instrument(method.__name__, args, kwargs), self.frame():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _timed(method):
+    """ Wraps a SmarsRobot method so that it is recorded in the history and stats """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._instrument(method.__name__, args, kwargs):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class SmarsRobot():
     """
     This is used to model the robot, its legs and its sensors
     """
-    def __init__(self):
+    def __init__(self, busnum:int=DEFAULT_BUSNUM, address:int=PCA9685_ADDRESS):
+        """
+        Sets up the robot, with all of its limbs on the servo board at the
+        address (0x40 - 0x7F) on the I2C bus provided. Each robot has its own
+        limbs, so several robots on different boards can be driven at once.
+        """
+        if not PCA9685_ADDRESS <= address <= PCA9685_ADDRESS_MAX:
+            raise ValueError("The board address must be between 0x40 and 0x7F")
         print("*** Initialising Robot ***")
-        try:
-            if DO_NOT_USE_PCA_DRIVER is False:
-                pwm = Adafruit_PCA9685.PCA9685()
-                pwm.set_pwm_freq(60)
-        except RuntimeError as error:
-            logging.warning(
-                "Failed to set the pwm frequency - did the servo driver initialize correctly? %s",
-                 error)
+        self.__scheduler = None
+        self.__local = threading.local()
+        self.__metrics = None
+        self.__history = CommandHistory()
+        self.__telemetry = None
+        self.__kinematics = None
+        self.__validate = True
+        self.__checked = {}     # the violations found in each gait checked, see _rejects()
+        self.__gait_profile = GaitProfile.from_pause(SLEEP_COUNT)
+        # held while an action is played outside the scheduler, so actions
+        # started from other threads wait their turn
+        self._motion_lock = threading.RLock()
+
+        # the friendly name for the robot - used in console messages
+        self.__name = ""
+
+        # debug status, default if off / False
+        self.__debug = False
+
+        # setup two arrays, one for legs, and one for feet
+        self.__feet = []
+        self.__legs = []
+
+        # add each foot to the feet array
+        self.__feet.append(Leg(name='LEFT_FOOT_FRONT', channel=1,
+                               leg_minangle=50, leg_maxangle=150, invert=False,
+                               board=address, busnum=busnum))
+        self.__feet.append(Leg(name='LEFT_FOOT_BACK', channel=3,
+                               leg_minangle=50, leg_maxangle=150, invert=True,
+                               board=address, busnum=busnum))
+        self.__feet.append(Leg(name='RIGHT_FOOT_FRONT', channel=7,
+                               leg_minangle=50, leg_maxangle=150, invert=True,
+                               board=address, busnum=busnum))
+        self.__feet.append(Leg(name='RIGHT_FOOT_BACK', channel=5,
+                               leg_minangle=50, leg_maxangle=150, invert=False,
+                               board=address, busnum=busnum))
+
+        # add each leg to the legs array
+        self.__legs.append(Leg(name='LEFT_LEG_FRONT', channel=0,
+                               leg_minangle=9, leg_maxangle=90, invert=True,
+                               board=address, busnum=busnum))
+        self.__legs.append(Leg(name='LEFT_LEG_BACK', channel=2,
+                               leg_minangle=90, leg_maxangle=180, invert=False,
+                               board=address, busnum=busnum))
+        self.__legs.append(Leg(name='RIGHT_LEG_FRONT', channel=6,
+                               leg_minangle=90, leg_maxangle=180, invert=False,
+                               board=address, busnum=busnum))
+        self.__legs.append(Leg(name='RIGHT_LEG_BACK', channel=4,
+                               leg_minangle=9, leg_maxangle=90, invert=True,
+                               board=address, busnum=busnum))
 
     # defines if the robot is a quad or wheel based robot
     # need to make this an enum then set the type to be one of the items in the list
     type = ['wheel', 'quad']
 
-    # setup two arrays, one for legs, and one for feet
-    __legs = []
-    __feet = []
-
-    # the friendly name for the robot - used in console messages
-    __name = ""
-
-    # debug status, default if off / False
-    __debug = False
-
-    # add each foot to the feet array
-    __feet.append(Leg(name='LEFT_FOOT_FRONT', channel=1,
-                    leg_minangle=50, leg_maxangle=150, invert=False))
-    __feet.append(Leg(name='LEFT_FOOT_BACK', channel=3,
-                    leg_minangle=50, leg_maxangle=150, invert=True))
-    __feet.append(Leg(name='RIGHT_FOOT_FRONT', channel=7,
-                    leg_minangle=50, leg_maxangle=150, invert=True))
-    __feet.append(Leg(name='RIGHT_FOOT_BACK', channel=5,
-                    leg_minangle=50, leg_maxangle=150, invert=False))
-
-    # add each leg to the legs array
-    __legs.append(Leg(name='LEFT_LEG_FRONT', channel=0,
-                    leg_minangle=9, leg_maxangle=90, invert=True))
-    __legs.append(Leg(name='LEFT_LEG_BACK', channel=2,
-                    leg_minangle=90, leg_maxangle=180, invert=False))
-    __legs.append(Leg(name='RIGHT_LEG_FRONT', channel=6,
-                    leg_minangle=90, leg_maxangle=180, invert=False))
-    __legs.append(Leg(name='RIGHT_LEG_BACK', channel=4,
-                    leg_minangle=9, leg_maxangle=90, invert=True))
-    # print "number of legs", len(legs)
-
-    def tap_message(self, message:str)->bool:
+    def _boards(self)->set:
+        """ Returns the (busnum, address) of each of the boards the limbs are on """
+        return {(limb.busnum, limb.board) for limb in self.__legs + self.__feet}
+
+    def _drivers(self)->list:
+        """ Returns the shared drivers for all of the boards the limbs are on """
+        return [get_driver(busnum, address) for busnum, address in sorted(self._boards())]
+
+    @contextlib.contextmanager
+    def frame(self):
+        """
+        Groups limb moves into a single frame.
+
+        All of the servo writes made inside the frame are held back and then
+        sent to each board as one auto-increment block write when the frame
+        ends, so the servos all start moving at the same moment.
+
+        Parameters:
+        -----------
+
+        n/a
+
+        Returns
+        -------
+
+        n/a
+        """
+        with contextlib.ExitStack() as stack:
+            for driver in self._drivers():
+                stack.enter_context(driver.frame())
+            self.__local.depth = self.__frame_depth() + 1
+            try:
+                yield self
+            finally:
+                self.__local.depth -= 1
+
+    def __frame_depth(self)->int:
+        return getattr(self.__local, 'depth', 0)
+
+    @property
+    def in_frame(self)->bool:
+        """ Returns True if the calling thread has a frame open on this robot """
+        return self.__frame_depth() > 0
+
+    @property
+    def scheduler(self):
+        """ Returns the motion scheduler, or None if one hasn't been started """
+        return self.__scheduler
+
+    def start_scheduler(self, rate:float=DEFAULT_RATE,
+                        queue_size:int=DEFAULT_QUEUE_SIZE)->MotionScheduler:
+        """
+        Starts a fixed rate motion scheduler for the Robot.
+
+        Once the scheduler is running, actions such as forward() or clap()
+        are queued onto it and return straight away with a Future for their
+        result. The scheduler ticks at the rate provided, sending the moves
+        that are due on each tick as a single frame, so the timing between
+        moves doesn't drift.
+
+        Parameters:
+        -----------
+
+        rate : float
+            The number of ticks per second, e.g. 50 - 200
+        queue_size : int
+            The number of actions which can be waiting to be played
+
+        Returns
+        -------
+
+        MotionScheduler
+            The scheduler, which can be used to check its timing stats()
+        """
+        if self.__scheduler is not None:
+            self.__scheduler.stop()
+        self.__scheduler = MotionScheduler(self, rate=rate, queue_size=queue_size)
+        self.__scheduler.start()
+        return self.__scheduler
+
+    def stop_scheduler(self, wait:bool=True):
+        """
+        Stops the motion scheduler; actions are performed straight away again.
+
+        Parameters:
+        -----------
+
+        wait : bool
+            If True (the default) the queued actions are played first,
+            otherwise they are cancelled.
+
+        Returns
+        -------
+
+        n/a
+        """
+        if self.__scheduler is not None:
+            self.__scheduler.stop(wait=wait)
+            self.__scheduler = None
+
+    @property
+    def writes_saved(self)->int:
+        """
+        Gets the number of servo writes skipped because they wouldn't have
+        changed anything, across all of the boards the limbs are on.
+        """
+        return sum(driver.writes_saved for driver in self._drivers())
+
+    def _pause(self, duration:float):
+        """
+        Sends any writes held back by the open frame, then waits; the boards
+        are free for other threads to use until the frame is opened again.
+        """
+        with contextlib.ExitStack() as stack:
+            for driver in self._drivers():
+                stack.enter_context(driver.suspend_frame())
+            with tracing.span("sleep", 'sleep', seconds=duration):
+                time.sleep(duration)
+
+    def _play(self, steps):
+        """ Runs the steps of an action, pausing between moves; returns its result """
+        while True:
+            try:
+                duration = next(steps)
+            except StopIteration as done:
+                return done.value
+            self._pause(duration)
+
+    @staticmethod
+    def _once(method, args, kwargs):
+        """ Runs an action which doesn't pause as a single step """
+        return method(*args, **kwargs)
+        yield  # pylint: disable=unreachable
+
+    def steps(self, action:str, *args, **kwargs):
+        """
+        Gets the steps of an action, without performing it.
+
+        Returns a generator which makes the moves for the action named, and
+        yields the number of seconds to pause between them; the generator
+        returns the result of the action once it is finished. This lets the
+        same actions be played without blocking, for example from asyncio.
+
+        Parameters:
+        -----------
+
+        action : str
+            The name of the action, e.g. 'forward', 'clap' or 'tap_message'
+        args
+            The parameters for the action, e.g. the number of steps
+
+        Returns
+        -------
+
+        generator
+            The steps for the action.
+        """
+        action = ACTION_ALIASES.get(action, action)
+        if action not in ACTIONS:
+            raise ValueError("Unknown action: " + str(action))
+        generator = getattr(self, '_' + action + '_steps', None)
+        if generator is not None:
+            steps = generator(*args, **kwargs)
+        else:
+            # the action itself, rather than the wrapper which queues and times it
+            method = getattr(type(self), action)
+            method = getattr(method, '__wrapped__', method)
+            steps = self._once(method, (self,) + args, kwargs)
+        return self._instrumented(action, steps, args, kwargs)
+
+    def _instrumented(self, action:str, steps, args:tuple, kwargs:dict):
+        """ Wraps the steps of an action so that it is recorded when played """
+        with self._instrument(action, args, kwargs):
+            return (yield from steps)
+
+    @contextlib.contextmanager
+    def _instrument(self, action:str, args:tuple=(), kwargs:dict=None):
+        """
+        Records the action in the command history along with how long the
+        code inside takes, and in the stats, trace and journal if they are on
+        """
+        metrics = self.__metrics
+        tracer = tracing.active()
+        entry = self.__history.append(action, args + (kwargs,) if kwargs else args)
+        recorder = journal.active()
+        if recorder is not None:
+            recorder.command(action, entry.args)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            entry.duration = end - start
+            if metrics is not None:
+                metrics.add(action, end - start)
+            if tracer is not None:
+                tracer.add(action, 'action', start, end)
+
+    @property
+    def history(self)->'CommandHistory':
+        """
+        Gets the history of the commands the robot has performed.
+
+        Every action is recorded automatically, with its parameters, when it
+        started and how long it took; only the most recent are kept.
+
+        Parameters:
+        -----------
+
+        n/a
+
+        Returns
+        -------
+
+        CommandHistory
+            The robot's command history.
+        """
+        return self.__history
+
+    def enable_stats(self, enabled:bool=True):
+        """
+        Starts (or stops) recording performance stats.
+
+        While stats are enabled, how long each action takes is recorded, and
+        for each servo board the writes to each channel, how long the bus
+        writes take and how many fail; see stats(). Stats cost next to
+        nothing while they are disabled.
+
+        Parameters:
+        -----------
+
+        enabled : bool
+            True to start recording stats, False to stop
+
+        Returns
+        -------
+
+        n/a
+        """
+        if not enabled:
+            self.__metrics = None
+        elif self.__metrics is None:
+            self.__metrics = ActionMetrics()
+        for driver in self._drivers():
+            driver.enable_metrics(enabled)
+
+    def stats(self)->dict:
+        """
+        Gets the performance stats recorded since they were enabled or reset.
+
+        Parameters:
+        -----------
+
+        n/a
+
+        Returns
+        -------
+
+        dict
+            * enabled - True if stats are being recorded
+            * actions - for each action, the count, mean and max time taken
+              (in seconds) and a histogram of the times in microseconds
+            * boards - for each board ('busnum:address'), the writes made to
+              each channel, a histogram of the bus write latency, the number
+              of writes that failed or were dropped, and the number of bus
+              transactions made and writes saved
+        """
+        metrics = self.__metrics
+        boards = {}
+        for driver in self._drivers():
+            board = driver.metrics.snapshot() if driver.metrics is not None else {}
+            board['transactions'] = driver.transactions
+            board['writes_saved'] = driver.writes_saved
+            boards["%d:%#x" % (driver.busnum, driver.address)] = board
+        return {'enabled': metrics is not None,
+                'actions': metrics.snapshot() if metrics is not None else {},
+                'boards': boards}
+
+    def reset_stats(self):
+        """
+        Clears the performance stats recorded so far.
+
+        Parameters:
+        -----------
+
+        n/a
+
+        Returns
+        -------
+
+        n/a
+        """
+        if self.__metrics is not None:
+            self.enable_stats(False)
+            self.enable_stats(True)
+
+    def enable_validation(self, enabled:bool=True):
+        """
+        Turns checking of walks, Morse messages and smooth moves on (or off).
+
+        While validation is on (the default) every frame of a compiled
+        walk, message or move is checked before the first one is sent: each
+        angle must be inside the limits of its limb, no two limbs can share a
+        channel, and no limb can be asked to turn too fast. A move which fails
+        isn't started. Validation needs NumPy, and is skipped without it.
+
+        Parameters:
+        -----------
+
+        enabled : bool
+            True to check moves before they are made, False to stop
+
+        Returns
+        -------
+
+        n/a
+        """
+        self.__validate = enabled
+
+    def _rejects(self, compiled, limbs=None, starts=None)->bool:
+        """
+        Returns True (and logs why) if a compiled move fails validation.
+
+        Gaits come from a cache, so the result of checking one is kept (for
+        the limb settings and angles it was checked from) rather than checking
+        it again on every walk.
+        """
+        if not self.__validate:
+            return False
+        try:
+            from .choreography import choreography_of, check
+        except ImportError:
+            return False
+        key = None
+        if isinstance(compiled, Gait):
+            key = (compiled, tuple(limb_key(limb) for limb in limbs),
+                   tuple(limb.angle for limb in limbs))
+        violations = self.__checked.get(key)
+        if violations is None:
+            violations = check(choreography_of(compiled, limbs, starts))
+            if key is not None:
+                if len(self.__checked) >= MAX_CHECKED:
+                    self.__checked.clear()
+                self.__checked[key] = violations
+        if violations:
+            logging.warning("Warning: the move was rejected - %s",
+                            "; ".join(violation.limb + " " + violation.problem
+                                      for violation in violations[:3]))
+            return True
+        return False
+
+    @property
+    def pose(self)->dict:
+        """
+        Gets the current pose of the Robot.
+
+        Parameters:
+        -----------
+
+        n/a
+
+        Returns
+        -------
+
+        dict
+            Returns a dictionary of limb names and the angle each limb is at.
+        """
+        return {limb.name: limb.angle for limb in self.__legs + self.__feet}
+
+    @_action
+    def apply_pose(self, pose:dict)->bool:
+        """
+        Moves a set of limbs to new angles in a single frame.
+
+        Every angle is checked before anything is moved, then all of the
+        limbs are written to the board in one bus transaction, so they all
+        start moving at the same moment.
+
+        Parameters:
+        -----------
+
+        pose : dict
+            A dictionary of limb names and angles, e.g. {'LEFT_FOOT_FRONT': 50}
+
+        Returns
+        -------
+
+        bool
+            Returns True if the pose was applied.
+            Returns False if a limb name wasn't found or an angle was outside
+            of the limits for that limb; nothing is moved.
+        """
+        limbs = {limb.name: limb for limb in self.__legs + self.__feet}
+        for limb_name, angle in pose.items():
+            limb = limbs.get(limb_name)
+            if limb is None:
+                print("Limb name not found, sorry:", limb_name)
+                return False
+            if not limb.leg_minangle <= angle <= limb.leg_maxangle:
+                logging.warning("Warning: angle %s was outside of bounds for %s",
+                                angle, limb_name)
+                return False
+
+        with self.frame():
+            for limb_name, angle in pose.items():
+                limbs[limb_name].angle = angle
+        return True
+
+    @_action
+    def move_to(self, pose:dict, duration:float=0.5, profile:str='minjerk',
+                rate:float=50)->bool:
+        """
+        Moves a set of limbs smoothly to a new pose.
+
+        Instead of jumping each servo straight to its target, the move is
+        sampled at the rate provided following a motion profile, and each
+        sample is sent as one frame. The whole trajectory is worked out up
+        front for all of the limbs at once (this needs NumPy).
+
+        Parameters:
+        -----------
+
+        pose : dict
+            A dictionary of limb names and angles, or named positions
+            (body, stretch, swing, up, down, middle), e.g.
+            {'LEFT_LEG_FRONT': 'stretch', 'LEFT_FOOT_FRONT': 60}
+        duration : float
+            How long the move should take, in seconds
+        profile : str
+            The motion profile - linear, trapezoidal or minjerk
+        rate : float
+            The number of frames per second
+
+        Returns
+        -------
+
+        bool
+            Returns True if the move was made.
+            Returns False if a limb name wasn't found or an angle was outside
+            of the limits for that limb; nothing is moved.
+        """
+        return self._play(self._move_to_steps(pose, duration, profile, rate))
+
+    def _move_to_steps(self, pose:dict, duration:float=0.5, profile:str='minjerk',
+                       rate:float=50):
+        """ The steps for move_to(), yielding the time to pause between frames """
+        from .trajectory import plan
+
+        limbs = {limb.name: limb for limb in self.__legs + self.__feet}
+        moving = []
+        targets = []
+        for limb_name, angle in pose.items():
+            limb = limbs.get(limb_name)
+            if limb is None:
+                print("Limb name not found, sorry:", limb_name)
+                return False
+            if isinstance(angle, str):
+                angle = limb.target(angle)
+            if not limb.leg_minangle <= angle <= limb.leg_maxangle:
+                logging.warning("Warning: angle %s was outside of bounds for %s",
+                                angle, limb_name)
+                return False
+            moving.append(limb)
+            targets.append(angle)
+
+        # limbs which haven't been moved within their limits yet start at the target
+        starts = [limb.angle if limb.leg_minangle <= limb.angle <= limb.leg_maxangle
+                  else target for limb, target in zip(moving, targets)]
+        trajectory = plan(moving, targets, duration, profile=profile, rate=rate, starts=starts)
+        if self._rejects(trajectory, starts=starts):
+            return False
+        yield from trajectory.play()
+        return True
+
+    @_action
+    def tap_message(self, message:str, wpm:float=DEFAULT_WPM)->bool:
         """
         Taps out a character
 
         Provide the text string you want the robot to tap out via the message parameter.
-        Make sure it is only lowercase alphabetic or numeric values. Spaces are allowed too.
-        It will convert all the text to lower case if there are any uppercase characters.
+        Letters, numbers and the usual punctuation can be used, and spaces separate
+        words. It will convert all the text to lower case if there are any uppercase
+        characters. The timing follows the ITU standard for the speed given.
 
         Parameters:
         ----------
         message : str
             This is the message to be tapped out by the Robot.
+        wpm : float
+            The speed to tap at, in words per minute (default 7)
 
         Returns
         -------
         bool
             Returns True is the message was a valid Morse code compatible
-            string (alpha-numeric characters)
+            string (alpha-numeric characters and punctuation)
 
             Returns False if the message is invalid.
         """
+        return self._play(self._tap_message_steps(message, wpm))
 
-        message = message.lower()
-        for character in message:
-            if character not in Morse.alphabet and character != " ":
-                print("Sorry the character", character, "isn't part of Morse Code, please try again")
-                return False
-        self.__feet[Channel.LEFT_FOOT_FRONT].up()
-        for character in message:
-            dot = 0.175
-            dash = 0.5
-            duration = 0.0
-            if character == " ":
-                duration = 1.5
+    def _tap_message_steps(self, message, wpm=DEFAULT_WPM):
+        """ The steps for tap_message(), yielding the time to pause between moves """
+        try:
+            schedule = compile_message(message, wpm)
+        except ValueError as error:
+            print("Sorry", error, "- please try again")
+            return False
+        foot = self.__feet[Channel.LEFT_FOOT_FRONT]
+        if self._rejects(schedule, foot):
+            print("Sorry, that is too fast to tap - please try a lower wpm")
+            return False
+        print("Tapping", schedule.code)
+        foot.up()
+        for key_down, duration in schedule.events:
+            if key_down:
+                foot.up()
             else:
-                for dot_dash in Morse.alphabet[character]:
-                    if dot_dash == '.':
-                        duration = dot
-                        print(".")
-                    if dot_dash == "-":
-                        duration = dash
-                        print("-")
-                        time.sleep(duration/2)  
-                    self.__feet[Channel.LEFT_FOOT_FRONT].up()
-                    time.sleep(duration)
-                    self.__feet[Channel.LEFT_FOOT_FRONT].down()
-                    time.sleep(0.1)
+                foot.down()
+            yield duration
         return True
 
-    def identify(self, channel:int)->str:
+    def _background(self, action:str, *args)->Future:
+        """
+        Plays an action on a new thread, returning a Future for its result.
+
+        The action holds the motion lock, so any action started after this
+        one waits for it to finish rather than moving the limbs at the same
+        time. If another action is already playing (for example from
+        asyncio, on this thread) this one waits for it instead, without
+        holding up the caller.
+        """
+        future = Future()
+        started = threading.Event()
+
+        def run():
+            if not self._motion_lock.acquire(blocking=False):
+                started.set()
+                self._motion_lock.acquire()
+            try:
+                started.set()
+                future.set_result(getattr(self, action)(*args))
+            except Exception as error:  # pylint: disable=broad-except
+                future.set_exception(error)
+            finally:
+                self._motion_lock.release()
+        threading.Thread(target=run, name="smars-" + action, daemon=True).start()
+        started.wait()
+        return future
+
+    @_timed
+    def identify(self, channel:int, board:int=None)->str:
         """
         Identies the limb by the channel passed in, returns the limb name
 
@@ -533,6 +1201,9 @@ class SmarsRobot():
         channel : int
             this is the channel you want to probe - to identify which servo
             or limb is connected to it.
+        board : int
+            the address of the PCA9685 board the channel is on, if not
+            provided any board is matched.
 
         Returns
         -------
@@ -542,22 +1213,23 @@ class SmarsRobot():
 
         """
         for limb in self.__feet:
-            if limb.channel == channel:
+            if limb.channel == channel and board in (None, limb.board):
                 print("limb found in Feet")
                 limb.identify()
                 return limb.name
         for limb in self.__legs:
-            if limb.channel == channel:
+            if limb.channel == channel and board in (None, limb.board):
                 print("limb found in Legs")
                 limb.identify()
                 return limb.name
         return "Limb not found"
 
-    def set_limb_channel(self, limb_name:str, channel:int)->bool:
+    @_timed
+    def set_limb_channel(self, limb_name:str, channel:int, board:int=None)->bool:
         """
         Sets the limb name to the channel provided, returns True if complete, False if not
 
-        This sets the channel to the limb name provided.
+        This sets the channel (and optionally the board) to the limb name provided.
 
         Parameters:
         -----------
@@ -566,6 +1238,9 @@ class SmarsRobot():
             this is the name of the limb, e.g. LEFT_LEG_FRONT
         channel : int
             this is the channel number on the PCA9685 board, e.g. channel = 0
+        board : int
+            this is the address of the PCA9685 board, e.g. board = 0x41; if
+            not provided the limb stays on its current board
 
         Returns
         -------
@@ -576,29 +1251,64 @@ class SmarsRobot():
             Returns False if the channel name was not found.
         """
 
-        index = chans.get(limb_name)
-        print(index)
-
         found = False
-        for limb in self.__legs:
+        for limb in self.__legs + self.__feet:
             if limb.name == limb_name:
-                self.__legs[index].channel = channel
-                found = True
-        for limb in self.__feet:
-            if limb.name == limb_name:
-                self.__feet[index].channel = channel
+                limb.channel = channel
+                if board is not None:
+                    limb.board = board
+                board = limb.board
                 found = True
 
         if found:
             # need to check which other limb still has this number
-            for limb in self.__legs:
-                if (limb.channel == channel) and (limb.name != limb_name):
+            for limb in self.__legs + self.__feet:
+                if (limb.channel == channel) and (limb.board == board) \
+                    and (limb.name != limb_name):
                     print("Remember to change", limb.name, "as this is still \
                         using channel", channel)
             return True
         print("Limb name not found, sorry")
         return False
 
+    @_timed
+    def calibrate(self, limb_name:str, pulse_min:int=PULSE_MIN, pulse_max:int=PULSE_MAX,
+                  curve:list=None)->bool:
+        """
+        Calibrates a limb's servo, returns True if complete, False if not
+
+        Servos differ, so the pulses which move each one to 0 and 180 degrees
+        can be measured and set here, along with an optional correction curve
+        of the pulses measured for angles in between. The calibration is
+        built into the limb's angle to pulse table, so it costs nothing when
+        the limb moves.
+
+        Parameters:
+        -----------
+
+        limb_name : str
+            this is the name of the limb, e.g. LEFT_LEG_FRONT
+        pulse_min : int
+            the pulse (PCA9685 tick count) which moves the servo to 0 degrees
+        pulse_max : int
+            the pulse which moves the servo to 180 degrees
+        curve : list
+            (angle, pulse) points measured between 0 and 180 degrees, e.g.
+            [(90, 380)], or None to go in a straight line
+
+        Returns
+        -------
+
+        bool
+            Returns True if the limb was found and calibrated.
+            Returns False if the limb name was not found.
+        """
+        for limb in self.__legs + self.__feet:
+            if limb.name == limb_name:
+                limb.calibrate(pulse_min, pulse_max, curve)
+                return True
+        print("Limb name not found, sorry")
+        return False
 
     @property
     def config(self)->dict:
@@ -609,10 +1319,12 @@ class SmarsRobot():
         These settings include:
         * name - the limb name
         * channel - the PCA9685 channel the limb.servo is connected to
+        * board - the address of the PCA9685 board the channel is on
         * invert - if the servo is upside down or not, and if the 0 - 180 degress
                    should be reversed to 180 - 0
         * min_angle - the minimum angle the servo can move to, to prevent damaging the robot
         * max_angle - the maximum angle the servo can move to
+        * pulse_min, pulse_max, curve - the servo's calibration (see calibrate)
 
         Parameters:
         ----------
@@ -632,21 +1344,116 @@ class SmarsRobot():
         for limb in self.__feet:
             temp_limb = {'name': limb.name,
                          'channel': limb.channel,
+                         'board': limb.board,
                          'invert':limb.invert,
                          'min_angle':limb.leg_minangle,
-                         'max_angle':limb.leg_maxangle
+                         'max_angle':limb.leg_maxangle,
+                         'pulse_min':limb.pulse_min,
+                         'pulse_max':limb.pulse_max,
+                         'curve':limb.calibration[2]
                          }
             limb_config.append(temp_limb)
         for limb in self.__legs:
             temp_limb = {'name': limb.name,
                          'channel': limb.channel,
+                         'board': limb.board,
                          'invert':limb.invert,
                          'min_angle':limb.leg_minangle,
-                         'max_angle':limb.leg_maxangle
+                         'max_angle':limb.leg_maxangle,
+                         'pulse_min':limb.pulse_min,
+                         'pulse_max':limb.pulse_max,
+                         'curve':limb.calibration[2]
                          }
             limb_config.append(temp_limb)
         return limb_config
 
+    def save_config(self, filename:str, compiled:bool=False):
+        """
+        Saves the limb configuration and gait profile to a JSON file.
+
+        Channel remaps (set_limb_channel), inverted feet and angle limits are
+        all saved, ready for load_config().
+
+        Parameters:
+        -----------
+
+        filename : str
+            The file to save the configuration to
+        compiled : bool
+            True to also save the tick tables and walking gaits for this
+            configuration (in filename + '.compiled'), so loading it doesn't
+            need to work them out again
+
+        Returns
+        -------
+
+        n/a
+        """
+        limbs = self.__feet + self.__legs
+        settings = config_file.make_config(limbs, self.__gait_profile)
+        config_file.save_config(filename, settings)
+        if compiled:
+            config_file.save_compiled(filename + config_file.COMPILED_SUFFIX, settings,
+                                      self.__feet, self.__legs)
+
+    def load_config(self, filename:str)->bool:
+        """
+        Loads a limb configuration and gait profile saved by save_config().
+
+        If the configuration was saved with compiled=True, the tick tables
+        and walking gaits are read back in rather than worked out again.
+
+        Parameters:
+        -----------
+
+        filename : str
+            The file the configuration was saved to
+
+        Returns
+        -------
+
+        bool
+            Returns True if the compiled tables were loaded too, False if they
+            are missing or were saved for a different configuration (they
+            will be worked out when needed).
+        """
+        settings = config_file.load_config(filename)
+        limbs = {limb.name: limb for limb in self.__feet + self.__legs}
+        for limb in settings['limbs']:
+            if limb['name'] not in limbs:
+                raise ValueError("Unknown limb in " + filename + ": " + str(limb['name']))
+        # the compiled tick tables are read first, so calibrating the limbs uses them
+        compiled = config_file.read_compiled(filename + config_file.COMPILED_SUFFIX, settings)
+        for limb in settings['limbs']:
+            config_file.apply_limb_settings(limbs[limb['name']], limb)
+        self.__gait_profile = GaitProfile.from_dict(settings['gait_profile'])
+        if compiled is None:
+            return False
+        config_file.preload_gaits(compiled, settings, self.__feet, self.__legs)
+        return True
+
+    @classmethod
+    def from_config(cls, filename:str)->'SmarsRobot':
+        """
+        Creates a robot from a configuration saved by save_config().
+
+        Parameters:
+        -----------
+
+        filename : str
+            The file the configuration was saved to
+
+        Returns
+        -------
+
+        SmarsRobot
+            The robot, with each limb on the board and bus it was saved on.
+        """
+        limbs = config_file.load_config(filename)['limbs']
+        robot = cls(busnum=limbs[0]['busnum'], address=limbs[0]['board'])
+        robot.load_config(filename)
+        return robot
+
     @property
     def debug(self)->bool:
         """
@@ -696,6 +1503,7 @@ class SmarsRobot():
         else:
             print(f"Unknown value: {value}")
 
+    @_timed
     def invert_feet(self):
         """
         Inverts the feet
@@ -719,6 +1527,7 @@ class SmarsRobot():
             else:
                 limb.invert = True
 
+    @_action
     def default(self):
         """
         Sets the limb to the default position.
@@ -766,7 +1575,9 @@ class SmarsRobot():
         Sets the robots name, used for displaying console messages.
 
         This function sets the name of the robot, and then taps out
-        the name of the Robot in Morse code.
+        the name of the Robot in Morse code. The name is tapped in the
+        background (or queued, if the motion scheduler is running), so this
+        doesn't wait for it; the next action waits for the tapping to finish.
 
         Parameters:
         -----------
@@ -781,10 +1592,15 @@ class SmarsRobot():
         """
         self.__name = name
         print("***", name, "Online ***")
-        self.tap_message(self.__name)
+        scheduler = self.scheduler
+        if scheduler is not None and scheduler.running:
+            self.tap_message(self.__name)
+        else:
+            self._background('tap_message', self.__name)
         if self.debug:
             logging.info("changed name to %s", name)
 
+    @_action
     def leg_reset(self):
         """
         Used to reset all the legs.
@@ -807,6 +1623,7 @@ class SmarsRobot():
             if self.debug:
                 print(f"setting limb {limb} to default position")
 
+    @_action
     def middle(self):
         """
         Used to position all the legs into the middle position.
@@ -828,6 +1645,7 @@ class SmarsRobot():
         for limb in self.__legs:
             limb.middle()
 
+    @_action
     def sit(self):
         """
         Used to sit the robot down.
@@ -850,6 +1668,7 @@ class SmarsRobot():
         for limb in self.__feet:
             limb.down()
 
+    @_action
     def stand(self):
         """
         Used to stand the robot up.
@@ -872,6 +1691,7 @@ class SmarsRobot():
             # self.__feet[limb].up()
             limb.up()
 
+    @_action
     def swing(self):
         """
         Moves the limb to the swing position.
@@ -890,14 +1710,19 @@ class SmarsRobot():
 
         n/a
         """
+        return self._play(self._swing_steps())
+
+    def _swing_steps(self):
+        """ The steps for swing(), yielding the time to pause between moves """
         for limb in range(0, 4):
             self.__feet[limb].down()
-            time.sleep(SLEEP_COUNT)
+            yield SLEEP_COUNT
             self.__legs[limb].swing()
-            time.sleep(SLEEP_COUNT)
+            yield SLEEP_COUNT
             self.__feet[limb].up()
-            time.sleep(SLEEP_COUNT)
+            yield SLEEP_COUNT
 
+    @_action
     def body(self):
         """
         Moves all the limbs to the body position.
@@ -916,14 +1741,19 @@ class SmarsRobot():
 
         n/a
         """
+        return self._play(self._body_steps())
+
+    def _body_steps(self):
+        """ The steps for body(), yielding the time to pause between moves """
         for limb in range(0, 4):
             self.__feet[limb].down()
-            time.sleep(SLEEP_COUNT)
+            yield SLEEP_COUNT
             self.__legs[limb].body()
-            time.sleep(SLEEP_COUNT)
+            yield SLEEP_COUNT
             self.__feet[limb].up()
-            time.sleep(SLEEP_COUNT)
+            yield SLEEP_COUNT
 
+    @_action
     def stretch(self):
         """
         Moves all the limbs to the body position.
@@ -942,57 +1772,72 @@ class SmarsRobot():
 
         n/a
         """
+        return self._play(self._stretch_steps())
+
+    def _stretch_steps(self):
+        """ The steps for stretch(), yielding the time to pause between moves """
         for limb in range(0, 4):
             self.__feet[limb].down()
-            time.sleep(SLEEP_COUNT)
+            yield SLEEP_COUNT
             self.__legs[limb].stretch()
-            time.sleep(SLEEP_COUNT)
+            yield SLEEP_COUNT
             self.__feet[limb].up()
-            time.sleep(SLEEP_COUNT)
+            yield SLEEP_COUNT
 
+    @_action
     def turnright(self):
         """
         Turns the robot to the right.
 
         """
+        return self._play(self._turnright_steps())
+
+    def _turnright_steps(self):
+        """ The steps for turnright(), yielding the time to pause between moves """
 
         chan = Channel()
 
         print(self.name, "Turning Right.")
 
         # move legs one at a time back to swing position
-        self.swing()
+        yield from self._swing_steps()
 
         # twist body
         self.__legs[chan.RIGHT_LEG_FRONT].stretch()
         self.__legs[chan.RIGHT_LEG_BACK].body()
         self.__legs[chan.LEFT_LEG_FRONT].body()
         self.__legs[chan.LEFT_LEG_BACK].stretch()
-        time.sleep(SLEEP_COUNT)
+        yield SLEEP_COUNT
 
         # move legs one at a time back to swing position
-        self.swing()
+        yield from self._swing_steps()
 
+    @_action
     def turnleft(self):
         """
         Turns the robot to the left
         """
+        return self._play(self._turnleft_steps())
+
+    def _turnleft_steps(self):
+        """ The steps for turnleft(), yielding the time to pause between moves """
         chan = Channel()
         print(self.name, "Turning left.")
 
         # move legs one at a time back to swing position
-        self.swing()
+        yield from self._swing_steps()
 
         # twist body
         self.__legs[chan.LEFT_LEG_FRONT].stretch()
         self.__legs[chan.LEFT_LEG_BACK].body()
         self.__legs[chan.RIGHT_LEG_FRONT].body()
         self.__legs[chan.RIGHT_LEG_BACK].stretch()
-        time.sleep(SLEEP_COUNT)
+        yield SLEEP_COUNT
 
         # move legs one at a time back to swing position
-        self.swing()
+        yield from self._swing_steps()
 
+    @_action
     def forward(self, steps:int=None):
         """
         Move the Robot Forward.
@@ -1015,6 +1860,7 @@ class SmarsRobot():
             steps = 1
         self.walkforward(steps)
 
+    @_action
     def backward(self, steps:int=None):
         """
         Move the Robot Backward
@@ -1054,6 +1900,7 @@ class SmarsRobot():
         print("default()")
         print("tap_message(<the message to tap in Morse Code>)")
 
+    @_action
     def walkforward(self, steps:int=None):
         """
         Used to move the robot forward
@@ -1071,52 +1918,27 @@ class SmarsRobot():
         -------
 
         n/a
+            Returns False, without moving, if the walk fails validation
+            (see enable_validation).
         """
+        return self._play(self._walkforward_steps(steps))
+
+    def _walkforward_steps(self, steps=None):
+        """ The steps for walkforward(), yielding the time to pause between moves """
 
         print("Moving Forward")
 
         if steps is None:
             steps = 1
 
-        # include the global variables
-        chan = Channel()
-
-        # set the legs to the correct position for walking.
-        self.sit()
-        self.__legs[chan.LEFT_LEG_FRONT].body()
-        self.__legs[chan.LEFT_LEG_BACK].body()
-        self.__legs[chan.RIGHT_LEG_FRONT].swing()
-        self.__legs[chan.RIGHT_LEG_BACK].swing()
-        self.stand()
-
-        # the walking cycle, loops for the number of steps provided.
-        current_step = 0
-        while current_step < steps:
-            current_step += 1
-
-            for tick_count in range(0, 4):
-                if not self.__legs[tick_count].tick():
-                    self.__legs[tick_count].tick()
-                else:
-                    self.__feet[tick_count].down()
-                    time.sleep(SLEEP_COUNT)
-
-                    if not self.__legs[tick_count].invert:
-                        # if self.__legs[tick_count].name == "LEFT_LEG_BACK":
-                        if self.__legs[tick_count].name == "RIGHT_LEG_FRONT":
-                            self.__legs[tick_count].stretch()
-                        else:
-                            self.__legs[tick_count].body()
-                    elif self.__legs[tick_count].invert:
-                        # if self.__legs[tick_count].name == "LEFT_LEG_FRONT":
-                        if self.__legs[tick_count].name == "RIGHT_LEG_BACK":
-                            self.__legs[tick_count].body()
-                        else:
-                            self.__legs[tick_count].stretch()
-                    time.sleep(SLEEP_COUNT)
-                    self.__feet[tick_count].up()
-                    time.sleep(SLEEP_COUNT)
+        # the walking cycle is compiled once for the limb configuration, and
+        # then played for the number of steps provided.
+        gait = compile_gait(FORWARD, self.__feet, self.__legs, profile=self.__gait_profile)
+        if self._rejects(gait, self.__feet + self.__legs):
+            return False
+        yield from gait.play(self.__feet + self.__legs, steps)
 
+    @_action
     def walkbackward(self, steps):
         """
         Used to move the robot backward.
@@ -1134,52 +1956,27 @@ class SmarsRobot():
         -------
 
         n/a
+            Returns False, without moving, if the walk fails validation
+            (see enable_validation).
 
         """
+        return self._play(self._walkbackward_steps(steps))
+
+    def _walkbackward_steps(self, steps=None):
+        """ The steps for walkbackward(), yielding the time to pause between moves """
         print("Moving Backward")
 
         if steps is None:
             steps = 1
 
-        # include the global variables
-        chan = Channel()
-
-        # set the legs to the correct position for walking.
-        self.sit()
-        self.__legs[chan.LEFT_LEG_FRONT].body()
-        self.__legs[chan.LEFT_LEG_BACK].body()
-        self.__legs[chan.RIGHT_LEG_FRONT].swing()
-        self.__legs[chan.RIGHT_LEG_BACK].swing()
-        self.stand()
-
-        # the walking cycle, loops for the number of steps provided.
-        current_step = 0
-        while current_step < steps:
-            current_step += 1
-            for tick_count in range(0, 4):
-                if not self.__legs[tick_count].untick():
-                    # print self.name, "walking, step", currentStep, "of", steps
-                    self.__legs[tick_count].untick()
-                else:
-                    # print "moving leg:", self.legs[n].name
-                    self.__feet[tick_count].down()
-                    time.sleep(SLEEP_COUNT)
-
-                    # change this to left and right legs, rather than invert or not invert
-                    if not self.__legs[tick_count].invert:
-                        if self.__legs[tick_count].name == "LEFT_LEG_BACK":
-                            self.__legs[tick_count].stretch()
-                        else:
-                            self.__legs[tick_count].body()
-                    elif self.__legs[tick_count].invert:
-                        if self.__legs[tick_count].name == "LEFT_LEG_FRONT":
-                            self.__legs[tick_count].body()
-                        else:
-                            self.__legs[tick_count].stretch()
-                    time.sleep(SLEEP_COUNT)
-                    self.__feet[tick_count].up()
-                    time.sleep(SLEEP_COUNT)
+        # the walking cycle is compiled once for the limb configuration, and
+        # then played for the number of steps provided.
+        gait = compile_gait(BACKWARD, self.__feet, self.__legs, profile=self.__gait_profile)
+        if self._rejects(gait, self.__feet + self.__legs):
+            return False
+        yield from gait.play(self.__feet + self.__legs, steps)
 
+    @_action
     def clap(self, clap_count:int=None):
         """
         Clap front two hands (the sound of two hands clapping).
@@ -1197,6 +1994,10 @@ class SmarsRobot():
 
         n/a
         """
+        return self._play(self._clap_steps(clap_count))
+
+    def _clap_steps(self, clap_count=None):
+        """ The steps for clap(), yielding the time to pause between moves """
         chan = Channel()
 
         print("Clapping")
@@ -1210,12 +2011,13 @@ class SmarsRobot():
         for _ in range(0, clap_count):
             self.__legs[chan.LEFT_LEG_FRONT].body()
             self.__legs[chan.RIGHT_LEG_FRONT].body()
-            time.sleep(SLEEP_COUNT * 2)
+            yield SLEEP_COUNT * 2
             self.__legs[chan.LEFT_LEG_FRONT].stretch()
             self.__legs[chan.RIGHT_LEG_FRONT].stretch()
-            time.sleep(SLEEP_COUNT * 2)
+            yield SLEEP_COUNT * 2
         self.stand()
 
+    @_action
     def wiggle(self, wiggle_count:int=None):
         """
         Performs a cheeky Wiggle butt Action
@@ -1234,6 +2036,10 @@ class SmarsRobot():
         
         n/a
         """
+        return self._play(self._wiggle_steps(wiggle_count))
+
+    def _wiggle_steps(self, wiggle_count=None):
+        """ The steps for wiggle(), yielding the time to pause between moves """
         print("Wiggling")
 
         if wiggle_count is None:
@@ -1244,15 +2050,15 @@ class SmarsRobot():
         self.sit()
         self.__legs[chan.LEFT_FOOT_BACK].up()
         self.__legs[chan.RIGHT_FOOT_BACK].up()
-        time.sleep(SLEEP_COUNT * 5)
+        yield SLEEP_COUNT * 5
 
         for _ in range(0, wiggle_count):
             self.__legs[chan.LEFT_LEG_BACK].body()
             self.__legs[chan.RIGHT_LEG_BACK].stretch()
-            time.sleep(SLEEP_COUNT * 5)
+            yield SLEEP_COUNT * 5
             self.__legs[chan.LEFT_LEG_BACK].stretch()
             self.__legs[chan.RIGHT_LEG_BACK].body()
-            time.sleep(SLEEP_COUNT * 5)
+            yield SLEEP_COUNT * 5
         self.stand()
 
     def get_telemetry(self):
@@ -1260,7 +2066,7 @@ class SmarsRobot():
         Returns a list of limbs and measurements.
 
         This is used to provide detailed meaurements for each limb; the current angle
-        the limb is set to.
+        the limb is set to. For streaming telemetry, see the telemetry property.
 
         Parameters:
         -----------
@@ -1278,59 +2084,270 @@ class SmarsRobot():
         telemetry.append(["right_leg_front", self.__legs[chan.RIGHT_LEG_FRONT].angle])
         telemetry.append(["left_leg_back", self.__legs[chan.LEFT_LEG_BACK].angle])
         telemetry.append(["right_leg_back", self.__legs[chan.RIGHT_LEG_BACK].angle])
-        telemetry.append(["left_foot_front", self.__legs[chan.LEFT_FOOT_FRONT].angle])
-        telemetry.append(["right_foot_front", self.__legs[chan.RIGHT_FOOT_FRONT].angle])
-        telemetry.append(["left_foot_back", self.__legs[chan.LEFT_FOOT_BACK].angle])
-        telemetry.append(["right_foot_back", self.__legs[chan.RIGHT_FOOT_BACK].angle])
+        telemetry.append(["left_foot_front", self.__feet[chan.LEFT_FOOT_FRONT].angle])
+        telemetry.append(["right_foot_front", self.__feet[chan.RIGHT_FOOT_FRONT].angle])
+        telemetry.append(["left_foot_back", self.__feet[chan.LEFT_FOOT_BACK].angle])
+        telemetry.append(["right_foot_back", self.__feet[chan.RIGHT_FOOT_BACK].angle])
         return telemetry
 
+    @property
+    def telemetry(self):
+        """
+        Gets the live telemetry for the limbs.
+
+        The first time this is used a Telemetry is set up with a row for each
+        limb (in the same order as config); from then on every pulse sent to
+        a limb updates its row with the angle, pulse and time. Needs NumPy.
+
+        Parameters:
+        -----------
+
+        n/a
+
+        Returns
+        -------
+
+        Telemetry
+            The robot's telemetry; see Telemetry.snapshot() and stream().
+        """
+        if self.__telemetry is None:
+            from .telemetry import Telemetry
+            limbs = self.__feet + self.__legs
+            telemetry = Telemetry(limbs)
+            for row, limb in enumerate(limbs):
+                limb.attach_telemetry(telemetry, row)
+            self.__telemetry = telemetry
+        return self.__telemetry
+
+    @property
+    def kinematics(self):
+        """
+        Gets the forward kinematics for the robot's limbs, which work out
+        where the feet are for whole arrays of poses at once. Needs NumPy.
+
+        Parameters:
+        -----------
+
+        n/a
+
+        Returns
+        -------
+
+        Kinematics
+            The kinematics, with a column for each limb in the same order as
+            config; see Kinematics.feet() and support_margin().
+        """
+        if self.__kinematics is None:
+            from .kinematics import Kinematics
+            self.__kinematics = Kinematics(self.__feet + self.__legs)
+        return self.__kinematics
+
+    @property
+    def gait_profile(self)->GaitProfile:
+        """
+        Gets the timing used by walkforward() and walkbackward().
+
+        Parameters:
+        -----------
+
+        n/a
+
+        Returns
+        -------
+
+        GaitProfile
+            The leg increment, the pauses between the phases of each step and
+            the order the legs move in.
+        """
+        return self.__gait_profile
+
+    @gait_profile.setter
+    def gait_profile(self, profile:GaitProfile):
+        """ Sets the timing used by walkforward() and walkbackward() """
+        if not isinstance(profile, GaitProfile):
+            raise TypeError("gait_profile must be a GaitProfile")
+        self.__gait_profile = profile
+
+    def load_gait_profile(self, filename:str)->GaitProfile:
+        """
+        Loads the gait profile saved in a JSON file, such as the one written
+        by the gait tuner (python -m smars_library.tuning), and walks with it
+        from now on.
+
+        Parameters:
+        -----------
+
+        filename : str
+            The gait profile file
+
+        Returns
+        -------
+
+        GaitProfile
+            The profile loaded.
+        """
+        self.__gait_profile = GaitProfile.load(filename)
+        return self.__gait_profile
+
+    def publish(self, name:str=None, slots:int=None):
+        """
+        Publishes the live limb state and recent frames into shared memory.
+
+        Only the frames sent to this robot's own boards are published, so
+        several robots in one process can each be published. Other processes
+        can read them with shared_state.SharedStateReader using the name of
+        the publisher, without calling into this one. Needs NumPy.
+
+        Parameters:
+        -----------
+
+        name : str
+            The name of the shared memory, or None to make one up
+        slots : int
+            The number of recent frames to keep (default 64)
+
+        Returns
+        -------
+
+        SharedStatePublisher
+            The publisher; close() it to stop publishing.
+        """
+        from .shared_state import SharedStatePublisher, DEFAULT_SLOTS
+        return SharedStatePublisher(self.telemetry, name,
+                                    DEFAULT_SLOTS if slots is None else slots, self._boards)
+
+DEFAULT_HISTORY_SIZE = 1000   # the number of commands kept in a CommandHistory
+NEW_HISTORY = "*** new history ***"
+
+
+class HistoryEntry():
+    """ A command in the command history """
+    __slots__ = ('command', 'args', 'start', 'duration')
+
+    def __init__(self, command:str, args:tuple=(), start:float=None, duration:float=None):
+        self.command = command
+        self.args = args
+        self.start = time.time() if start is None else start   # seconds since the epoch
+        self.duration = duration    # seconds, or None if it hasn't finished
+
+    def __repr__(self):
+        return "HistoryEntry(%r, %r, %r, %r)" % (self.command, self.args, self.start,
+                                                 self.duration)
+
+
 class CommandHistory():
     """
     Models the command history object
 
     This class can be used to capture each of the commands the Robot has performed
-    into a list so that this can be displayed or used later.
-    """
+    so that they can be displayed or used later. Each command is kept with its
+    parameters, the time it started and how long it took.
 
-    # Private property History
-    __history = []
+    Only the most recent commands are kept; once the history is full, each new
+    command replaces the oldest one.
+    """
 
-    def __init__(self):
+    def __init__(self, size:int=DEFAULT_HISTORY_SIZE):
         """ Initialises the CommandHistory Class
+
+        Parameters:
+        -----------
+
+        size : int
+            The number of commands to keep
         """
-        self.__history.append("*** new history ***")
+        if size < 1:
+            raise ValueError("The history must hold at least one command")
+        self.__entries = [None] * size
+        self.__next = 0       # the slot the next command goes in
+        self.__count = 0
+        self.__lock = threading.Lock()
+        self.append(NEW_HISTORY)
 
-    def append(self, command:str):
+    def __len__(self):
+        return self.__count
+
+    @property
+    def size(self)->int:
+        """ Returns the number of commands the history can hold """
+        return len(self.__entries)
+
+    def append(self, command:str, args:tuple=(), start:float=None,
+               duration:float=None)->HistoryEntry:
         """ Adds a command to the command history
 
-        Appends a command passed via the command parameter to the history list.
+        Appends a command passed via the command parameter to the history,
+        replacing the oldest command if the history is full.
 
         Parameters:
         -----------
 
         command : str
-            The command to be appended to the history list
+            The command to be appended to the history
+        args : tuple
+            The parameters the command was given
+        start : float
+            When the command started (from time.time()), default now
+        duration : float
+            How long the command took in seconds, if it has finished
 
         Returns
         -------
 
-        n/a
+        HistoryEntry
+            The entry added; its duration can be filled in once the command ends
         """
-        self.__history.append(command)
+        entry = HistoryEntry(command, args, start, duration)
+        with self.__lock:
+            entries = self.__entries
+            entries[self.__next] = entry
+            self.__next = (self.__next + 1) % len(entries)
+            if self.__count < len(entries):
+                self.__count += 1
+        return entry
 
     def clear(self):
         """ clears the command history
-        
+
         This function wipes the command history.
         """
-        self.__history = []
+        with self.__lock:
+            self.__entries = [None] * len(self.__entries)
+            self.__next = 0
+            self.__count = 0
+
+    def last(self, count:int)->list:
+        """ Gets the most recent commands
+
+        Parameters:
+        -----------
+
+        count : int
+            The number of commands to get
+
+        Returns
+        -------
+
+        list
+            Up to count HistoryEntry objects, oldest first
+        """
+        with self.__lock:
+            entries = self.__entries
+            count = max(0, min(count, self.__count))
+            return [entries[(self.__next - count + index) % len(entries)]
+                    for index in range(count)]
+
+    @property
+    def entries(self)->list:
+        """ Gets all of the HistoryEntry objects held, oldest first """
+        return self.last(self.__count)
 
     @property
     def history(self):
         """ Gets all command history """
-        return self.__history
+        return [entry.command for entry in self.entries]
 
     @property
     def last_ten(self):
         """ Get last 10 command history """
-        return self.__history[-10:]
+        return [entry.command for entry in self.last(10)]
@@ -0,0 +1,101 @@
+""" Streaming telemetry for the SMARS robot
+
+The state of every limb - the angle it was last commanded to, the pulse sent
+and when - is kept in one preallocated NumPy structured array, updated in
+place each time a limb is sent a pulse. Reading it costs nothing: snapshot()
+returns a read only view of the live array, and stream() yields copies at a
+fixed rate for logging and dashboards.
+
+    telemetry = robot.telemetry
+    print(telemetry.snapshot()['angle'])
+    for sample in telemetry.stream(rate=20, count=100):
+        log(sample)
+
+This needs NumPy, which is installed separately (pip install numpy).
+"""
+import time
+
+import numpy as np
+
+TELEMETRY_DTYPE = np.dtype([('name', 'U16'),      # the limb name
+                            ('busnum', 'u1'),
+                            ('board', 'u1'),      # the board address
+                            ('channel', 'u1'),
+                            ('angle', 'f8'),      # the angle last commanded
+                            ('pulse', 'u2'),      # the pulse last sent (ticks)
+                            ('written', 'f8'),    # when it was sent (time.time())
+                            ('writes', 'u4')])    # the number of pulses sent
+
+
+class Telemetry():
+    """
+    The live state of a set of limbs, one row per limb.
+
+    Limbs are attached with attach(), after which every pulse they are sent
+    updates their row.
+    """
+
+    def __init__(self, limbs:list):
+        self.__array = np.zeros(len(limbs), dtype=TELEMETRY_DTYPE)
+        self.__angle = self.__array['angle']
+        self.__pulse = self.__array['pulse']
+        self.__written = self.__array['written']
+        self.__writes = self.__array['writes']
+        self.__rows = {}
+        for row, limb in enumerate(limbs):
+            self.__array[row] = (limb.name, limb.busnum, limb.board, limb.channel,
+                                 limb.angle, limb.pulse(limb.angle), 0.0, 0)
+            self.__rows[limb.name] = row
+
+    def __len__(self):
+        return len(self.__array)
+
+    def row(self, name:str)->int:
+        """ Returns the row number of the limb named """
+        return self.__rows[name]
+
+    def record(self, row:int, angle:float, pulse:int):
+        """ Records a pulse sent to the limb in the row provided """
+        self.__angle[row] = angle
+        self.__pulse[row] = pulse
+        self.__written[row] = time.time()
+        self.__writes[row] += 1
+
+    def snapshot(self):
+        """
+        Returns a read only view of the live telemetry array.
+
+        No data is copied, so the view always shows the latest values; use
+        sample() for a copy which doesn't change.
+        """
+        view = self.__array.view()
+        view.flags.writeable = False
+        return view
+
+    def sample(self):
+        """ Returns a copy of the telemetry array as it is now """
+        return self.__array.copy()
+
+    def stream(self, rate:float=10, count:int=None):
+        """
+        Yields a sample() of the telemetry rate times a second.
+
+        The samples are taken on fixed deadlines, so the rate doesn't drift
+        with the time taken by the caller; if the caller falls more than a
+        period behind, samples are skipped rather than bunched up. Yields
+        count samples, or carries on for ever if count is None.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        period = 1.0 / rate
+        deadline = time.perf_counter()
+        taken = 0
+        while count is None or taken < count:
+            remaining = deadline - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+            elif remaining < -period:
+                deadline = time.perf_counter()
+            yield self.sample()
+            taken += 1
+            deadline += period
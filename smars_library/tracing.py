@@ -0,0 +1,102 @@
+""" Timeline tracing for the SMARS library
+
+Tracing records what the robot spends its time on as nested spans:
+
+* action - a SmarsRobot action, e.g. walkforward
+* step - one step of a gait
+* limb - a limb being sent a new pulse
+* bus - a block write to a servo board
+* sleep - a pause between moves
+
+The spans are exported as Chrome trace event JSON, which can be opened in
+chrome://tracing or https://ui.perfetto.dev to find where a walk stalls:
+
+    with trace("walk.json"):
+        robot.walkforward(20)
+
+Tracing is off unless a trace() is open, and then costs next to nothing.
+"""
+import os
+import json
+import time
+import threading
+import contextlib
+
+_TRACER = None      # the Tracer being recorded to, if any
+
+
+class Tracer():
+    """ Records spans as Chrome trace events """
+
+    def __init__(self):
+        self.events = []
+        self.__start = time.perf_counter()
+        self.__pid = os.getpid()
+        self.__threads = {}
+
+    @contextlib.contextmanager
+    def span(self, name:str, category:str, **args):
+        """ Records the code inside as a span """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, time.perf_counter(), args)
+
+    def add(self, name:str, category:str, start:float, end:float, args:dict=None):
+        """ Records a span which started and ended at the perf_counter() times provided """
+        thread = threading.get_ident()
+        if thread not in self.__threads:
+            self.__threads[thread] = threading.current_thread().name
+        event = {'name': name, 'cat': category, 'ph': 'X',
+                 'ts': (start - self.__start) * 1000000,
+                 'dur': (end - start) * 1000000,
+                 'pid': self.__pid, 'tid': thread}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def spans(self, category:str=None)->list:
+        """ Returns the spans recorded, optionally just those in one category """
+        return [event for event in self.events if category in (None, event['cat'])]
+
+    def to_dict(self)->dict:
+        """ Returns the trace in Chrome trace event format """
+        names = [{'name': 'thread_name', 'ph': 'M', 'pid': self.__pid, 'tid': thread,
+                  'args': {'name': name}} for thread, name in self.__threads.items()]
+        return {'traceEvents': names + list(self.events), 'displayTimeUnit': 'ms'}
+
+    def save(self, filename:str):
+        """ Writes the trace to a JSON file """
+        with open(filename, "w", encoding="utf-8") as output:
+            json.dump(self.to_dict(), output)
+
+
+def active()->Tracer:
+    """ Returns the Tracer being recorded to, or None if tracing is off """
+    return _TRACER
+
+
+@contextlib.contextmanager
+def trace(filename:str=None):
+    """
+    Traces everything the robot does inside the with block, returning the
+    Tracer; the trace is also saved to filename, if one is given.
+    """
+    global _TRACER  # pylint: disable=global-statement
+    tracer = Tracer()
+    previous, _TRACER = _TRACER, tracer
+    try:
+        yield tracer
+    finally:
+        _TRACER = previous
+        if filename is not None:
+            tracer.save(filename)
+
+
+def span(name:str, category:str, **args):
+    """ Returns a context manager recording a span, if tracing is on """
+    tracer = _TRACER
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.span(name, category, **args)
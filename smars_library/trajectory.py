@@ -0,0 +1,131 @@
+""" Smooth trajectories for the SMARS robot
+
+Rather than jumping a servo straight to its new angle (which causes current
+spikes and mechanical shock), a move from one pose to another can be turned
+into a trajectory: the angle of every limb sampled at a fixed rate, following
+a motion profile.
+
+* linear - constant speed from start to end
+* trapezoidal - speeds up, cruises, then slows down
+* minjerk - the minimum jerk profile, smooth from start to finish
+
+The samples for all limbs are worked out at once with NumPy (which needs to be
+installed, pip install numpy) and converted into pulses ready to be streamed
+out a frame at a time.
+"""
+import numpy as np
+
+from .pulse import limb_angles_to_ticks
+
+LINEAR = 'linear'
+TRAPEZOIDAL = 'trapezoidal'
+MINJERK = 'minjerk'
+PROFILES = (LINEAR, TRAPEZOIDAL, MINJERK)
+
+DEFAULT_RATE = 50          # samples per second
+TRAPEZOID_RAMP = 0.25      # the fraction of the move spent speeding up (and slowing down)
+
+
+def progress(profile:str, samples:int, ramp:float=TRAPEZOID_RAMP):
+    """
+    Returns how far through the move (0 - 1) each sample is, for the profile
+    named. The last sample is always at the end of the move.
+    """
+    time = np.arange(1, samples + 1, dtype=float) / samples
+    if profile == LINEAR:
+        return time
+    if profile == MINJERK:
+        return time ** 3 * (10 - 15 * time + 6 * time ** 2)
+    if profile == TRAPEZOIDAL:
+        if not 0 < ramp <= 0.5:
+            raise ValueError("ramp must be between 0 and 0.5")
+        speed = 1 / (1 - ramp)
+        return np.where(time < ramp, speed * time ** 2 / (2 * ramp),
+                        np.where(time <= 1 - ramp, speed * (time - ramp / 2),
+                                 1 - speed * (1 - time) ** 2 / (2 * ramp)))
+    raise ValueError("Unknown profile: " + str(profile))
+
+
+class Trajectory():
+    """
+    A move of several limbs, sampled at a fixed rate.
+
+    angles and ticks are arrays of shape (samples, limbs), with a column for
+    each of the limbs in turn.
+    """
+    __slots__ = ('limbs', 'angles', 'ticks', 'interval')
+
+    def __init__(self, limbs:list, angles, interval:float):
+        self.limbs = limbs
+        self.angles = angles
+        self.ticks = limb_angles_to_ticks([limb.tick_table for limb in limbs], angles)
+        self.interval = interval
+
+    @property
+    def samples(self)->int:
+        """ Returns the number of samples in the trajectory """
+        return len(self.angles)
+
+    @property
+    def duration(self)->float:
+        """ Returns how long the move takes, in seconds """
+        return self.samples * self.interval
+
+    def play(self):
+        """
+        Sends each sample to the limbs in turn, yielding the pause between them.
+
+        When the generator finishes (or is closed part way through) each limb
+        is left at the angle of the last sample sent.
+        """
+        sends = [limb.send for limb in self.limbs]
+        last = None
+        try:
+            for sample, (ticks, angles) in enumerate(zip(self.ticks.tolist(),
+                                                         self.angles.tolist())):
+                for send, tick, angle in zip(sends, ticks, angles):
+                    send(tick, angle)
+                last = sample
+                yield self.interval
+        finally:
+            if last is not None:
+                for limb, angle in zip(self.limbs, self.angles[last].tolist()):
+                    limb.restore(angle, angle)
+
+
+def plan(limbs:list, targets:list, duration:float, profile:str=MINJERK,
+         rate:float=DEFAULT_RATE, starts:list=None)->Trajectory:
+    """
+    Plans a move of the limbs provided to their target angles.
+
+    Parameters:
+    -----------
+
+    limbs : list
+        The limbs to move
+    targets : list
+        The angle to move each limb to
+    duration : float
+        How long the move should take, in seconds
+    profile : str
+        The motion profile, one of linear, trapezoidal or minjerk
+    rate : float
+        The number of samples per second
+    starts : list
+        The angle each limb starts from, by default the angle it is at now
+
+    Returns
+    -------
+
+    Trajectory
+        The sampled move, for all of the limbs at once.
+    """
+    if rate <= 0:
+        raise ValueError("rate must be greater than 0")
+    if starts is None:
+        starts = [limb.angle for limb in limbs]
+    samples = max(int(round(duration * rate)), 1)
+    start = np.asarray(starts, dtype=float)
+    end = np.asarray(targets, dtype=float)
+    angles = start + np.outer(progress(profile, samples), end - start)
+    return Trajectory(limbs, angles, duration / samples)
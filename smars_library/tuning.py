@@ -0,0 +1,193 @@
+""" Offline gait tuning for the SMARS robot
+
+Finds the gait profile (see gait.GaitProfile) that walks the robot fastest
+without tipping it over. Each candidate profile is compiled into its gait
+table and scored against a simple kinematic model of the robot, rather than
+the real one, so thousands of profiles can be tried in a few seconds; the
+candidates are shared out across a process pool, whose workers use the
+simulated servo boards so nothing can reach real hardware.
+
+    python -m smars_library.tuning --output gait.json
+
+    robot.load_gait_profile("gait.json")
+
+The model is deliberately rough. The poses of the walk are put through the
+forward kinematics (see kinematics.py): when the legs of feet on the ground
+turn, the body moves the opposite way by the average distance those feet
+moved. The servos turn at SERVO_SPEED, so a pause shorter than a move takes
+as long as the move. The robot is stable while at least three feet are on the
+ground and its centre is inside them. A profile scores its speed (mm per
+second) times the fraction of the time it was stable.
+
+This needs NumPy, which is installed separately (pip install numpy).
+"""
+import argparse
+import itertools
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .driver import DEFAULT_BUSNUM
+from .gait import compile_gait, GaitProfile, FORWARD, BACKWARD, STATE_SIZE, LEG_ORDER
+from .kinematics import Kinematics, DEFAULT_GEOMETRY, SERVO_SPEED
+
+DEFAULT_STEPS = 40      # the steps walked when a profile is scored
+
+# the values tried by default, kept small enough to search in a few seconds
+INCREMENTS = (2, 4, 6)
+PAUSES = (0.02, 0.05, 0.15)
+TICK_PAUSES = (0.0,)
+ORDERS = tuple(itertools.permutations(LEG_ORDER))
+
+GaitScore = collections.namedtuple('GaitScore', ['profile', 'distance', 'seconds',
+                                                 'speed', 'stability', 'score'])
+GaitScore.__doc__ = """
+How well a gait profile walked: the distance walked (mm), how long it took
+(seconds), the speed (mm per second, in the direction of the walk), the
+fraction of the time the robot was stable, and the score (speed times
+stability, or 0 if the robot went the wrong way).
+"""
+
+_LIMBS = None   # the limbs scored by each worker, set by _start_worker()
+
+
+def robot_limbs(robot=None)->tuple:
+    """
+    Returns the feet and legs of a robot (a new SmarsRobot if None) as
+    (feet, legs) keys, which can be sent to another process.
+    """
+    if robot is None:
+        from .smars_library import SmarsRobot
+        robot = SmarsRobot()
+    keys = tuple((limb['name'], limb['channel'], limb['min_angle'], limb['max_angle'],
+                  limb['invert'], limb['board'], DEFAULT_BUSNUM,
+                  (limb['pulse_min'], limb['pulse_max'], limb['curve'])) for limb in robot.config)
+    return keys[:4], keys[4:]
+
+
+def _moves(gait, steps:int)->tuple:
+    """
+    Returns the keyframes a walk stops at - the one where the robot is ready
+    to walk, and then the end of each move - and the pause after each.
+    Keyframes with no pause are merged into the move after them, as the
+    servos are sent them all at once.
+    """
+    keyframes = [gait.keyframe_range(0)[-1]]
+    delays = [0.0]
+    last = keyframes[0]
+    for segment in gait.segments(steps):
+        if segment == 0:
+            continue
+        for keyframe in gait.keyframe_range(segment):
+            last = keyframe
+            if gait.delays[keyframe]:
+                keyframes.append(keyframe)
+                delays.append(gait.delays[keyframe])
+    if keyframes[-1] != last:
+        keyframes.append(last)
+        delays.append(0.0)
+    return keyframes, delays
+
+
+def evaluate(profile:GaitProfile, limbs:tuple=None, steps:int=DEFAULT_STEPS,
+             direction:str=FORWARD, geometry=DEFAULT_GEOMETRY)->GaitScore:
+    """
+    Scores a gait profile against the kinematic model, walking the number of
+    steps given. The limbs are (feet, legs) as returned by robot_limbs(),
+    the default robot's if None.
+    """
+    if limbs is None:
+        limbs = _LIMBS if _LIMBS is not None else robot_limbs()
+    from .smars_library import Leg
+    feet, legs = ([Leg(*key) for key in keys] for keys in limbs)
+    gait = compile_gait(direction, feet, legs, profile=profile)
+    kinematics = Kinematics(feet + legs, geometry)
+
+    keyframes, delays = _moves(gait, steps)
+    states = np.frombuffer(gait.states).reshape(-1, gait.limb_count, STATE_SIZE)
+    angles = states[keyframes, :, 0]
+    delays = np.array(delays[1:])
+    move = np.abs(np.diff(angles, axis=0)).max(axis=1) / SERVO_SPEED
+    durations = np.maximum(delays, move)
+    stable = kinematics.support_margin(angles[1:]) >= 0
+    unstable = np.where(stable, np.maximum(move - delays, 0.0), durations).sum()
+    seconds = float(durations.sum())
+    distance = float(kinematics.body_motion(angles).sum())
+
+    if direction == BACKWARD:
+        distance = -distance
+    speed = distance / seconds if seconds else 0.0
+    stability = 1.0 - float(unstable) / seconds if seconds else 0.0
+    return GaitScore(profile, distance, seconds, speed, stability, max(speed, 0.0) * stability)
+
+
+def candidates(increments=INCREMENTS, pauses=PAUSES, tick_pauses=TICK_PAUSES, orders=ORDERS):
+    """ Yields every gait profile made from the values provided """
+    for increment, down, swing, up, tick, order in itertools.product(
+            increments, pauses, pauses, pauses, tick_pauses, orders):
+        yield GaitProfile(increment, down, swing, up, tick, tuple(order))
+
+
+def _start_worker(limbs:tuple):
+    """ Sets up a tuning worker process, on the simulated servo boards """
+    global _LIMBS    # pylint: disable=global-statement
+    from .simulator import use_simulator
+    use_simulator()
+    _LIMBS = limbs
+
+
+def _evaluate(arguments:tuple)->GaitScore:
+    """ Scores a profile in a worker process """
+    profile, steps, direction = arguments
+    return evaluate(profile, _LIMBS, steps, direction)
+
+
+def tune(profiles=None, limbs:tuple=None, steps:int=DEFAULT_STEPS, direction:str=FORWARD,
+         workers:int=None, output:str=None)->list:
+    """
+    Scores gait profiles across a pool of worker processes, returning their
+    GaitScores best first. The profiles tried are candidates() by default.
+
+    If output is a filename, the best profile is saved there, ready for
+    SmarsRobot.load_gait_profile().
+    """
+    if profiles is None:
+        profiles = candidates()
+    if limbs is None:
+        limbs = robot_limbs()
+    jobs = [(profile, steps, direction) for profile in profiles]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker,
+                             initargs=(limbs,)) as pool:
+        scores = list(pool.map(_evaluate, jobs, chunksize=max(1, len(jobs) // 64)))
+    scores.sort(key=lambda score: score.score, reverse=True)
+    if output is not None and scores:
+        scores[0].profile.save(output)
+    return scores
+
+
+def main(argv=None):
+    """ Runs the gait tuner from the command line """
+    parser = argparse.ArgumentParser(description="Search for the best SMARS gait profile")
+    parser.add_argument("--output", default="gait.json", help="where to save the best profile")
+    parser.add_argument("--direction", choices=(FORWARD, BACKWARD), default=FORWARD)
+    parser.add_argument("--steps", type=int, default=DEFAULT_STEPS,
+                        help="the steps walked to score each profile")
+    parser.add_argument("--increments", type=int, nargs="+", default=INCREMENTS,
+                        help="the leg increments (degrees) to try")
+    parser.add_argument("--pauses", type=float, nargs="+", default=PAUSES,
+                        help="the pauses (seconds) to try between phases")
+    parser.add_argument("--workers", type=int, help="the number of processes to use")
+    parser.add_argument("--top", type=int, default=5, help="the number of results to print")
+    args = parser.parse_args(argv)
+
+    scores = tune(candidates(args.increments, args.pauses), steps=args.steps,
+                  direction=args.direction, workers=args.workers, output=args.output)
+    for score in scores[:args.top]:
+        print("%.1f mm/s, %.0f%% stable: %s" % (score.speed, score.stability * 100,
+                                               score.profile))
+    print("Saved the best profile to " + args.output)
+
+
+if __name__ == '__main__':
+    main()
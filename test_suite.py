@@ -2,7 +2,23 @@
 Unit tests for SMARS Library
 '''
 
+import os
+import sys
+import json
+import asyncio
+import time
+import tempfile
+import subprocess
 import unittest
+from unittest import mock
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import flask
+except ImportError:
+    flask = None
 from smars_library.smars_library import *
 # from .channel import Channel
 
@@ -11,6 +27,62 @@ from smars_library.smars_library import *
 from smars_library.smars_library import Leg
 # from SMARS_Library import set_servo_pulse
 from smars_library.smars_library import set_servo_pulse
+from smars_library.driver import ServoDriver, MODE1, SLEEP, PRESCALE, LED0_ON_L, prescale_for
+from smars_library.driver import get_driver, register_driver, reset_drivers
+from smars_library.async_robot import AsyncSmarsRobot
+from smars_library import gait as gait_module
+from smars_library import pulse as pulse_module
+from smars_library import config as config_module
+from smars_library import tracing
+from smars_library import journal
+from smars_library.morse import compile_message
+from smars_library.fleet import Fleet
+if numpy is not None:
+    from smars_library import tuning
+    from smars_library import choreography
+    from smars_library.shared_state import SharedStateReader
+if flask is not None:
+    from smars_library.server import create_app
+from smars_library.simulator import use_simulator, use_hardware, READ
+from smars_library.pulse import build_tick_table, lookup_tick, angle_to_tick
+
+
+class FakeI2CDevice():
+    """ a stand in for an I2C device, which remembers register writes """
+
+    def __init__(self):
+        self.registers = {MODE1: SLEEP}
+        self.writes = 0
+
+    def write8(self, register, value):
+        self.registers[register] = value
+        self.writes += 1
+
+    def writeList(self, register, data):
+        # the PCA9685 is set to auto-increment, so each byte goes to the next register
+        for offset, value in enumerate(data):
+            self.registers[register + offset] = value
+        self.writes += 1
+
+    def readU8(self, register):
+        return self.registers.get(register, 0)
+
+    def pulse(self, channel):
+        """ the off value last written to a channel """
+        register = LED0_ON_L + 4 * channel
+        return self.registers[register + 2] | self.registers[register + 3] << 8
+
+
+class FakeI2C():
+    """ a stand in for the Adafruit_GPIO.I2C module """
+
+    def __init__(self):
+        self.devices = []
+
+    def get_i2c_device(self, address, busnum=None):
+        device = FakeI2CDevice()
+        self.devices.append(device)
+        return device
 
 
 class SetServoPulseTestCase(unittest.TestCase):
@@ -78,6 +150,1357 @@ class TestLegSetBody(unittest.TestCase):
         leg = Leg(channel=0, leg_minangle=0, leg_maxangle=180, invert=False, name="testbot")
         self.assertIsNone(leg.body())
 
+class TestLazyDriver(unittest.TestCase):
+    """ tests the servo driver is only initialised on the first write """
+
+    def test_no_io_until_first_write(self):
+        '''
+        creating the driver shouldn't touch the bus
+        '''
+        i2c = FakeI2C()
+        driver = ServoDriver(i2c=i2c)
+        self.assertFalse(driver.connected)
+        self.assertEqual(i2c.devices, [])
+
+        self.assertTrue(driver.set_pwm(0, 0, 300))
+        self.assertTrue(driver.connected)
+        self.assertEqual(len(i2c.devices), 1)
+        device = i2c.devices[0]
+        self.assertEqual(device.registers[PRESCALE], prescale_for(60))
+        self.assertFalse(device.registers[MODE1] & SLEEP)
+        self.assertIsNotNone(driver.ready_time)
+
+        # the board is only set up once
+        driver.set_pwm(1, 0, 300)
+        self.assertEqual(len(i2c.devices), 1)
+
+    def test_module_driver_is_lazy(self):
+        '''
+        importing the library shouldn't initialise the driver
+        '''
+        import smars_library.smars_library as smars
+        self.assertIsInstance(smars.PWM, ServoDriver)
+
+class TestDriverRegistry(unittest.TestCase):
+    """ tests the shared driver registry """
+
+    def tearDown(self):
+        reset_drivers()
+
+    def test_one_driver_per_board(self):
+        '''
+        the same (bus, address) always gets the same driver
+        '''
+        self.assertIs(get_driver(1, 0x40), get_driver(1, 0x40))
+        self.assertIsNot(get_driver(1, 0x40), get_driver(1, 0x41))
+        self.assertIsNot(get_driver(0, 0x40), get_driver(1, 0x40))
+
+    def test_leg_on_second_board(self):
+        '''
+        a limb bound to another board writes to that board's driver
+        '''
+        i2c = FakeI2C()
+        register_driver(ServoDriver(address=0x41, i2c=i2c))
+        leg = Leg(channel=3, leg_minangle=0, leg_maxangle=180, invert=False,
+                  name="testbot", board=0x41)
+        self.assertIs(leg.driver, get_driver(1, 0x41))
+        leg.angle = 90
+        self.assertEqual(len(i2c.devices), 1)
+        self.assertIn(LED0_ON_L + 4 * 3, i2c.devices[0].registers)
+        leg.board = 0x20
+        self.assertEqual(leg.board, 0x41)
+
+    def test_set_limb_channel_with_board(self):
+        '''
+        limbs can be moved to a (board, channel) pair
+        '''
+        robot = SmarsRobot()
+        self.assertTrue(robot.set_limb_channel('RIGHT_LEG_FRONT', 8, board=0x41))
+        limb = [limb for limb in robot.config if limb['name'] == 'RIGHT_LEG_FRONT'][0]
+        self.assertEqual((limb['board'], limb['channel']), (0x41, 8))
+        robot.set_limb_channel('RIGHT_LEG_FRONT', 6, board=0x40)
+
+class TestFrames(unittest.TestCase):
+    """ tests batched frame writes """
+
+    def setUp(self):
+        self.i2c = FakeI2C()
+        self.driver = register_driver(ServoDriver(i2c=self.i2c))
+        self.driver.connect()
+        self.device = self.i2c.devices[0]
+        self.device.writes = 0
+
+    def tearDown(self):
+        reset_drivers()
+
+    def test_frame_is_one_block_write(self):
+        '''
+        all the channels written in a frame go out in one transaction
+        '''
+        with self.driver.frame():
+            for channel in range(0, 8):
+                self.driver.set_pwm(channel, 0, 300 + channel)
+            self.driver.set_pwm(0, 0, 400)
+            self.assertEqual(self.device.writes, 0)
+        self.assertEqual(self.device.writes, 1)
+        self.assertEqual(self.device.pulse(0), 400)
+        self.assertEqual(self.device.pulse(7), 307)
+
+    def test_gaps_bridged_with_last_values(self):
+        '''
+        channels between the ones that changed are re-sent with their last value
+        '''
+        self.driver.write_frame({channel: (0, 300) for channel in range(0, 16)})
+        self.device.writes = 0
+        self.driver.write_frame({1: (0, 350), 5: (0, 360), 12: (0, 370)})
+        self.assertEqual(self.device.writes, 2)
+        self.assertEqual(self.device.pulse(3), 300)
+        self.assertEqual(self.device.pulse(12), 370)
+
+    def test_apply_pose(self):
+        '''
+        a whole body pose costs one bus transaction
+        '''
+        robot = SmarsRobot()
+        pose = {'LEFT_FOOT_FRONT': 60, 'LEFT_FOOT_BACK': 60, 'RIGHT_FOOT_FRONT': 60,
+                'RIGHT_FOOT_BACK': 60, 'LEFT_LEG_FRONT': 45, 'LEFT_LEG_BACK': 135,
+                'RIGHT_LEG_FRONT': 135, 'RIGHT_LEG_BACK': 45}
+        self.assertTrue(robot.apply_pose(pose))
+        self.assertEqual(self.device.writes, 1)
+        self.assertEqual(robot.pose['LEFT_LEG_BACK'], 135)
+        self.assertFalse(robot.apply_pose({'LEFT_FOOT_FRONT': 170}))
+        self.assertFalse(robot.apply_pose({'NOT_A_LIMB': 90}))
+        self.assertEqual(self.device.writes, 1)
+
+    def test_board_free_between_moves(self):
+        '''
+        other threads can write to the board while an action pauses
+        '''
+        robot = SmarsRobot()
+        robot.name = "t"
+        start = time.perf_counter()
+        self.assertTrue(self.driver.set_pwm(15, 0, 250))
+        self.assertLess(time.perf_counter() - start, compile_message("t").duration / 2)
+        self.assertEqual(self.device.pulse(15), 250)
+        robot.stand()
+
+class TestTickTables(unittest.TestCase):
+    """ tests the precomputed angle to pulse tables """
+
+    def test_table_matches_mapping(self):
+        '''
+        table lookups give the same pulse as working it out each time
+        '''
+        table = build_tick_table(150, 600)
+        for half_degree in range(0, 361):
+            angle = half_degree / 2
+            self.assertEqual(lookup_tick(table, angle), angle_to_tick(angle, 150, 600))
+        self.assertIs(table, build_tick_table(150, 600))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_bulk_conversion(self):
+        '''
+        a trajectory of angles converts to the same pulses in one call
+        '''
+        leg = Leg(channel=0, leg_minangle=0, leg_maxangle=180, invert=False, name="testbot")
+        angles = numpy.linspace(0, 180, 1001).reshape(-1, 7)
+        pulses = leg.pulses(angles)
+        self.assertEqual(pulses.shape, angles.shape)
+        for angle, pulse in zip(angles.ravel(), pulses.ravel()):
+            self.assertEqual(pulse, leg.pulse(angle))
+
+class TestAsyncRobot(unittest.TestCase):
+    """ tests the asyncio interface """
+
+    def test_steps(self):
+        '''
+        the steps of an action yield the pauses instead of sleeping
+        '''
+        robot = SmarsRobot()
+        steps = robot.steps('clap', 2)
+        self.assertEqual(list(steps), [SLEEP_COUNT * 2] * 4)
+        self.assertRaises(ValueError, robot.steps, 'fly')
+
+    def test_tap_message_result(self):
+        '''
+        awaiting an action gives back its result
+        '''
+        robot = AsyncSmarsRobot()
+        self.assertFalse(asyncio.run(robot.tap_message("#")))
+        self.assertIsNone(asyncio.run(robot.stand()))
+
+    def test_actions_take_turns(self):
+        '''
+        actions started together on one robot are played one after the other
+        '''
+        robot = AsyncSmarsRobot()
+
+        async def clap_and_wiggle():
+            await asyncio.gather(robot.clap(2), robot.wiggle(2))
+        asyncio.run(clap_and_wiggle())
+        clap, wiggle = [entry for entry in robot.robot.history.entries
+                        if entry.command in ('clap', 'wiggle')]
+        self.assertEqual((clap.command, wiggle.command), ('clap', 'wiggle'))
+        self.assertGreaterEqual(wiggle.start, clap.start + clap.duration - 0.001)
+
+    def test_cancel_mid_gait(self):
+        '''
+        a walk can be cancelled while other tasks keep running
+        '''
+        async def walk_then_cancel():
+            robot = AsyncSmarsRobot()
+            walk = asyncio.create_task(robot.forward(20))
+            ticks = 0
+            while ticks < 3:
+                await asyncio.sleep(SLEEP_COUNT)
+                ticks += 1
+            walk.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await walk
+            return ticks
+
+        self.assertEqual(asyncio.run(walk_then_cancel()), 3)
+
+class TestMotionScheduler(unittest.TestCase):
+    """ tests the fixed rate motion scheduler """
+
+    def test_actions_are_queued(self):
+        '''
+        actions return futures and are played by the control loop
+        '''
+        robot = SmarsRobot()
+        scheduler = robot.start_scheduler(rate=200)
+        try:
+            clap = robot.clap(1)
+            tap = robot.tap_message("#")
+            self.assertIsNone(clap.result(timeout=5))
+            self.assertFalse(tap.result(timeout=5))
+            stats = scheduler.stats()
+            self.assertEqual(stats['commands'], 2)
+            self.assertGreater(stats['ticks'], 0)
+            self.assertGreaterEqual(stats['jitter_max'], 0)
+        finally:
+            robot.stop_scheduler()
+        self.assertIsNone(robot.scheduler)
+        self.assertIsNone(robot.stand())
+
+class TestGaitCompiler(unittest.TestCase):
+    """ tests the compiled gait tables """
+
+    def walk(self, direction, steps):
+        '''
+        walks the limbs step by step, returning the writes and pauses made
+        '''
+        robot = SmarsRobot()
+        keys = [gait_module.limb_key(Leg(**limb_settings(limb))) for limb in robot.config]
+        limbs = [Leg(*key) for key in keys]
+        feet, legs = limbs[:4], limbs[4:]
+        moves = []
+        for index, limb in enumerate(limbs):
+            limb.send = lambda pulse, index=index: moves.append((index, pulse))
+
+        class Pauses():
+            """ records the pauses """
+            def pause(self, delay):
+                moves.append(delay)
+
+        for limb in feet:
+            limb.down()
+        legs[0].body()
+        legs[1].body()
+        legs[2].swing()
+        legs[3].swing()
+        for limb in feet:
+            limb.up()
+        step = gait_module._forward_step if direction == gait_module.FORWARD \
+            else gait_module._backward_step
+        for _ in range(steps):
+            step(feet, legs, Pauses(), SLEEP_COUNT)
+        return moves, [limb.state() for limb in limbs], feet, legs
+
+    def test_compiled_walk_matches_step_by_step(self):
+        '''
+        playing the compiled table makes the same moves as walking step by step
+        '''
+        for direction in (gait_module.FORWARD, gait_module.BACKWARD):
+            expected, states, feet, legs = self.walk(direction, 600)
+            gait = gait_module.compile_gait(direction, feet, legs, SLEEP_COUNT)
+            self.assertIs(gait, gait_module.compile_gait(direction, feet, legs, SLEEP_COUNT))
+            self.assertLess(gait.cycle_start + gait.cycle_length, 600)
+
+            limbs = [Leg(*gait_module.limb_key(limb)) for limb in feet + legs]
+            moves = []
+            for index, limb in enumerate(limbs):
+                limb.send = lambda pulse, angle=None, index=index: moves.append((index, pulse))
+            for delay in gait.play(limbs, 600):
+                moves.append(delay)
+            self.assertEqual(moves, expected)
+            self.assertEqual([limb.state() for limb in limbs], states)
+
+
+def limb_settings(limb):
+    '''
+    turns an entry of SmarsRobot.config into Leg arguments
+    '''
+    return {'name': limb['name'], 'channel': limb['channel'], 'board': limb['board'],
+            'leg_minangle': limb['min_angle'], 'leg_maxangle': limb['max_angle'],
+            'invert': limb['invert']}
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestTrajectory(unittest.TestCase):
+    """ tests smooth trajectories """
+
+    def tearDown(self):
+        reset_drivers()
+
+    def test_profiles(self):
+        '''
+        every profile starts slowly or evenly and finishes exactly at the end
+        '''
+        from smars_library.trajectory import progress, PROFILES
+        for profile in PROFILES:
+            samples = progress(profile, 20)
+            self.assertAlmostEqual(samples[-1], 1.0)
+            self.assertTrue(numpy.all(numpy.diff(samples) >= 0))
+        self.assertRaises(ValueError, progress, 'wobbly', 20)
+
+    def test_plan_ticks_match_limbs(self):
+        '''
+        the pulses for every sample match each limb's own table
+        '''
+        from smars_library.trajectory import plan
+        limbs = [Leg(channel=0, leg_minangle=0, leg_maxangle=180, invert=False, name="a"),
+                 Leg(channel=1, leg_minangle=0, leg_maxangle=180, invert=False, name="b")]
+        trajectory = plan(limbs, [180, 10.25], 1.0, profile='trapezoidal', rate=40,
+                          starts=[0, 90])
+        self.assertEqual(trajectory.ticks.shape, (40, 2))
+        for angles, ticks in zip(trajectory.angles, trajectory.ticks):
+            self.assertEqual(list(ticks), [limbs[0].pulse(angles[0]), limbs[1].pulse(angles[1])])
+
+    def test_move_to(self):
+        '''
+        a smooth move sends one frame per sample and ends at the target
+        '''
+        i2c = FakeI2C()
+        register_driver(ServoDriver(i2c=i2c))
+        robot = SmarsRobot()
+        robot.default()
+        robot.apply_pose({'LEFT_LEG_BACK': 100, 'RIGHT_LEG_FRONT': 100})
+        i2c.devices[0].writes = 0
+        self.assertTrue(robot.move_to({'LEFT_LEG_BACK': 'stretch', 'RIGHT_LEG_FRONT': 150},
+                                      duration=0.1, rate=100))
+        self.assertEqual(i2c.devices[0].writes, 10)
+        self.assertEqual(robot.pose['LEFT_LEG_BACK'], 180)
+        self.assertEqual(i2c.devices[0].pulse(6), Leg(
+            channel=6, leg_minangle=90, leg_maxangle=180, invert=False, name="x").pulse(150))
+        self.assertFalse(robot.move_to({'LEFT_LEG_BACK': 10}))
+
+class TestSimulator(unittest.TestCase):
+    """ tests the simulated PCA9685 """
+
+    def setUp(self):
+        self.bus = use_simulator()
+
+    def tearDown(self):
+        use_hardware()
+
+    def test_board_is_set_up(self):
+        '''
+        the driver wakes the simulated board and sets the frequency
+        '''
+        set_servo_pulse(0, 1)
+        board = self.bus.board(0x40)
+        self.assertFalse(board.sleeping)
+        self.assertAlmostEqual(board.freq, 60, delta=0.5)
+        self.assertEqual(board.pulse(0), 1000 // 4)
+
+    def test_reads_recorded_where_they_start(self):
+        '''
+        a read of several registers is recorded at the first register read
+        '''
+        set_servo_pulse(0, 1)
+        board = self.bus.board(0x40)
+        board.clear()
+        data = board.readList(LED0_ON_L, 4)
+        self.assertEqual(len(data), 4)
+        self.assertEqual((board.log[-1].kind, board.log[-1].register), (READ, LED0_ON_L))
+
+    def test_records_robot_moves(self):
+        '''
+        every write is recorded with a timestamp and a modelled bus cost
+        '''
+        robot = SmarsRobot()
+        robot.default()
+        board = self.bus.board(0x40)
+        board.clear()
+        robot.apply_pose({'LEFT_FOOT_FRONT': 60, 'RIGHT_FOOT_BACK': 70})
+        self.assertEqual(board.transactions, 1)
+        self.assertGreater(board.bus_time, 0)
+        changed = sorted(channel for _, channel, _, _ in board.history)
+        self.assertEqual(changed, [1, 5])
+        self.assertEqual(board.channel_history(1)[-1][2], robot_pulse(robot, 'LEFT_FOOT_FRONT', 60))
+
+    def test_second_board(self):
+        '''
+        each (bus, address) gets its own simulated board
+        '''
+        set_servo_pulse(2, 2, board=0x41)
+        self.assertEqual(self.bus.board(0x41).pulse(2), 2 * 1000 // 4)
+        self.assertEqual(self.bus.board(0x40).transactions, 0)
+
+
+def robot_pulse(robot, limb_name, angle):
+    '''
+    the pulse a robot's limb uses for an angle
+    '''
+    limb = [limb for limb in robot.config if limb['name'] == limb_name][0]
+    return Leg(**limb_settings(limb)).pulse(angle)
+
+class TestWriteCoalescing(unittest.TestCase):
+    """ tests unchanged writes are skipped """
+
+    def setUp(self):
+        self.bus = use_simulator()
+
+    def tearDown(self):
+        use_hardware()
+
+    def test_repeated_stand(self):
+        '''
+        standing twice only sends the feet positions once
+        '''
+        robot = SmarsRobot()
+        robot.stand()
+        board = self.bus.board(0x40)
+        sent = board.transactions
+        saved = robot.writes_saved
+        robot.stand()
+        self.assertEqual(board.transactions, sent)
+        self.assertEqual(robot.writes_saved, saved + 4)
+
+    def test_frame_collapses_writes(self):
+        '''
+        a channel written several times in one frame is sent once
+        '''
+        driver = get_driver()
+        driver.connect()
+        board = self.bus.board(0x40)
+        board.clear()
+        with driver.frame():
+            for pulse in range(300, 310):
+                driver.set_pwm(4, 0, pulse)
+        self.assertEqual(board.transactions, 1)
+        self.assertEqual(board.pulse(4), 309)
+        self.assertEqual(driver.writes_saved, 9)
+        driver.invalidate()
+        driver.set_pwm(4, 0, 309)
+        self.assertEqual(board.transactions, 2)
+
+class TestMetrics(unittest.TestCase):
+    """ tests the performance stats """
+
+    def setUp(self):
+        self.bus = use_simulator()
+        self.robot = SmarsRobot()
+
+    def tearDown(self):
+        self.robot.enable_stats(False)
+        use_hardware()
+
+    def test_disabled_by_default(self):
+        '''
+        nothing is recorded until stats are enabled
+        '''
+        self.robot.stand()
+        stats = self.robot.stats()
+        self.assertFalse(stats['enabled'])
+        self.assertEqual(stats['actions'], {})
+        self.assertNotIn('latency', stats['boards']['1:0x40'])
+
+    def test_records_actions_and_writes(self):
+        '''
+        actions are timed and the writes to each channel counted
+        '''
+        self.robot.enable_stats()
+        self.robot.stand()
+        self.robot.stand()
+        self.robot.sit()
+        stats = self.robot.stats()
+        self.assertEqual(stats['actions']['stand']['count'], 2)
+        self.assertEqual(stats['actions']['sit']['count'], 1)
+        board = stats['boards']['1:0x40']
+        for limb in self.robot.config:
+            if 'FOOT' in limb['name']:
+                self.assertGreater(board['channel_writes'][limb['channel']], 0)
+        self.assertGreater(board['latency']['count'], 0)
+        self.assertLessEqual(board['latency']['count'], board['transactions'])
+        self.assertEqual(board['errors'], 0)
+        self.robot.reset_stats()
+        self.assertEqual(self.robot.stats()['actions'], {})
+
+    def test_counts_errors(self):
+        '''
+        failed bus writes are counted, and don't stop the action
+        '''
+        self.robot.enable_stats()
+        driver = get_driver()
+        driver.connect()
+        device = self.bus.board(0x40)
+
+        def broken(register, data):
+            raise OSError("bus error")
+        device.writeList = broken
+        try:
+            self.robot.sit()
+        finally:
+            del device.writeList
+            driver.invalidate()
+        self.assertGreater(self.robot.stats()['boards']['1:0x40']['errors'], 0)
+
+    def test_steps_are_timed(self):
+        '''
+        actions played step by step are timed under their own name
+        '''
+        self.robot.enable_stats()
+        for _ in self.robot.steps('forward', 1):
+            pass
+        self.assertEqual(self.robot.stats()['actions']['walkforward']['count'], 1)
+
+class TestTracing(unittest.TestCase):
+    """ tests the timeline tracing """
+
+    def setUp(self):
+        self.bus = use_simulator()
+
+    def tearDown(self):
+        use_hardware()
+
+    def test_nested_spans(self):
+        '''
+        a walk is traced as action, steps, limb moves and bus writes
+        '''
+        robot = SmarsRobot()
+        robot.default()
+        with tracing.trace() as tracer:
+            robot.walkforward(1)
+        action, = tracer.spans('action')
+        self.assertEqual(action['name'], 'walkforward')
+        self.assertEqual(len(tracer.spans('step')), 2)
+        for category in ('step', 'limb', 'bus'):
+            spans = tracer.spans(category)
+            self.assertTrue(spans)
+            for span in spans:
+                self.assertGreaterEqual(span['ts'], action['ts'])
+                self.assertLessEqual(span['ts'] + span['dur'], action['ts'] + action['dur'])
+        self.assertIsNone(tracing.active())
+
+    def test_pauses(self):
+        '''
+        the pauses between moves are traced as sleeps
+        '''
+        robot = SmarsRobot()
+        with tracing.trace() as tracer:
+            robot.swing()
+        self.assertTrue(tracer.spans('sleep'))
+        self.assertEqual(len(tracer.spans('action')), 1)
+
+    def test_export(self):
+        '''
+        the trace is saved as Chrome trace event JSON
+        '''
+        robot = SmarsRobot()
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, "trace.json")
+            with tracing.trace(filename):
+                robot.stand()
+            with open(filename, encoding="utf-8") as trace_file:
+                events = json.load(trace_file)['traceEvents']
+        names = [event['name'] for event in events if event['ph'] == 'X']
+        self.assertIn('stand', names)
+        self.assertIn('thread_name', [event['name'] for event in events])
+
+class TestCommandHistory(unittest.TestCase):
+    """ tests the CommandHistory ring buffer """
+
+    def test_instances_are_separate(self):
+        '''
+        each history has its own commands, starting with the new history marker
+        '''
+        first = CommandHistory()
+        second = CommandHistory()
+        first.append("forward")
+        self.assertEqual(first.history, ["*** new history ***", "forward"])
+        self.assertEqual(second.history, ["*** new history ***"])
+        first.clear()
+        self.assertEqual(first.history, [])
+        self.assertEqual(second.history, ["*** new history ***"])
+
+    def test_keeps_the_most_recent(self):
+        '''
+        once full, each command replaces the oldest
+        '''
+        history = CommandHistory(size=12)
+        for command in range(0, 30):
+            history.append(str(command), (command,))
+        self.assertEqual(len(history), 12)
+        self.assertEqual(history.history[0], "18")
+        self.assertEqual(history.last_ten, [str(command) for command in range(20, 30)])
+        last, = history.last(1)
+        self.assertEqual((last.command, last.args), ("29", (29,)))
+        self.assertEqual(history.last(50), history.entries)
+
+    def test_records_robot_actions(self):
+        '''
+        robot actions are recorded with their parameters and duration
+        '''
+        use_simulator()
+        try:
+            robot = SmarsRobot()
+            robot.stand()
+            robot.apply_pose({'LEFT_FOOT_FRONT': 60})
+        finally:
+            use_hardware()
+        stand, pose = robot.history.last(2)
+        self.assertEqual(stand.command, 'stand')
+        self.assertEqual(pose.command, 'apply_pose')
+        self.assertEqual(pose.args, ({'LEFT_FOOT_FRONT': 60},))
+        self.assertGreaterEqual(pose.duration, 0)
+        self.assertGreaterEqual(pose.start, stand.start)
+
+class TestJournal(unittest.TestCase):
+    """ tests the motion journal """
+
+    def setUp(self):
+        self.bus = use_simulator()
+        self.folder = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.folder.name, "robot.journal")
+
+    def tearDown(self):
+        use_hardware()
+        self.folder.cleanup()
+
+    def test_records_frames_and_commands(self):
+        '''
+        frames and commands are read back in the order they happened
+        '''
+        robot = SmarsRobot()
+        with journal.Journal(self.filename):
+            robot.apply_pose({'LEFT_FOOT_FRONT': 60, 'RIGHT_FOOT_BACK': 70})
+        board = self.bus.board(0x40)
+        sent = {channel: board.channel(channel) for channel in range(0, 16)}
+        robot.stand()
+        records = list(journal.read(self.filename))
+        self.assertEqual([record.kind for record in records], [journal.COMMAND, journal.FRAME])
+        self.assertTrue(records[0].command.startswith("apply_pose ({'LEFT_FOOT_FRONT': 60"))
+        for channel, value in records[1].values.items():
+            self.assertEqual(value, sent[channel])
+        self.assertEqual(len(records[1].values), 2)
+        self.assertLessEqual(records[0].time, records[1].time)
+        self.assertIsNone(journal.active())
+
+    def test_replay(self):
+        '''
+        replaying a journal onto a fresh board leaves it in the same state
+        '''
+        robot = SmarsRobot()
+        with journal.Journal(self.filename):
+            robot.stand()
+            robot.sit()
+            robot.apply_pose({'LEFT_LEG_FRONT': 30})
+        pulses = self.bus.board(0x40).pulses()
+        bus = use_simulator()
+        commands = []
+        frames = journal.replay(self.filename, realtime=False, on_command=commands.append)
+        self.assertEqual(frames, 3)
+        self.assertEqual([record.command.split()[0] for record in commands],
+                         ['stand', 'sit', 'apply_pose'])
+        self.assertEqual(bus.board(0x40).pulses(), pulses)
+
+    def test_ignores_partial_records(self):
+        '''
+        a record cut short by a crash is ignored
+        '''
+        with journal.Journal(self.filename) as recorder:
+            recorder.command("first")
+            recorder.command("second")
+        with open(self.filename, "r+b") as journal_file:
+            journal_file.truncate(journal.HEADER.size + journal.RECORD.size * 2 - 5)
+        self.assertEqual([record.command for record in journal.read(self.filename)], ["first"])
+
+class TestMorseSchedules(unittest.TestCase):
+    """ tests compiled Morse schedules """
+
+    def test_itu_timing(self):
+        '''
+        dots, dashes and gaps follow the ITU timings for the speed
+        '''
+        unit = 1.2 / 12
+        schedule = compile_message("et a", wpm=12)
+        self.assertEqual(schedule.code, ". - / .-")
+        self.assertEqual([(key_down, round(duration / unit))
+                          for key_down, duration in schedule.events],
+                         [(True, 1), (False, 3), (True, 3), (False, 7),
+                          (True, 1), (False, 1), (True, 3), (False, 1)])
+        # PARIS is 50 dots long, including the gap before the next word
+        paris = compile_message("paris", wpm=12)
+        self.assertAlmostEqual(paris.duration + 6 * unit, 50 * unit)
+
+    def test_cached_and_punctuation(self):
+        '''
+        messages are compiled once, and punctuation can be sent
+        '''
+        self.assertIs(compile_message("CQ de smars?"), compile_message("CQ de smars?"))
+        self.assertTrue(compile_message("hi, 73!").code.endswith("--..-- / --... ...-- -.-.--"))
+        with self.assertRaises(ValueError):
+            compile_message("#")
+
+    def test_name_does_not_block(self):
+        '''
+        setting the name taps it in the background, before the next action
+        '''
+        use_simulator()
+        try:
+            robot = SmarsRobot()
+            start = time.perf_counter()
+            robot.name = "e"
+            self.assertLess(time.perf_counter() - start, compile_message("e").duration)
+            robot.stand()
+        finally:
+            use_hardware()
+        self.assertEqual(robot.history.last_ten[-2:], ['tap_message', 'stand'])
+
+    def test_name_waits_for_other_playback(self):
+        '''
+        the name is tapped after an async action, and before a scheduled one
+        '''
+        use_simulator()
+        try:
+            robot = SmarsRobot()
+
+            async def swing_then_name():
+                swing = asyncio.ensure_future(AsyncSmarsRobot(robot).play('swing'))
+                await asyncio.sleep(0)
+                robot.name = "e"
+                await swing
+            asyncio.run(swing_then_name())
+            deadline = time.perf_counter() + 5
+            while robot.history.entries[-1].duration is None or \
+                    robot.history.last_ten[-1] != 'tap_message':
+                self.assertLess(time.perf_counter(), deadline)
+                time.sleep(0.01)
+
+            scheduled = SmarsRobot()
+            scheduled.name = "t"
+            scheduled.start_scheduler()
+            scheduled.apply_pose({'LEFT_FOOT_FRONT': 90}).result(timeout=5)
+            scheduled.stop_scheduler()
+        finally:
+            use_hardware()
+        for played, commands in ((robot, ['swing', 'tap_message']),
+                                 (scheduled, ['tap_message', 'apply_pose'])):
+            first, second = played.history.last(2)
+            self.assertEqual([first.command, second.command], commands)
+            self.assertGreaterEqual(second.start, first.start + first.duration - 0.001)
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestTelemetry(unittest.TestCase):
+    """ tests the streaming telemetry """
+
+    def setUp(self):
+        self.bus = use_simulator()
+        self.robot = SmarsRobot()
+
+    def tearDown(self):
+        use_hardware()
+
+    def test_feet_are_reported(self):
+        '''
+        get_telemetry reports the feet, not the legs, for the foot readings
+        '''
+        self.robot.sit()
+        telemetry = dict(self.robot.get_telemetry())
+        for limb in self.robot.config:
+            self.assertEqual(telemetry[limb['name'].lower()], self.robot.pose[limb['name']])
+
+    def test_records_writes(self):
+        '''
+        every pulse sent updates the limb's row, seen through the live snapshot
+        '''
+        telemetry = self.robot.telemetry
+        self.assertIs(telemetry, self.robot.telemetry)
+        snapshot = telemetry.snapshot()
+        self.assertFalse(snapshot.flags.writeable)
+        self.assertEqual(list(snapshot['name']), [limb['name'] for limb in self.robot.config])
+        self.robot.apply_pose({'LEFT_LEG_FRONT': 45})
+        row = telemetry.row('LEFT_LEG_FRONT')
+        self.assertEqual(snapshot['angle'][row], 45)
+        self.assertEqual(snapshot['pulse'][row],
+                         self.bus.board(0x40).pulse(snapshot['channel'][row]))
+        self.assertGreater(snapshot['written'][row], 0)
+        before = telemetry.sample()
+        self.robot.walkforward(1)
+        self.assertGreater(snapshot['writes'].sum(), before['writes'].sum())
+        board = self.bus.board(0x40)
+        self.assertEqual([int(pulse) for pulse in snapshot['pulse']],
+                         [board.pulse(channel) for channel in snapshot['channel']])
+
+    def test_stream(self):
+        '''
+        samples are streamed at the rate asked for
+        '''
+        start = time.perf_counter()
+        samples = list(self.robot.telemetry.stream(rate=100, count=5))
+        self.assertEqual(len(samples), 5)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.035)
+        self.assertEqual(samples[0].dtype, self.robot.telemetry.snapshot().dtype)
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestSharedState(unittest.TestCase):
+    """ tests publishing the robot state into shared memory """
+
+    def setUp(self):
+        self.bus = use_simulator()
+        self.robot = SmarsRobot()
+        self.publisher = self.robot.publish(slots=4)
+        self.reader = SharedStateReader(self.publisher.name)
+
+    def tearDown(self):
+        self.reader.close()
+        self.publisher.close()
+        use_hardware()
+
+    def test_pose(self):
+        '''
+        readers see the limb state after each frame
+        '''
+        self.robot.apply_pose({'LEFT_LEG_FRONT': 45, 'LEFT_FOOT_FRONT': 60})
+        pose = self.reader.pose()
+        self.assertEqual(list(pose['name']), [limb['name'] for limb in self.robot.config])
+        angles = dict(zip(pose['name'], pose['angle']))
+        self.assertEqual(angles['LEFT_LEG_FRONT'], 45)
+        self.assertEqual(angles['LEFT_FOOT_FRONT'], 60)
+
+    def test_recent_frames(self):
+        '''
+        the most recent frames are kept in a ring
+        '''
+        for angle in range(40, 100, 10):
+            self.robot.apply_pose({'LEFT_LEG_FRONT': angle})
+        frames = self.reader.frames()
+        self.assertEqual(self.reader.frame_count, 6)
+        self.assertEqual([frame[0] for frame in frames], [2, 3, 4, 5])
+        number, _, busnum, address, values = frames[-1]
+        self.assertEqual((busnum, address), (1, 0x40))
+        self.assertEqual(values, {0: self.bus.board(0x40).channel(0)})
+        self.assertEqual(self.reader.frames(since=5)[0][0], 5)
+
+    def test_only_own_boards(self):
+        '''
+        frames sent to another robot's board aren't published
+        '''
+        other = SmarsRobot(address=0x41)
+        other.apply_pose({'LEFT_LEG_FRONT': 45})
+        self.assertEqual(self.reader.frame_count, 0)
+        self.robot.apply_pose({'LEFT_LEG_FRONT': 45})
+        self.assertEqual(self.reader.frame_count, 1)
+        self.assertEqual(self.reader.frames()[-1][2:4], (1, 0x40))
+
+    def test_other_process(self):
+        '''
+        another process can read the pose by name
+        '''
+        self.robot.apply_pose({'RIGHT_LEG_BACK': 30})
+        code = ("from smars_library.shared_state import SharedStateReader; "
+                "reader = SharedStateReader(%r); pose = reader.pose(); "
+                "print(dict(zip(pose['name'], pose['angle']))['RIGHT_LEG_BACK']); "
+                "reader.close()" % self.publisher.name)
+        output = subprocess.run([sys.executable, "-c", code], check=True,
+                                capture_output=True, text=True).stdout
+        self.assertEqual(float(output.split()[-1]), 30)
+        row = self.robot.telemetry.row('RIGHT_LEG_BACK')
+        self.assertEqual(self.reader.pose()['angle'][row], 30)
+
+@unittest.skipIf(flask is None, "flask is not installed")
+class TestServer(unittest.TestCase):
+    """ tests the HTTP control server """
+
+    def setUp(self):
+        use_simulator()
+        self.robot = SmarsRobot()
+        self.client = create_app(self.robot, queue_size=2).test_client()
+
+    def tearDown(self):
+        self.robot.stop_scheduler(wait=False)
+        use_hardware()
+
+    def test_action(self):
+        '''
+        actions are queued, and can be waited for
+        '''
+        response = self.client.post("/actions/stand?wait=5")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post("/actions/tap_message?wait=5", json={'message': "#"})
+        self.assertEqual(response.get_json(), {'action': 'tap_message', 'result': False})
+        self.assertEqual(self.client.post("/actions/explode").status_code, 404)
+        self.assertEqual(self.client.post("/actions/clap", json={'bad': 1}).status_code, 400)
+        self.assertEqual(self.client.post("/actions/stand", json={'bad': 1}).status_code, 400)
+        self.assertEqual(self.client.post("/actions/apply_pose", json={}).status_code, 400)
+
+    def test_bad_values(self):
+        '''
+        parameters of the wrong type, or out of range, are turned away before queueing
+        '''
+        for action, kwargs in (('forward', {'steps': "abc"}), ('forward', {'steps': -3}),
+                               ('forward', {'steps': True}), ('clap', {'clap_count': "x"}),
+                               ('tap_message', {'message': 5}),
+                               ('tap_message', {'message': "sos", 'wpm': 0}),
+                               ('apply_pose', {'pose': {'LEFT_LEG_FRONT': "up"}}),
+                               ('move_to', {'pose': {}, 'profile': "bounce"})):
+            response = self.client.post("/actions/" + action, json=kwargs)
+            self.assertEqual(response.status_code, 400, (action, kwargs))
+            self.assertIn(list(kwargs)[-1], response.get_json()['error'])
+        self.assertEqual(self.client.get("/status").get_json()['pending'], 0)
+        response = self.client.post("/actions/forward?wait=5", json={'steps': 0})
+        self.assertEqual(response.status_code, 200)
+
+    def test_pose_and_telemetry(self):
+        '''
+        a pose can be set and read back
+        '''
+        response = self.client.post("/pose?wait=5", json={'pose': {'LEFT_LEG_FRONT': 45}})
+        self.assertEqual(response.get_json()['result'], True)
+        self.assertEqual(self.client.get("/pose").get_json()['LEFT_LEG_FRONT'], 45)
+        self.assertEqual(self.client.get("/telemetry").get_json()['left_leg_front'], 45)
+        for _ in range(0, 3):
+            self.client.get("/telemetry")
+        self.assertNotIn('get_telemetry', self.robot.history.history)
+        self.assertEqual(self.client.post("/pose", json={}).status_code, 400)
+
+    def test_busy(self):
+        '''
+        when the queue is full, requests are turned away rather than waiting
+        '''
+        codes = [self.client.post("/actions/swing").status_code for _ in range(0, 5)]
+        self.assertEqual(codes[0], 202)
+        self.assertIn(503, codes)
+        self.assertLessEqual(self.client.get("/status").get_json()['pending'], 2)
+
+class TestFleet(unittest.TestCase):
+    """ tests per robot limbs and the fleet controller """
+
+    def setUp(self):
+        self.bus = use_simulator()
+
+    def tearDown(self):
+        use_hardware()
+
+    def test_robots_have_their_own_limbs(self):
+        '''
+        two robots on different boards don't share limbs
+        '''
+        first = SmarsRobot()
+        second = SmarsRobot(address=0x41)
+        first.apply_pose({'LEFT_LEG_FRONT': 45})
+        second.apply_pose({'LEFT_LEG_FRONT': 60})
+        self.assertEqual(first.pose['LEFT_LEG_FRONT'], 45)
+        self.assertEqual(second.pose['LEFT_LEG_FRONT'], 60)
+        self.assertEqual({limb['board'] for limb in second.config}, {0x41})
+        self.assertNotEqual(self.bus.board(0x40).pulse(0), self.bus.board(0x41).pulse(0))
+        with self.assertRaises(ValueError):
+            SmarsRobot(address=0x20)
+
+    def test_group_action(self):
+        '''
+        every robot in the fleet performs the action, and its latency is recorded
+        '''
+        with Fleet(addresses=[0x40, 0x41, 0x42]) as fleet:
+            results = fleet.run('apply_pose', {'LEFT_FOOT_FRONT': 70})
+            self.assertEqual([result.robot for result in results], [0, 1, 2])
+            self.assertTrue(all(result.result is True for result in results))
+            self.assertTrue(all(result.error is None for result in results))
+            pulses = {self.bus.board(address).pulse(1) for address in (0x40, 0x41, 0x42)}
+            self.assertEqual(len(pulses), 1)
+            fleet.run('stand')
+            stats = fleet.stats()
+            self.assertEqual([robot['address'] for robot in stats], [0x40, 0x41, 0x42])
+            self.assertEqual(stats[2]['count'], 2)
+            with self.assertRaises(AttributeError):
+                fleet.run('explode')
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestKinematics(unittest.TestCase):
+    """ tests kinematics.py """
+
+    def setUp(self):
+        use_simulator()
+        self.robot = SmarsRobot()
+        self.robot.stand()
+        self.robot.apply_pose({'LEFT_LEG_FRONT': 45, 'LEFT_LEG_BACK': 135,
+                               'RIGHT_LEG_FRONT': 135, 'RIGHT_LEG_BACK': 45})
+        self.kinematics = self.robot.kinematics
+
+    def tearDown(self):
+        use_hardware()
+
+    def test_standing(self):
+        '''
+        standing, every foot is on the ground at its corner, and the robot is stable
+        '''
+        angles = self.kinematics.angles_of(self.robot.pose)
+        feet = self.kinematics.feet(angles)
+        self.assertEqual(feet.shape, (4, 3))
+        self.assertTrue(numpy.all(self.kinematics.on_ground(angles)))
+        self.assertTrue(numpy.allclose(feet[:, 2], 0))
+        # left front, left back, right front, right back
+        self.assertTrue(numpy.all(numpy.sign(feet[:, 0]) == [1, -1, 1, -1]))
+        self.assertTrue(numpy.all(numpy.sign(feet[:, 1]) == [1, 1, -1, -1]))
+        self.assertGreater(self.kinematics.support_margin(angles), 0)
+
+    def test_lifting_feet(self):
+        '''
+        a lifted foot leaves the ground, and with two up the robot is unsupported
+        '''
+        pose = self.robot.pose
+        pose['LEFT_FOOT_FRONT'] = self.robot.config[0]['max_angle']
+        one = self.kinematics.angles_of(pose)
+        pose['RIGHT_FOOT_BACK'] = self.robot.config[3]['max_angle']
+        two = self.kinematics.angles_of(pose)
+        self.assertEqual(list(self.kinematics.on_ground(one)), [False, True, True, True])
+        self.assertGreater(self.kinematics.feet(one)[0, 2], 0)
+        self.assertEqual(self.kinematics.support_margin(two), -numpy.inf)
+
+    def test_trajectories(self):
+        '''
+        whole trajectories give the same answers as single poses, and pushing
+        the standing legs back moves the body forward
+        '''
+        start = self.kinematics.angles_of(self.robot.pose)
+        trajectory = numpy.repeat(start[numpy.newaxis], 50, axis=0)
+        sweep = numpy.linspace(0, 20, 50)
+        trajectory[:, 4] += sweep     # LEFT_LEG_FRONT
+        trajectory[:, 5] += sweep     # LEFT_LEG_BACK
+        trajectory[:, 6] -= sweep     # RIGHT_LEG_FRONT
+        trajectory[:, 7] -= sweep     # RIGHT_LEG_BACK
+        feet = self.kinematics.feet(trajectory)
+        margins = self.kinematics.support_margin(trajectory)
+        self.assertEqual(feet.shape, (50, 4, 3))
+        for index in (0, 17, 49):
+            self.assertTrue(numpy.allclose(feet[index], self.kinematics.feet(trajectory[index])))
+            self.assertAlmostEqual(margins[index],
+                                   self.kinematics.support_margin(trajectory[index]))
+        motion = self.kinematics.body_motion(trajectory)
+        self.assertEqual(motion.shape, (49,))
+        self.assertTrue(numpy.all(motion > 0))
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestChoreography(unittest.TestCase):
+    """ tests choreography validation """
+
+    def setUp(self):
+        self.bus = use_simulator()
+        self.robot = SmarsRobot()
+
+    def tearDown(self):
+        use_hardware()
+
+    def test_built_in_moves_pass(self):
+        '''
+        the robot's own walks and Morse messages are valid
+        '''
+        limbs = [Leg('LEFT_FOOT_FRONT', 1, 50, 150, False)]
+        for direction in (gait_module.FORWARD, gait_module.BACKWARD):
+            feet, legs = ([Leg(*key) for key in keys] for keys in tuning.robot_limbs(self.robot))
+            gait = gait_module.compile_gait(direction, feet, legs, SLEEP_COUNT)
+            frames = choreography.choreography_of(gait, feet + legs)
+            self.assertEqual(choreography.check(frames), [])
+        schedule = compile_message("sos")
+        self.assertEqual(choreography.check(choreography.choreography_of(schedule, limbs[0])), [])
+        self.assertNotEqual(self.robot.walkforward(2), False)
+
+    def test_violations(self):
+        '''
+        out of range angles, shared channels and fast moves are all found
+        '''
+        limbs = [Leg('LEFT_LEG_FRONT', 0, 9, 90, True), Leg('LEFT_LEG_BACK', 0, 90, 180, False)]
+        nan = float('nan')
+        frames = choreography.Choreography(limbs, [[45, 100], [95, nan], [60, 180]],
+                                           [0.5, 0.5, 0.5], starts=[45, 100])
+        problems = [(violation.frame, violation.limb)
+                    for violation in choreography.check(frames)]
+        self.assertEqual(problems, [(None, 'LEFT_LEG_BACK'), (1, 'LEFT_LEG_FRONT')])
+        frames.delays[:] = 0.01
+        problems = choreography.check(frames)
+        self.assertIn((2, 'LEFT_LEG_BACK'), [(violation.frame, violation.limb)
+                                             for violation in problems])
+        with self.assertRaises(choreography.ChoreographyError) as raised:
+            choreography.validate(frames)
+        self.assertEqual(raised.exception.violations, problems)
+
+    def test_rejected_before_moving(self):
+        '''
+        a move which is too fast is turned down before anything is sent
+        '''
+        board = self.bus.board(0x40)
+        self.robot.apply_pose({'LEFT_LEG_FRONT': 10, 'LEFT_FOOT_FRONT': 50})
+        pulses = [board.pulse(channel) for channel in (0, 1)]
+        self.assertFalse(self.robot.move_to({'LEFT_LEG_FRONT': 90}, duration=0.02))
+        self.assertFalse(self.robot.tap_message("sos", wpm=60))
+        self.assertEqual([board.pulse(channel) for channel in (0, 1)], pulses)
+        self.robot.enable_validation(False)
+        self.assertTrue(self.robot.move_to({'LEFT_LEG_FRONT': 90}, duration=0.02))
+        self.assertNotEqual(board.pulse(0), pulses[0])
+
+    def test_walks_checked_once(self):
+        '''
+        a cached gait is only checked again once the limbs change
+        '''
+        # the first walk starts from standing, the others from where a walk ends
+        self.robot.walkforward(1)
+        self.robot.walkforward(1)
+        with mock.patch.object(choreography, 'check', wraps=choreography.check) as check:
+            self.assertIsNot(self.robot.walkforward(1), False)
+            self.assertIsNot(self.robot.walkforward(1), False)
+            self.assertEqual(check.call_count, 0)
+            self.robot.set_limb_channel('RIGHT_LEG_BACK', 1)
+            self.assertFalse(self.robot.walkforward(1))
+            self.assertFalse(self.robot.walkforward(1))
+            self.assertEqual(check.call_count, 1)
+
+class TestGaitTuning(unittest.TestCase):
+    """ tests gait profiles and the gait tuner """
+
+    def setUp(self):
+        use_simulator()
+
+    def tearDown(self):
+        use_hardware()
+
+    def test_profile_sets_walk(self):
+        '''
+        the increment in the robot's gait profile sets how far the legs tick
+        '''
+        robot = SmarsRobot()
+        robot.walkforward(1)
+        default = robot.pose['LEFT_LEG_BACK']
+        robot = SmarsRobot()
+        robot.gait_profile = robot.gait_profile._replace(increment=6)
+        robot.walkforward(1)
+        self.assertEqual(robot.pose['LEFT_LEG_BACK'] - 90, (default - 90) * 3)
+        with self.assertRaises(TypeError):
+            robot.gait_profile = {'increment': 6}
+
+    def test_profile_save_and_load(self):
+        '''
+        a profile saved to a file loads back the same, and bad ones are refused
+        '''
+        profile = gait_module.GaitProfile(4, 0.02, 0.1, 0.03, 0.0, (0, 3, 1, 2))
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "gait.json")
+            profile.save(filename)
+            self.assertEqual(SmarsRobot().load_gait_profile(filename), profile)
+            with open(filename, "w", encoding="utf-8") as profile_file:
+                json.dump(dict(profile.to_dict(), order=[0, 0, 1, 2]), profile_file)
+            with self.assertRaises(ValueError):
+                gait_module.GaitProfile.load(filename)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_evaluate(self):
+        '''
+        walking forward goes forward, and waiting for the servos is more stable
+        '''
+        limbs = tuning.robot_limbs()
+        hasty = tuning.evaluate(gait_module.GaitProfile.from_pause(0.02), limbs)
+        patient = tuning.evaluate(gait_module.GaitProfile.from_pause(0.15), limbs)
+        self.assertGreater(hasty.distance, 0)
+        self.assertGreater(patient.stability, hasty.stability)
+        self.assertLess(patient.speed, hasty.speed)
+        backward = tuning.evaluate(patient.profile, limbs, direction=gait_module.BACKWARD)
+        self.assertGreater(backward.score, 0)
+        standing = tuning.evaluate(patient.profile, limbs, 0)
+        self.assertEqual((standing.distance, standing.seconds, standing.score), (0, 0, 0))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_tune(self):
+        '''
+        the tuner scores the candidates in worker processes and saves the best
+        '''
+        profiles = list(tuning.candidates(increments=(2, 4), pauses=(0.02, 0.15),
+                                          orders=[(0, 1, 2, 3)]))
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "gait.json")
+            scores = tuning.tune(profiles, steps=10, workers=2, output=filename)
+            self.assertEqual(len(scores), len(profiles))
+            self.assertEqual([score.score for score in scores],
+                             sorted((score.score for score in scores), reverse=True))
+            self.assertEqual(gait_module.GaitProfile.load(filename), scores[0].profile)
+
+class TestConfig(unittest.TestCase):
+    """ tests saving and loading the robot's configuration """
+
+    def setUp(self):
+        self.bus = use_simulator()
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "robot.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+        use_hardware()
+
+    def test_round_trip(self):
+        '''
+        channel remaps, inverted feet and the gait profile survive a restart
+        '''
+        robot = SmarsRobot(address=0x41)
+        robot.set_limb_channel('LEFT_LEG_FRONT', 9)
+        robot.invert_feet()
+        robot.gait_profile = robot.gait_profile._replace(increment=4)
+        robot.save_config(self.filename)
+        self.assertFalse(os.path.exists(self.filename + ".compiled"))
+
+        restored = SmarsRobot.from_config(self.filename)
+        self.assertEqual(restored.config, robot.config)
+        self.assertEqual(restored.gait_profile, robot.gait_profile)
+        with open(self.filename, encoding="utf-8") as config_file:
+            settings = json.load(config_file)
+        settings['limbs'][0]['name'] = 'TAIL'
+        with open(self.filename, "w", encoding="utf-8") as config_file:
+            json.dump(settings, config_file)
+        with self.assertRaises(ValueError):
+            SmarsRobot().load_config(self.filename)
+
+    def test_compiled_start(self):
+        '''
+        a compiled config walks without compiling its gaits again, and is
+        ignored once the config changes
+        '''
+        robot = SmarsRobot()
+        robot.set_limb_channel('RIGHT_FOOT_BACK', 11)
+        robot.save_config(self.filename, compiled=True)
+        robot.walkforward(3)
+        expected = [self.bus.board(0x40).pulse(channel) for channel in range(16)]
+
+        gait_module._compile.cache_clear()
+        gait_module._PRELOADED.clear()
+        self.bus = use_simulator()
+        restored = SmarsRobot()
+        self.assertTrue(restored.load_config(self.filename))
+        restored.walkforward(3)
+        self.assertEqual(gait_module._compile.cache_info().misses, 0)
+        self.assertEqual([self.bus.board(0x40).pulse(channel) for channel in range(16)], expected)
+
+        restored.set_limb_channel('RIGHT_FOOT_BACK', 12)
+        restored.save_config(self.filename)
+        self.assertFalse(SmarsRobot().load_config(self.filename))
+
+    def test_compiled_tables_are_used(self):
+        '''
+        loading a compiled config takes the calibrated tick tables from it
+        '''
+        robot = SmarsRobot()
+        robot.calibrate('LEFT_FOOT_BACK', 145, 610, [(30, 230), (150, 530)])
+        robot.save_config(self.filename, compiled=True)
+        pulse_module._TABLES.pop((145, 610, ((30.0, 230), (150.0, 530))))
+        with mock.patch.object(pulse_module, 'curve_to_tick') as curve_to_tick:
+            restored = SmarsRobot.from_config(self.filename)
+        curve_to_tick.assert_not_called()
+        self.assertEqual(restored.config, robot.config)
+
+    def test_limbs_on_other_buses(self):
+        '''
+        each limb is loaded back onto the bus it was saved on
+        '''
+        SmarsRobot().save_config(self.filename)
+        with open(self.filename, encoding="utf-8") as config_file:
+            settings = json.load(config_file)
+        settings['limbs'][7]['busnum'] = 3
+        with open(self.filename, "w", encoding="utf-8") as config_file:
+            json.dump(settings, config_file)
+        robot = SmarsRobot.from_config(self.filename)
+        robot.apply_pose({'RIGHT_LEG_BACK': 90, 'LEFT_LEG_BACK': 90})
+        self.assertEqual(self.bus.board(0x40, busnum=3).pulse(4), 375)
+        self.assertEqual(self.bus.board(0x40).pulse(2), 375)
+        self.assertEqual(self.bus.board(0x40).pulse(4), 0)
+
+class TestCalibration(unittest.TestCase):
+    """ tests per servo pulse calibration """
+
+    def setUp(self):
+        self.bus = use_simulator()
+        self.robot = SmarsRobot()
+
+    def tearDown(self):
+        use_hardware()
+
+    def test_calibrated_pulses(self):
+        '''
+        a calibrated limb follows its own pulse range and curve, and the others don't change
+        '''
+        board = self.bus.board(0x40)
+        self.assertTrue(self.robot.calibrate('LEFT_LEG_BACK', 140, 620, [(90, 390)]))
+        self.robot.apply_pose({'LEFT_LEG_BACK': 90, 'RIGHT_LEG_FRONT': 90})
+        self.assertEqual(board.pulse(2), 390)
+        self.assertEqual(board.pulse(6), 375)
+        self.robot.apply_pose({'LEFT_LEG_BACK': 135})
+        self.assertEqual(board.pulse(2), 505)
+        self.robot.apply_pose({'LEFT_LEG_BACK': 180})
+        self.assertEqual(board.pulse(2), 620)
+        self.assertFalse(self.robot.calibrate('TAIL', 140, 620))
+        with self.assertRaises(ValueError):
+            self.robot.calibrate('LEFT_LEG_BACK', 140, 5000)
+        with self.assertRaises(ValueError):
+            self.robot.calibrate('LEFT_LEG_BACK', 140, 620, [(120, 500), (60, 250)])
+
+    def test_calibration_is_compiled(self):
+        '''
+        walking gaits and saved configs carry each limb's calibration
+        '''
+        self.robot.calibrate('RIGHT_LEG_BACK', 160, 580, [(45, 280), (90, 372)])
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "robot.json")
+            self.robot.save_config(filename, compiled=True)
+            restored = SmarsRobot.from_config(filename)
+        self.assertEqual(restored.config, self.robot.config)
+        limb = Leg('RIGHT_LEG_BACK', 4, 9, 90, True, calibration=(160, 580, [(45, 280), (90, 372)]))
+        gait = gait_module.compile_gait(gait_module.FORWARD, *self.limbs(restored), SLEEP_COUNT)
+        writes = [(pulse, angle) for number, pulse, angle in
+                  zip(gait.limbs, gait.pulses, gait.angles) if number == 7]
+        self.assertTrue(writes)
+        self.assertTrue(all(pulse == limb.pulse(angle) for pulse, angle in writes))
+        restored.walkforward(2)
+        self.assertEqual(self.bus.board(0x40).pulse(4), limb.pulse(restored.pose['RIGHT_LEG_BACK']))
+
+    def test_calibrated_table_is_loaded(self):
+        '''
+        a calibrated limb takes its tick table from a compiled config, rather than building it
+        '''
+        self.robot.calibrate('LEFT_FOOT_FRONT', 155, 590, [(60, 300)])
+        key = (155, 590, ((60.0, 300),))
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "robot.json")
+            self.robot.save_config(filename, compiled=True)
+            built = pulse_module._TABLES.pop(key)
+            with mock.patch.object(config_module, 'preload_tick_table',
+                                   wraps=pulse_module.preload_tick_table) as preload:
+                restored = SmarsRobot.from_config(filename)
+        loaded = [call.args[0] for call in preload.call_args_list if call.args[1:] == key]
+        self.assertEqual(len(loaded), 1)
+        self.assertIsNot(loaded[0], built)
+        self.assertEqual(loaded[0], built)
+        self.assertIs(build_tick_table(*key), loaded[0])
+        restored.apply_pose({'LEFT_FOOT_FRONT': 60})
+        self.assertEqual(self.bus.board(0x40).pulse(1), 300)
+
+    @staticmethod
+    def limbs(robot):
+        '''
+        returns new feet and legs set up like the robot's
+        '''
+        limbs = [Leg(limb['name'], limb['channel'], limb['min_angle'], limb['max_angle'],
+                     limb['invert'], limb['board'],
+                     calibration=(limb['pulse_min'], limb['pulse_max'], limb['curve']))
+                 for limb in robot.config]
+        return limbs[:4], limbs[4:]
+
 class TestConstants(unittest.TestCase):
     """ tests constants.py """
 